@@ -0,0 +1,66 @@
+"""
+Columnar engine benchmark.
+
+Compares users/sec of the per-record path (UserTransformer.transform_batch followed by
+JsonEncoder.encode for each user) with the columnar encoder compiled from USER_FIELD_MAPPING,
+at chunk sizes from 1k to 100k users. Chunks are built by repeating the users of the
+bundled usersapi/fake_users_part_*.json files, and both paths produce the serialized
+records the batch writer consumes.
+
+Usage:
+    python bench/bench_columnar.py --chunk-sizes 1000 10000 100000
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from columnar import get_columnar_encoder
+from encoders import JsonEncoder
+from io_utils import read_json_stream
+from transformer import UserTransformer
+
+def load_users():
+    users = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json"))):
+        users.extend(read_json_stream(path))
+    return users
+
+def record_engine(transformer, chunk):
+    encode = JsonEncoder().encode
+    return [encode(user) for user in transformer.transform_batch(chunk)]
+
+def columnar_engine(transformer, chunk):
+    return get_columnar_encoder(transformer)(chunk)
+
+ENGINES = {
+    "record": record_engine,
+    "columnar": columnar_engine,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    users = load_users()
+    transformer = UserTransformer()
+    print(f"{'chunk size':>10} {'engine':>9} {'users/sec':>12}")
+    for chunk_size in args.chunk_sizes:
+        chunk = (users * (chunk_size // len(users) + 1))[:chunk_size]
+        for name, engine in ENGINES.items():
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                engine(transformer, chunk)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{chunk_size:>10} {name:>9} {chunk_size / best:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
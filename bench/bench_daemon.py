@@ -0,0 +1,110 @@
+"""
+Daemon mode benchmark.
+
+Generates OData users files with generate_users.py and drops them one at a time into the
+input directories of --tenants tenants, renaming each into place the way producers should:
+
+    per-drop        a fresh `python main.py <tenant dir> <output dir> -q` per dropped file,
+                    the way a scheduler runs it today
+    daemon          one daemon.Daemon, each file dropped once the previous one is committed
+    daemon-burst    one daemon.Daemon, every file dropped at once
+
+Reports the median and p95 latency and the users/sec over all files. Latency is measured from
+the drop to the commit, except in daemon-burst, where the files are committed out of drop
+order and the daemon's own stats are used, which start when the watcher queues a file.
+Every mode starts from empty input and output directories.
+
+Usage:
+    python bench/bench_daemon.py --files 40 --users 1000 --tenants 4 --watcher auto
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import generate_dataset
+from daemon import Daemon
+
+def drop(source_dir, fname, tenant_dir):
+    # Copied under a hidden name and renamed, so no watcher sees a partial file
+    temp_path = os.path.join(tenant_dir, f".{fname}.tmp")
+    shutil.copyfile(os.path.join(source_dir, fname), temp_path)
+    os.replace(temp_path, os.path.join(tenant_dir, fname))
+
+def reset(work_dir, tenants):
+    shutil.rmtree(work_dir, ignore_errors=True)
+    input_root = os.path.join(work_dir, "input")
+    for tenant in tenants:
+        os.makedirs(os.path.join(input_root, tenant))
+    return input_root, os.path.join(work_dir, "output")
+
+def run_per_drop(source_dir, files, tenants, work_dir):
+    input_root, output_root = reset(work_dir, tenants)
+    latencies = []
+    for index, fname in enumerate(files):
+        tenant = tenants[index % len(tenants)]
+        start = time.perf_counter()
+        drop(source_dir, fname, os.path.join(input_root, tenant))
+        subprocess.run([sys.executable, "main.py", os.path.join(input_root, tenant), os.path.join(output_root, tenant),
+                        "-q"], cwd=ROOT, check=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies, sum(latencies)
+
+async def run_daemon(source_dir, files, tenants, work_dir, watcher, burst):
+    input_root, output_root = reset(work_dir, tenants)
+    daemon = Daemon(input_root, output_root, watcher=watcher, poll_interval=0.05, executor="thread")
+    task = asyncio.create_task(daemon.run())
+    committed = lambda: daemon.stats.totals["files_committed"]
+    latencies = []
+    start = time.perf_counter()
+    try:
+        for index, fname in enumerate(files):
+            dropped = time.perf_counter()
+            drop(source_dir, fname, os.path.join(input_root, tenants[index % len(tenants)]))
+            while not burst and committed() <= index:
+                await asyncio.sleep(0.001)
+            latencies.append(time.perf_counter() - dropped)
+        while committed() < len(files):
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+    finally:
+        daemon.stop()
+        await task
+    return list(daemon.stats.latencies) if burst else latencies, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--users", type=int, default=1000, help="users per file")
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--watcher", choices=("auto", "inotify", "polling"), default="auto")
+    args = parser.parse_args()
+
+    tenants = [f"tenant-{index}" for index in range(args.tenants)]
+    with tempfile.TemporaryDirectory() as tmp:
+        source_dir = os.path.join(tmp, "source")
+        total = generate_dataset(source_dir, files=args.files, users_per_file=args.users)
+        files = sorted(os.listdir(source_dir))
+        print(f"{total} users in {args.files} files for {args.tenants} tenants")
+        print(f"{'mode':>13} {'p50 ms':>8} {'p95 ms':>8} {'users/sec':>12}")
+        work_dir = os.path.join(tmp, "work")
+        runs = {
+            "per-drop": lambda: run_per_drop(source_dir, files, tenants, work_dir),
+            "daemon": lambda: asyncio.run(run_daemon(source_dir, files, tenants, work_dir, args.watcher, False)),
+            "daemon-burst": lambda: asyncio.run(run_daemon(source_dir, files, tenants, work_dir, args.watcher, True)),
+        }
+        for mode, run in runs.items():
+            latencies, elapsed = run()
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            print(f"{mode:>13} {statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f} {total / elapsed:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
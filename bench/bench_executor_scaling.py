@@ -0,0 +1,73 @@
+"""
+Executor backend scaling benchmark.
+
+Runs process_users over copies of the bundled usersapi/fake_users_part_*.json files
+with the inline and thread backends and with the process backend at 1..N workers,
+reporting users/sec for each configuration.
+
+Usage:
+    python bench/bench_executor_scaling.py --copies 10 --max-workers 8
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from executors import get_executor_backend
+from main import process_users
+
+def prepare_input(input_dir, copies):
+    """
+    Copies the bundled sample files into input_dir copies times and returns the number of users.
+    """
+    sources = sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json")))
+    for copy in range(copies):
+        for source in sources:
+            shutil.copy(source, os.path.join(input_dir, f"{copy:04d}_{os.path.basename(source)}"))
+    return copies * len(sources) * 1250
+
+def run(input_dir, output_dir, backend, chunk_size, max_concurrent_files):
+    shutil.rmtree(output_dir, ignore_errors=True)
+    start = time.perf_counter()
+    # Silence the per-batch progress output so it does not dominate the timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(process_users(input_dir, output_dir, chunk_size=chunk_size,
+                                  max_concurrent_files=max_concurrent_files, executor=backend))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        output_dir = os.path.join(tmp, "output")
+        os.makedirs(input_dir)
+        total = prepare_input(input_dir, args.copies)
+        configs = [("inline", 1), ("thread", None)] + [("process", n) for n in range(1, args.max_workers + 1)]
+        print(f"{total} users in {len(os.listdir(input_dir))} files, chunk size {args.chunk_size}")
+        print(f"{'backend':>8} {'workers':>8} {'users/sec':>12}")
+        for name, workers in configs:
+            backend = get_executor_backend(name, workers)
+            try:
+                # Warm the pool so worker start-up is not part of the measurement
+                run(input_dir, output_dir, backend, args.chunk_size, backend.max_workers + 1)
+                elapsed = run(input_dir, output_dir, backend, args.chunk_size, backend.max_workers + 1)
+            finally:
+                backend.close()
+            print(f"{name:>8} {backend.max_workers:>8} {total / elapsed:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
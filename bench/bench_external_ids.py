@@ -0,0 +1,54 @@
+"""
+External id strategy microbenchmark.
+
+Reports the cost per generated id of every strategy in EXTERNAL_ID_STRATEGIES, and the
+per-user cost of UserTransformer for users with and without an external_id. The previous
+transformer called uuid4 for every user, even those that already had an external_id;
+"eager uuid4" measures that cost.
+
+Usage:
+    python bench/bench_external_ids.py --count 200000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from external_ids import EXTERNAL_ID_STRATEGIES, get_external_id_strategy
+from transformer import UserTransformer
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    users = [{"id": str(uuid.UUID(int=i))} for i in range(args.count)]
+    with_external_id = [dict(user, external_id=user["id"]) for user in users]
+
+    print(f"{'strategy':>12} {'ns/id':>8} {'transform ns/user':>18} {'with external_id':>17}")
+    eager = best_time(lambda: [user.get("external_id", str(uuid.uuid4())) for user in with_external_id], args.repeat)
+    print(f"{'eager uuid4':>12} {'':>8} {'':>18} {eager / args.count * 1e9:>17.0f}")
+    for name in EXTERNAL_ID_STRATEGIES:
+        strategy = get_external_id_strategy(name)
+        per_id = best_time(lambda: [strategy(user) for user in users], args.repeat)
+        transformer = UserTransformer(name)
+        missing = best_time(lambda: transformer.transform_batch(users), args.repeat)
+        present = best_time(lambda: transformer.transform_batch(with_external_id), args.repeat)
+        print(f"{name:>12} {per_id / args.count * 1e9:>8.0f} {missing / args.count * 1e9:>18.0f} {present / args.count * 1e9:>17.0f}")
+
+if __name__ == "__main__":
+    main()
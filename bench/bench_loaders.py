@@ -0,0 +1,87 @@
+"""
+Database loading benchmark.
+
+Generates OData users files with generate_users.py and times getting every transformed user
+into an SQLite table (see loaders.SqliteLoader) three ways:
+
+    file-then-load  process_users writes batch files, then a separate job reads every batch
+                    file back, parses it and upserts its users in one transaction per file
+    files+load      process_users writes batch files and loads the users in the same run
+    load-only       process_users loads the users without writing batch files
+
+Every mode starts from an empty output directory and database.
+
+Usage:
+    python bench/bench_loaders.py --files 4 --users 50000 --batch-sizes 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import generate_dataset
+from loaders import SqliteLoader, USER_COLUMNS, SQLITE_FILE, upsert_statement, user_rows
+from main import process_users
+
+def load_batch_files(output_dir, db_path):
+    # The separate loading job that batch files exist for
+    loader = SqliteLoader(db_path)
+    connection = loader._connect()
+    try:
+        for fname in sorted(os.listdir(output_dir)):
+            if fname.startswith("users_"):
+                with open(os.path.join(output_dir, fname), "r", encoding="utf-8") as f:
+                    connection.executemany(upsert_statement(loader.table), user_rows(json.load(f)))
+                connection.commit()
+    finally:
+        connection.close()
+
+def run(input_dir, output_dir, mode, chunk_size, batch_size, max_concurrent_loads):
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    db_path = os.path.join(output_dir, SQLITE_FILE)
+    loader = None
+    if mode != "file-then-load":
+        loader = SqliteLoader(db_path, batch_size=batch_size, max_concurrent_loads=max_concurrent_loads)
+    start = time.perf_counter()
+    asyncio.run(process_users(input_dir, output_dir, chunk_size=chunk_size, loader=loader,
+                              write_files=mode != "load-only", incremental=False))
+    if mode == "file-then-load":
+        load_batch_files(output_dir, db_path)
+    elapsed = time.perf_counter() - start
+    with sqlite3.connect(db_path) as connection:
+        rows = connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    return elapsed, rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--users", type=int, default=50000, help="users per file")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--max-concurrent-loads", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        output_dir = os.path.join(tmp, "output")
+        total = generate_dataset(input_dir, files=args.files, users_per_file=args.users)
+        print(f"{total} users in {args.files} files, {len(USER_COLUMNS)} columns")
+        print(f"{'mode':>15} {'batch':>7} {'users/sec':>12} {'seconds':>8}")
+        elapsed, rows = run(input_dir, output_dir, "file-then-load", args.chunk_size, args.chunk_size, 0)
+        print(f"{'file-then-load':>15} {args.chunk_size:>7} {rows / elapsed:>12,.0f} {elapsed:>8.2f}")
+        for batch_size in args.batch_sizes:
+            for mode in ("files+load", "load-only"):
+                elapsed, rows = run(input_dir, output_dir, mode, args.chunk_size, batch_size, args.max_concurrent_loads)
+                print(f"{mode:>15} {batch_size:>7} {rows / elapsed:>12,.0f} {elapsed:>8.2f}")
+
+if __name__ == "__main__":
+    main()
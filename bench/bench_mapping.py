@@ -0,0 +1,62 @@
+"""
+Compiled field mapping benchmark.
+
+Compares users/sec of the hand-written UserTransformer with MappedUserTransformer,
+which is compiled from USER_FIELD_MAPPING, on the bundled usersapi/fake_users_part_*.json
+files. Runs once with the sample users as they are (no external_id) and once with an
+external_id on every user.
+
+Usage:
+    python bench/bench_mapping.py --repeat 20
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from io_utils import read_json_stream
+from transformer import UserTransformer, MappedUserTransformer
+
+TRANSFORMERS = {
+    "hand-written": UserTransformer,
+    "compiled": MappedUserTransformer,
+}
+
+def load_users():
+    users = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json"))):
+        users.extend(read_json_stream(path))
+    return users
+
+def best_time(transformer, users, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transformer.transform_batch(users)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    users = load_users()
+    inputs = {
+        "no external_id": users,
+        "with external_id": [dict(user, external_id=f"ext-{i}") for i, user in enumerate(users)],
+    }
+    print(f"{len(users)} users")
+    print(f"{'input':>18} {'transformer':>13} {'users/sec':>12}")
+    for input_name, batch in inputs.items():
+        for name, transformer_class in TRANSFORMERS.items():
+            elapsed = best_time(transformer_class(), batch, args.repeat)
+            print(f"{input_name:>18} {name:>13} {len(batch) / elapsed:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Parser backend benchmark.
+
+Reads the bundled usersapi/fake_users_part_*.json files --repeat times with
+aread_json_stream for every installed parser (ijson yajl2_c, ijson python and bulk) and
+reports users/sec and MB/s for each, plus which parser auto-selection picks per file.
+
+Usage:
+    python bench/bench_parsers.py --repeat 5
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from io_utils import aread_json_stream
+from parsers import BulkParser, IjsonParser, PARSERS, get_parser
+
+def installed_parsers():
+    return [name for name in PARSERS if (BulkParser.supports() if name == "bulk" else IjsonParser.supports(name))]
+
+async def read_all(paths, parser):
+    count = 0
+    for path in paths:
+        async for _ in aread_json_stream(path, parser=parser):
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=os.path.join(ROOT, "usersapi"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.input, "*.json")))
+    size_mb = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+    auto = sorted({get_parser(None, os.path.getsize(path)).name for path in paths})
+    print(f"{len(paths)} files, {size_mb:.1f} MB, auto-selection picks: {', '.join(auto)}")
+    print(f"{'parser':>8} {'users/sec':>12} {'MB/s':>8}")
+    for name in installed_parsers():
+        # One untimed pass so file caches are warm for every parser
+        asyncio.run(read_all(paths, name))
+        start = time.perf_counter()
+        users = sum(asyncio.run(read_all(paths, name)) for _ in range(args.repeat))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8} {users / elapsed:>12,.0f} {size_mb * args.repeat / elapsed:>8,.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Projection pushdown benchmark.
+
+Writes a wide Graph $select export: users from generate_users.py padded with --extra-fields
+more string, list and object fields that UserTransformer does not read. Then times reading it
+with every installed ijson backend, once building whole users and once with UserTransformer's
+input fields, where parsers that benefit from it only build the declared fields. Narrow
+exports (--extra-fields 0) show where yajl2_c is better off without a projection.
+
+Usage:
+    python bench/bench_projection.py --users 50000 --extra-fields 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import UserGenerator
+from io_utils import ODataStream
+from parsers import IjsonParser
+from transformer import UserTransformer
+
+def extra_field_name(field):
+    return ("extensionAttribute", "proxyAddresses", "onPremisesExtension")[field % 3] + str(field)
+
+def write_wide_file(path, users, extra_fields, seed=0):
+    generator = UserGenerator(seed)
+    selected = list(generator.user(0)) + [extra_field_name(field) for field in range(extra_fields)]
+    context = f"https://graph.microsoft.com/beta/$metadata#users({','.join(selected)})"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"@odata.context": context})[:-1] + ', "value": [')
+        for index in range(users):
+            user = generator.user(index)
+            for field in range(extra_fields):
+                kind = field % 3
+                if kind == 0:
+                    value = f"value {index} {field}"
+                elif kind == 1:
+                    value = [f"smtp:u{index}.{n}@example.com" for n in range(3)]
+                else:
+                    value = {"name": f"n{field}", "enabled": True, "tags": ["a", "b"]}
+                user[extra_field_name(field)] = value
+            if index:
+                f.write(",")
+            f.write(json.dumps(user, ensure_ascii=False))
+        f.write("]}")
+
+async def read_all(path, parser, fields):
+    count = 0
+    async with ODataStream(path, parser=parser) as stream:
+        await stream.read_context()
+        projected = stream.parser.projects(fields, stream.context)
+        users = stream.users(fields=fields)
+        try:
+            async for _ in users:
+                count += 1
+        finally:
+            await users.aclose()
+    return count, projected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--extra-fields", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "wide_users.json")
+        write_wide_file(path, args.users, args.extra_fields)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{args.users} users with {args.extra_fields} extra fields, {size_mb:.0f} MB")
+        print(f"{'parser':>8} {'fields':>9} {'users/sec':>12} {'MB/s':>8}")
+        for name in ("yajl2_c", "python"):
+            if not IjsonParser.supports(name):
+                continue
+            for label, fields in (("all", None), ("declared", UserTransformer.input_fields)):
+                start = time.perf_counter()
+                users, projected = asyncio.run(read_all(path, name, fields))
+                elapsed = time.perf_counter() - start
+                note = " (not projected)" if fields is not None and not projected else ""
+                print(f"{name:>8} {label:>9} {users / elapsed:>12,.0f} {size_mb / elapsed:>8,.1f}{note}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Typed record model memory benchmark.
+
+Generates one OData users file with generate_users.py and, each in a fresh interpreter,
+decodes it and transforms every user while tracemalloc traces allocations:
+
+    dict    orjson (or json) decode into dicts, UserTransformer.transform_batch into dicts
+    typed   msgspec decode into GraphUser records, which keep only the fields UserTransformer
+            reads, and transform into TransformedUser records
+
+Reports the memory held by the decoded and the transformed users, the tracemalloc peak,
+the peak RSS and the time taken, so the allocation and RSS reduction can be compared.
+
+Usage:
+    python bench/bench_records.py --users 200000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import generate_dataset
+
+MODES = ("dict", "typed")
+
+CONSUMER = """
+import gc, json, resource, sys, time, tracemalloc
+sys.path.insert(0, {root!r})
+from transformer import UserTransformer
+from records import USER_RECORD_MODEL
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+with open({path!r}, "rb") as f:
+    data = f.read()
+transformer = UserTransformer()
+gc.collect()
+tracemalloc.start()
+start = time.perf_counter()
+if {mode!r} == "typed":
+    users = USER_RECORD_MODEL.decoder()(data)
+    decoded = tracemalloc.get_traced_memory()[0]
+    transformed = USER_RECORD_MODEL.transform(users, transformer.external_ids)
+else:
+    users = loads(data)["value"]
+    decoded = tracemalloc.get_traced_memory()[0]
+    transformed = transformer.transform_batch(users)
+elapsed = time.perf_counter() - start
+held, peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+print(json.dumps({{"users": len(transformed), "decoded": decoded, "held": held, "peak": peak, "seconds": elapsed,
+                  "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+def measure(path, mode):
+    code = CONSUMER.format(root=ROOT, path=path, mode=mode)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_dataset(tmp, files=1, users_per_file=args.users)
+        path = os.path.join(tmp, os.listdir(tmp)[0])
+        print(f"{args.users} users, {os.path.getsize(path) / (1024 * 1024):.0f} MB input")
+        print(f"{'mode':>6} {'decoded MB':>11} {'held MB':>9} {'peak MB':>9} {'RSS MB':>8} {'users/sec':>12}")
+        for mode in MODES:
+            stats = measure(path, mode)
+            mb = 1024 * 1024
+            print(f"{mode:>6} {stats['decoded'] / mb:>11.1f} {stats['held'] / mb:>9.1f} {stats['peak'] / mb:>9.1f} "
+                  f"{stats['max_rss_kib'] / 1024:>8.1f} {stats['users'] / stats['seconds']:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Incremental re-run benchmark.
+
+Copies the bundled usersapi/fake_users_part_*.json files --copies times into a temporary
+input directory and times process_users for:
+    - a full run into an empty output directory
+    - a re-run with no input changed
+    - a re-run with 1 of the N input files changed
+    - a re-run with 1 file changed and incremental=False (the previous behaviour)
+
+Usage:
+    python bench/bench_rerun.py --copies 10
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import process_users
+
+def prepare_input(input_dir, copies):
+    sources = sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json")))
+    for copy in range(copies):
+        for source in sources:
+            shutil.copy(source, os.path.join(input_dir, f"{copy:04d}_{os.path.basename(source)}"))
+    return sorted(glob.glob(os.path.join(input_dir, "*.json")))
+
+def change_file(path):
+    # Drop the last user so the file's size and content change
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["value"].pop()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def run(input_dir, output_dir, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(process_users(input_dir, output_dir, **kwargs))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        output_dir = os.path.join(tmp, "output")
+        os.makedirs(input_dir)
+        files = prepare_input(input_dir, args.copies)
+        print(f"{len(files)} input files, chunk size {args.chunk_size}")
+
+        full = run(input_dir, output_dir, chunk_size=args.chunk_size)
+        print(f"{'full run':>32}: {full:7.2f}s")
+        unchanged = run(input_dir, output_dir, chunk_size=args.chunk_size)
+        print(f"{'re-run, nothing changed':>32}: {unchanged:7.2f}s ({full / unchanged:.0f}x faster)")
+        change_file(files[len(files) // 2])
+        one_changed = run(input_dir, output_dir, chunk_size=args.chunk_size)
+        print(f"{f're-run, 1 of {len(files)} changed':>32}: {one_changed:7.2f}s ({full / one_changed:.1f}x faster)")
+        change_file(files[len(files) // 2])
+        everything = run(input_dir, output_dir, chunk_size=args.chunk_size, incremental=False)
+        print(f"{'re-run, incremental=False':>32}: {everything:7.2f}s")
+
+if __name__ == "__main__":
+    main()
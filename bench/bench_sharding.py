@@ -0,0 +1,71 @@
+"""
+Single-file sharding benchmark.
+
+Generates one large OData users file with generate_users.py and times process_users on it
+parsed serially by one ijson parser against split into byte ranges that are parsed,
+transformed and written by 1..N process workers. The pre-scan that finds the user
+boundaries is timed on its own as well.
+
+Usage:
+    python bench/bench_sharding.py --size-mb 512 --max-workers 8
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import generate_dataset
+from executors import get_executor_backend
+from main import process_users
+from sharding import split_value_array
+
+def run(input_dir, output_dir, backend, chunk_size, shards):
+    shutil.rmtree(output_dir, ignore_errors=True)
+    start = time.perf_counter()
+    asyncio.run(process_users(input_dir, output_dir, chunk_size=chunk_size, executor=backend, shards=shards,
+                              shard_min_size=0, incremental=False))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=256)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--indent", type=int, default=None, help="pretty-print like the Graph export samples")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        output_dir = os.path.join(tmp, "output")
+        total = generate_dataset(input_dir, files=1, size_bytes_per_file=int(args.size_mb * 1024 * 1024),
+                                 indent=args.indent)
+        path = os.path.join(input_dir, os.listdir(input_dir)[0])
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{total} users in one file of {size_mb:.0f} MB, chunk size {args.chunk_size}")
+
+        start = time.perf_counter()
+        split_value_array(path, args.max_workers)
+        scan_time = time.perf_counter() - start
+        print(f"pre-scan into {args.max_workers} shards: {scan_time:.2f}s ({size_mb / scan_time:,.0f} MB/s)")
+
+        print(f"{'mode':>8} {'workers':>8} {'users/sec':>12} {'MB/s':>8}")
+        configs = [("serial", "thread", None)] + [("sharded", "process", n) for n in range(1, args.max_workers + 1)]
+        for mode, name, workers in configs:
+            backend = get_executor_backend(name, workers)
+            shards = backend.max_workers if mode == "sharded" else 1
+            try:
+                # Warm the pool so worker start-up is not part of the measurement
+                run(input_dir, output_dir, backend, args.chunk_size, shards)
+                elapsed = run(input_dir, output_dir, backend, args.chunk_size, shards)
+            finally:
+                backend.close()
+            print(f"{mode:>8} {backend.max_workers:>8} {total / elapsed:>12,.0f} {size_mb / elapsed:>8,.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Output sink benchmark.
+
+Writes the transformed users of the bundled usersapi/fake_users_part_*.json files
+(repeated --copies times) through write_batches with every available sink and reports
+the bytes written and the wall time per batch size.
+
+Usage:
+    python bench/bench_sinks.py --copies 10 --batch-sizes 100 10000 50000
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from io_utils import read_json_stream, write_batches
+from sinks import SINKS, get_sink
+from transformer import UserTransformer
+
+def available_sinks():
+    sinks = []
+    for name in SINKS:
+        try:
+            sinks.append(get_sink(name))
+        except ValueError as e:
+            print(f"Skipping {name}: {e}")
+    return sinks
+
+async def write_all(output_dir, users, batch_size, sink):
+    async def user_gen():
+        for user in users:
+            yield user
+    with contextlib.redirect_stdout(io.StringIO()):
+        await write_batches(output_dir, user_gen(), batch_size, sink=sink)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 10000, 50000])
+    args = parser.parse_args()
+
+    users = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json"))):
+        users.extend(read_json_stream(path))
+    users = UserTransformer().transform_batch(users) * args.copies
+    sinks = available_sinks()
+
+    print(f"{len(users)} users")
+    print(f"{'sink':>12} {'batch size':>10} {'files':>6} {'MB':>8} {'seconds':>8} {'users/sec':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, "output")
+        for batch_size in args.batch_sizes:
+            for sink in sinks:
+                shutil.rmtree(output_dir, ignore_errors=True)
+                os.makedirs(output_dir)
+                start = time.perf_counter()
+                asyncio.run(write_all(output_dir, users, batch_size, sink))
+                elapsed = time.perf_counter() - start
+                files = os.listdir(output_dir)
+                size_mb = sum(os.path.getsize(os.path.join(output_dir, name)) for name in files) / 1e6
+                print(f"{sink.name:>12} {batch_size:>10} {len(files):>6} {size_mb:>8.2f} {elapsed:>8.2f} {len(users) / elapsed:>11,.0f}")
+
+if __name__ == "__main__":
+    main()
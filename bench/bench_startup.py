@@ -0,0 +1,106 @@
+"""
+Command line startup benchmark.
+
+Times fresh interpreters the way a scheduler invokes main.py for small per-tenant drops:
+
+    python        an empty interpreter, the floor of every invocation
+    import        python -c "import main"
+    help          python main.py --help
+    tiny-run      python main.py <dir> <out> -q on a file of --users users
+
+Reports the median wall time of --repeat runs of each, then runs the import and the tiny
+run once more under -X importtime and lists the modules with the highest cumulative import
+time, so imports that should be lazy stand out. --root benchmarks another checkout, e.g. an
+older version, for comparison (its main.py must accept the same arguments for tiny-run).
+
+Usage:
+    python bench/bench_startup.py --repeat 20 --top 15 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_tiny_input(input_dir, users):
+    os.makedirs(input_dir)
+    with open(os.path.join(input_dir, "users.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "@odata.context": "https://graph.microsoft.com/beta/$metadata#users",
+            "value": [{"id": str(index), "givenName": "Jane", "surname": "Doe"} for index in range(users)],
+        }, f)
+
+def scenarios(input_dir, output_dir):
+    return {
+        "python": ["-c", "pass"],
+        "import": ["-c", "import main"],
+        "help": ["main.py", "--help"],
+        "tiny-run": ["main.py", input_dir, output_dir, "-q", "--full"],
+    }
+
+def wall_time(root, args, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=root, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed: {result.stderr.strip()}")
+    return elapsed, result.stderr
+
+def parse_importtime(stderr):
+    """
+    Returns {module: (self microseconds, cumulative microseconds)} from -X importtime output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--root", default=ROOT, help="checkout to benchmark (default: this one)")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {"times_ms": {}, "imports": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        write_tiny_input(input_dir, args.users)
+        runs = scenarios(input_dir, os.path.join(tmp, "output"))
+        print(f"{'scenario':>10} {'median ms':>10} {'min ms':>8}")
+        for name, command in runs.items():
+            # One warm-up run fills the bytecode and OS file caches
+            wall_time(args.root, command)
+            times = [wall_time(args.root, command)[0] * 1000 for _ in range(args.repeat)]
+            results["times_ms"][name] = {"median": statistics.median(times), "min": min(times)}
+            print(f"{name:>10} {statistics.median(times):>10.1f} {min(times):>8.1f}")
+
+        for name in ("import", "tiny-run"):
+            modules = parse_importtime(wall_time(args.root, runs[name], importtime=True)[1])
+            top = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+            results["imports"][name] = {
+                "modules": len(modules), "total_us": sum(own for own, _ in modules.values()),
+                "top": [{"module": module, "self_us": own, "cumulative_us": cumulative} for module, (own, cumulative) in top],
+            }
+            print(f"\n{name}: {len(modules)} modules imported in {results['imports'][name]['total_us'] / 1000:.1f} ms")
+            print(f"{'module':>40} {'self ms':>8} {'cumul. ms':>10}")
+            for module, (own, cumulative) in top:
+                print(f"{module:>40} {own / 1000:>8.1f} {cumulative / 1000:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
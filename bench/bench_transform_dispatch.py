@@ -0,0 +1,73 @@
+"""
+Transform dispatch benchmark.
+
+Compares users/sec for three ways of running UserTransformer over the bundled
+usersapi/fake_users_part_*.json files, with parsing excluded from the timings:
+
+- per-user: one run_in_executor call per user, gathered per chunk
+- per-chunk: one run_in_executor call per chunk using transform_batch
+- inline: transform_batch called directly on the event loop
+
+Usage:
+    python bench/bench_transform_dispatch.py --chunk-size 100 --repeat 5
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from io_utils import read_json_stream
+from transformer import UserTransformer
+
+async def per_user(transformer, chunks):
+    loop = asyncio.get_running_loop()
+    for chunk in chunks:
+        await asyncio.gather(*(loop.run_in_executor(None, transformer.transform, user) for user in chunk))
+
+async def per_chunk(transformer, chunks):
+    loop = asyncio.get_running_loop()
+    for chunk in chunks:
+        await loop.run_in_executor(None, transformer.transform_batch, chunk)
+
+async def inline(transformer, chunks):
+    for chunk in chunks:
+        transformer.transform_batch(chunk)
+
+SCENARIOS = {
+    "per-user": per_user,
+    "per-chunk": per_chunk,
+    "inline": inline,
+}
+
+def load_chunks(chunk_size):
+    users = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json"))):
+        users.extend(read_json_stream(path))
+    return [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)], len(users)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks, total = load_chunks(args.chunk_size)
+    transformer = UserTransformer()
+    print(f"{total} users, chunk size {args.chunk_size}")
+    print(f"{'scenario':>10} {'users/sec':>12}")
+    for name, scenario in SCENARIOS.items():
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            asyncio.run(scenario(transformer, chunks))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>10} {total / best:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
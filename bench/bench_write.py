@@ -0,0 +1,87 @@
+"""
+Batch writer throughput benchmark.
+
+Writes the transformed users of the bundled usersapi/fake_users_part_*.json files
+(repeated --copies times) with write_batches and reports MB/s and batches/s for every
+installed encoder, compact and with indent=2. The "legacy" row reproduces the previous
+writer, which awaited one aiofiles write per separator and per user and always
+pretty-printed with json.dumps(indent=2).
+
+Usage:
+    python bench/bench_write.py --copies 4 --batch-size 100
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import aiofiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from encoders import ENCODERS
+from io_utils import batch_file_path, read_json_stream, write_batches
+from transformer import UserTransformer
+
+async def legacy_write_batches(output_dir, users, batch_size):
+    for file_idx, start in enumerate(range(0, len(users), batch_size)):
+        async with aiofiles.open(batch_file_path(output_dir, file_idx), "w", encoding="utf-8") as f:
+            await f.write("[\n")
+            for i, user in enumerate(users[start:start + batch_size]):
+                if i:
+                    await f.write(",\n")
+                await f.write(json.dumps(user, ensure_ascii=False, indent=2))
+            await f.write("\n]")
+
+async def encoder_write_batches(output_dir, users, batch_size, encoder):
+    async def user_gen():
+        for user in users:
+            yield user
+    with contextlib.redirect_stdout(io.StringIO()):
+        await write_batches(output_dir, user_gen(), batch_size, encoder)
+
+def output_size(output_dir):
+    return sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    users = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "usersapi", "fake_users_part_*.json"))):
+        users.extend(read_json_stream(path))
+    users = UserTransformer().transform_batch(users) * args.copies
+    batches = -(-len(users) // args.batch_size)
+
+    scenarios = [("legacy", "2", lambda out: legacy_write_batches(out, users, args.batch_size))]
+    for indent in (None, 2):
+        for encoder_class in ENCODERS.values():
+            if encoder_class.supports(indent):
+                encoder = encoder_class(indent)
+                scenarios.append((encoder.name, str(indent), lambda out, encoder=encoder: encoder_write_batches(out, users, args.batch_size, encoder)))
+
+    print(f"{len(users)} users in {batches} batches of {args.batch_size}")
+    print(f"{'writer':>8} {'indent':>6} {'MB':>8} {'MB/s':>8} {'batches/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, "output")
+        for name, indent, scenario in scenarios:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            asyncio.run(scenario(output_dir))
+            elapsed = time.perf_counter() - start
+            size_mb = output_size(output_dir) / 1e6
+            print(f"{name:>8} {indent:>6} {size_mb:>8.1f} {size_mb / elapsed:>8.1f} {batches / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Synthetic Graph users generator.
+
+Writes OData users files shaped like the bundled usersapi samples. Users are generated
+from a seeded random number generator and streamed to disk one at a time, so large inputs
+cost no more memory than small ones and the same arguments always produce the same bytes.
+
+Usage:
+    python bench/generate_users.py out_dir --files 4 --users 100000
+    python bench/generate_users.py out_dir --files 10 --size-mb 1024 --null-ratio 0.2 --sign-in-ratio 0.8
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+
+ODATA_CONTEXT = (
+    "https://graph.microsoft.com/beta/$metadata#users(id,userPrincipalName,usageLocation,mail,accountEnabled,"
+    "mobilePhone,userType,lastModifiedDateTime,givenName,surname,signInActivity,otherMails)"
+)
+GIVEN_NAMES = ["Brian", "Pamela", "Jane", "John", "Ana", "Wei", "Fatima", "Lars", "Chloé", "Sipho"]
+SURNAMES = ["Reid", "Collins", "Doe", "Smith", "García", "Chen", "Khan", "Berg", "Martin", "Dlamini"]
+LOCATIONS = ["US", "GB", "DE", "FR", "IN", "BR", "JP", "ZA", "SA", "BS"]
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class UserGenerator:
+    """
+    Produces Graph user records from a seeded random number generator.
+    null_ratio is the probability that each optional field is null, sign_in_ratio the
+    probability that a user has signInActivity and external_id_ratio the probability that a
+    user already carries an external_id.
+    """
+    def __init__(self, seed=0, null_ratio=0.1, sign_in_ratio=0.5, external_id_ratio=0.0):
+        self.random = random.Random(seed)
+        self.null_ratio = null_ratio
+        self.sign_in_ratio = sign_in_ratio
+        self.external_id_ratio = external_id_ratio
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _timestamp(self):
+        return (f"{self.random.randint(2015, 2025)}-{self.random.randint(1, 12):02d}-{self.random.randint(1, 28):02d}"
+                f"T{self.random.randint(0, 23):02d}:{self.random.randint(0, 59):02d}:{self.random.randint(0, 59):02d}")
+
+    def _optional(self, value):
+        return None if self.random.random() < self.null_ratio else value
+
+    def _sign_in_activity(self):
+        if self.random.random() >= self.sign_in_ratio:
+            return None
+        activity = {}
+        for prefix in ("lastSignIn", "lastNonInteractiveSignIn", "lastSuccessfulSignIn"):
+            activity[f"{prefix}DateTime"] = self._optional(self._timestamp())
+            activity[f"{prefix}RequestId"] = self._optional(self._uuid())
+        return activity
+
+    def user(self, index):
+        given_name = self.random.choice(GIVEN_NAMES)
+        surname = self.random.choice(SURNAMES)
+        login = f"{given_name.lower()}.{surname.lower()}{index}"
+        user = {
+            "userPrincipalName": f"{login}@example.onmicrosoft.com",
+            "usageLocation": self._optional(self.random.choice(LOCATIONS)),
+            "mail": self._optional(f"{login}@example.com"),
+            "accountEnabled": self.random.random() < 0.9,
+            "mobilePhone": self._optional(f"{self.random.randint(200, 999)}-{self.random.randint(200, 999)}-{self.random.randint(0, 9999):04d}"),
+            "userType": self.random.choice(("Member", "Member", "Member", "Guest")),
+            "givenName": self._optional(given_name),
+            "surname": self._optional(surname),
+            "otherMails": [f"{login}@hotmail.com"] if self.random.random() < 0.3 else [],
+            "id": self._uuid(),
+            "signInActivity": self._sign_in_activity(),
+        }
+        if self.random.random() < self.external_id_ratio:
+            user["external_id"] = self._uuid()
+        return user
+
+def generate_users_file(path, generator, count=None, size_bytes=None, indent=None, start_index=0):
+    """
+    Streams an OData users file to path with count users, or with users until the file is
+    about size_bytes long. Returns the number of users written.
+    """
+    if (count is None) == (size_bytes is None):
+        raise ValueError("Pass exactly one of count and size_bytes")
+    pad = "" if indent is None else "\n" + " " * indent * 2
+    separator = "," + pad
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+        if indent is None:
+            header = '{"@odata.context":' + json.dumps(ODATA_CONTEXT) + ',"value":['
+        else:
+            header = "{\n" + " " * indent + '"@odata.context": ' + json.dumps(ODATA_CONTEXT) + ",\n" + " " * indent + '"value": ['
+        f.write(header + pad)
+        written = len(header)
+        users = 0
+        while (count is not None and users < count) or (size_bytes is not None and written < size_bytes):
+            text = json.dumps(generator.user(start_index + users), ensure_ascii=False, indent=indent)
+            if indent is not None:
+                text = text.replace("\n", pad)
+            if users:
+                f.write(separator)
+            f.write(text)
+            written += len(text) + len(separator)
+            users += 1
+        f.write(("" if indent is None else "\n" + " " * indent) + "]" + ("}" if indent is None else "\n}\n"))
+    return users
+
+def generate_dataset(output_dir, files=4, users_per_file=None, size_bytes_per_file=None, seed=0, null_ratio=0.1,
+                     sign_in_ratio=0.5, external_id_ratio=0.0, indent=None):
+    """
+    Writes files OData users files named users_part_NNNN.json to output_dir and returns
+    the total number of users written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    generator = UserGenerator(seed, null_ratio, sign_in_ratio, external_id_ratio)
+    total = 0
+    for file_idx in range(files):
+        path = os.path.join(output_dir, f"users_part_{file_idx:04d}.json")
+        total += generate_users_file(path, generator, users_per_file, size_bytes_per_file, indent, total)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir")
+    parser.add_argument("--files", type=int, default=4)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--users", type=int, help="users per file (default: 10000)")
+    size.add_argument("--size-mb", type=float, help="approximate size of each file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--null-ratio", type=float, default=0.1)
+    parser.add_argument("--sign-in-ratio", type=float, default=0.5)
+    parser.add_argument("--external-id-ratio", type=float, default=0.0)
+    parser.add_argument("--indent", type=int, default=None, help="pretty-print like the Graph export samples")
+    args = parser.parse_args()
+
+    users = None if args.size_mb is not None else args.users or 10000
+    size_bytes = int(args.size_mb * 1024 * 1024) if args.size_mb is not None else None
+    total = generate_dataset(args.output_dir, args.files, users, size_bytes, args.seed, args.null_ratio,
+                             args.sign_in_ratio, args.external_id_ratio, args.indent)
+    print(f"Wrote {total} users in {args.files} files to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
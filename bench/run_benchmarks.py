@@ -0,0 +1,179 @@
+"""
+Benchmark suite.
+
+Generates a seeded synthetic dataset with generate_users.py (or uses --input) and times
+each stage of the pipeline on its own:
+
+    read        aread_json_stream over every input file
+    transform   UserTransformer.transform on every user, users loaded up front
+    write       write_batches of the transformed users, users transformed up front
+    pipeline    process_users over the input directory
+
+Every scenario runs in a fresh interpreter so its peak RSS is measured on its own. Results
+are reported as JSON with users/sec, MB/s (input bytes, or bytes written for write) and
+peak RSS, so runs of different versions can be compared.
+
+Usage:
+    python bench/run_benchmarks.py --files 4 --users 50000 --output results.json
+    python bench/run_benchmarks.py --input usersapi --scenarios read pipeline
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_users import generate_dataset
+
+SCENARIOS = ("read", "transform", "write", "pipeline")
+
+def input_files(input_dir):
+    return sorted(glob.glob(os.path.join(input_dir, "*.json")))
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def load_users(input_dir):
+    from io_utils import read_json_stream
+    users = []
+    for path in input_files(input_dir):
+        users.extend(read_json_stream(path))
+    return users
+
+def scenario_read(input_dir, work_dir):
+    from io_utils import aread_json_stream
+
+    async def read_all():
+        count = 0
+        for path in input_files(input_dir):
+            async for _ in aread_json_stream(path):
+                count += 1
+        return count
+
+    start = time.perf_counter()
+    users = asyncio.run(read_all())
+    return users, time.perf_counter() - start, directory_bytes(input_dir)
+
+def scenario_transform(input_dir, work_dir):
+    from transformer import UserTransformer
+    users = load_users(input_dir)
+    transform = UserTransformer().transform
+    start = time.perf_counter()
+    for user in users:
+        transform(user)
+    return len(users), time.perf_counter() - start, directory_bytes(input_dir)
+
+def scenario_write(input_dir, work_dir):
+    from io_utils import write_batches
+    from transformer import UserTransformer
+    users = UserTransformer().transform_batch(load_users(input_dir))
+
+    async def user_gen():
+        for user in users:
+            yield user
+
+    output_dir = os.path.join(work_dir, "write_output")
+    os.makedirs(output_dir)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(write_batches(output_dir, user_gen()))
+    return len(users), time.perf_counter() - start, directory_bytes(output_dir)
+
+def scenario_pipeline(input_dir, work_dir):
+    from main import process_users
+    output_dir = os.path.join(work_dir, "pipeline_output")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(process_users(input_dir, output_dir, incremental=False))
+    elapsed = time.perf_counter() - start
+    with open(os.path.join(output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        users = sum(entry["users"] for entry in json.load(f)["files"].values())
+    return users, elapsed, directory_bytes(input_dir)
+
+def run_scenario(name, input_dir):
+    """
+    Runs one scenario in this process and returns its result record.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        users, seconds, size = globals()[f"scenario_{name}"](input_dir, work_dir)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mib = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    return {
+        "scenario": name,
+        "users": users,
+        "seconds": round(seconds, 4),
+        "users_per_sec": round(users / seconds, 1),
+        "mb": round(size / 1e6, 3),
+        "mb_per_sec": round(size / 1e6 / seconds, 3),
+        "peak_rss_mib": round(peak_rss_mib, 1),
+    }
+
+def run_isolated(name, input_dir):
+    # A fresh interpreter per scenario keeps the peak RSS of one from leaking into the next
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-scenario", name, "--input", input_dir],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="directory of OData users files to use instead of a generated dataset")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--users", type=int, default=25000, help="users per generated file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--null-ratio", type=float, default=0.1)
+    parser.add_argument("--sign-in-ratio", type=float, default=0.5)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario, args.input)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = {"input": args.input}
+        input_dir = args.input
+        if input_dir is None:
+            input_dir = os.path.join(tmp, "input")
+            users = generate_dataset(input_dir, args.files, args.users, seed=args.seed, null_ratio=args.null_ratio,
+                                     sign_in_ratio=args.sign_in_ratio)
+            dataset = {"files": args.files, "users": users, "seed": args.seed, "null_ratio": args.null_ratio,
+                       "sign_in_ratio": args.sign_in_ratio}
+        dataset["mb"] = round(directory_bytes(input_dir) / 1e6, 3)
+        results = []
+        for name in args.scenarios:
+            results.append(run_isolated(name, input_dir))
+            print(f"{name:>10}: {results[-1]['users_per_sec']:>12,.0f} users/sec {results[-1]['mb_per_sec']:>8.2f} MB/s "
+                  f"{results[-1]['peak_rss_mib']:>8.1f} MiB peak RSS", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dataset,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+from itertools import repeat
+from json.encoder import encode_basestring
+from field_mapping import Field, Nested, _MISSING
+
+def _encode_value(value, pad, indent):
+    # Serializes a single value the way the encoders module does when the value sits at the
+    # indentation given by pad
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    separators = (",", ":") if indent is None else (",", ": ")
+    text = json.dumps(value, ensure_ascii=False, indent=indent, separators=separators)
+    if "\n" in text:
+        return text.replace("\n", "\n" + pad)
+    return text
+
+def encode_column(values, depth, indent=None):
+    """
+    Serializes a column of values for members at the given nesting depth.
+    """
+    pad = " " * (indent or 0) * depth
+    return [encode_basestring(value) if type(value) is str else _encode_value(value, pad, indent) for value in values]
+
+def extract_column(rows, path, default=None, default_factory=None, default_from=None):
+    """
+    Returns the values of a source path across all rows as one column.
+    Missing values are replaced by default, or by default_factory() or default_from(row) when given.
+    """
+    keys = path.split(".")
+    values = rows
+    for key in keys[:-1]:
+        values = [value.get(key) if value is not None else None for value in values]
+    count = len(values)
+    missing = _MISSING if default_factory is not None or default_from is not None else default
+    if len(keys) == 1:
+        # dict.get mapped over the rows runs entirely in C
+        column = list(map(dict.get, values, repeat(keys[-1], count), repeat(missing, count)))
+    else:
+        column = [value.get(keys[-1], missing) if value is not None else missing for value in values]
+    if default_from is not None:
+        column = [default_from(row) if value is _MISSING else value for row, value in zip(rows, column)]
+    elif default_factory is not None:
+        column = [default_factory() if value is _MISSING else value for value in column]
+    return column
+
+def _compile_group(spec, depth, indent):
+    # Returns a function that serializes the objects described by spec, one per row, with the
+    # opening brace at the given depth
+    members = []
+    for target, value in spec.items():
+        members.append((target, _compile_value(value, depth + 1, indent)))
+    if not members:
+        return lambda rows: ["{}"] * len(rows)
+    keys = [encode_basestring(target).replace("%", "%%") for target, _ in members]
+    if indent is None:
+        template = "{" + ",".join(f"{key}:%s" for key in keys) + "}"
+    else:
+        inner = " " * indent * (depth + 1)
+        template = "{\n" + ",\n".join(f"{inner}{key}: %s" for key in keys) + "\n" + " " * indent * depth + "}"
+    builders = [builder for _, builder in members]
+
+    def encode_group(rows):
+        columns = [builder(rows) for builder in builders]
+        return [template % values for values in zip(*columns)]
+    return encode_group
+
+def _compile_value(value, depth, indent):
+    if isinstance(value, str):
+        value = Field(value)
+    if isinstance(value, dict):
+        return _compile_group(value, depth, indent)
+    if isinstance(value, Nested):
+        encode_nested = _compile_group(value.spec, depth, indent)
+
+        def encode_nested_column(rows):
+            parents = extract_column(rows, value.source)
+            encoded = iter(encode_nested([parent for parent in parents if parent]))
+            return [next(encoded) if parent else "null" for parent in parents]
+        return encode_nested_column
+    if isinstance(value, Field):
+        def encode_field_column(rows):
+            column = extract_column(rows, value.source, value.default, value.default_factory, value.default_from)
+            return encode_column(column, depth, indent)
+        return encode_field_column
+    raise TypeError(f"Unsupported mapping value: {value!r}")
+
+def compile_columnar(spec, indent=None):
+    """
+    Compiles a declarative mapping (see field_mapping.compile_mapping) into a columnar encoder.
+    The encoder takes a chunk of source records, pulls every source field out as a column,
+    applies renames and regroupings to whole columns and only assembles rows when serializing,
+    returning the UTF-8 JSON bytes of each record exactly as the encoders module produces them
+    for the same indent, with floats written the way json writes them (see encoders.JsonEncoder).
+    """
+    encode_rows = _compile_group(spec, 0, indent)
+
+    def encode_columnar(rows):
+        return [text.encode("utf-8") for text in encode_rows(rows)]
+    return encode_columnar
+
+# Compiled encoders per mapping and indent, with the mapping kept alive so its id stays unique
+_encoders = {}
+
+def get_columnar_encoder(transformer, indent=None):
+    """
+    Returns the columnar encoder for a transformer, or None if the transformer has no
+    declarative mapping to build one from.
+    """
+    mapping = getattr(transformer, "mapping", None)
+    if mapping is None:
+        return None
+    key = (id(mapping), indent)
+    if key not in _encoders:
+        _encoders[key] = (mapping, compile_columnar(mapping, indent))
+    return _encoders[key][1]
@@ -0,0 +1,547 @@
+import argparse
+import asyncio
+import collections
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import signal
+import struct
+import sys
+import time
+from main import process_users, add_process_arguments, add_logging_arguments, configure_logging
+from executors import get_executor_backend
+from encoders import get_encoder
+from metrics import RunMetrics, prometheus_metric, write_text_file
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+# struct inotify_event without its trailing name: wd, mask, cookie, len
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def is_input_file(name):
+    # Same files process_users globs for; producers can write a hidden temp file and rename it
+    return name.endswith(".json") and not name.startswith(".")
+
+def scan_input_root(root):
+    """
+    Returns (tenant, path, (size, mtime_ns)) of every input file in the tenant directories
+    directly below root.
+    """
+    files = []
+    try:
+        tenants = [entry for entry in os.scandir(root) if entry.is_dir() and not entry.name.startswith(".")]
+    except FileNotFoundError:
+        return files
+    for tenant in tenants:
+        try:
+            entries = list(os.scandir(tenant.path))
+        except OSError:
+            continue
+        for entry in entries:
+            if is_input_file(entry.name) and entry.is_file():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((tenant.name, entry.path, (stat.st_size, stat.st_mtime_ns)))
+    return files
+
+class PollingWatcher:
+    """
+    Finds new and changed input files by listing the tenant directories every interval
+    seconds. A file is reported once its size and mtime are the same in two listings in a
+    row, so files that are still being written are picked up when they are complete.
+    Works on every file system, including network mounts that do not deliver inotify events.
+    """
+    name = "polling"
+
+    def __init__(self, root, interval=1.0):
+        self.root = root
+        self.interval = interval
+
+    async def run(self, submit):
+        """
+        Calls await submit(tenant, path) for every complete input file until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        seen = {}
+        reported = {}
+        while True:
+            listing = await loop.run_in_executor(None, scan_input_root, self.root)
+            current = {}
+            for tenant, path, signature in listing:
+                current[path] = signature
+                if seen.get(path) == signature and reported.get(path) != signature:
+                    reported[path] = signature
+                    await submit(tenant, path)
+            seen = current
+            reported = {path: signature for path, signature in reported.items() if path in current}
+            await asyncio.sleep(self.interval)
+
+class InotifyWatcher:
+    """
+    Finds input files with Linux inotify, through libc and the event loop, without polling.
+    Files are reported when a writer closes them (IN_CLOSE_WRITE) or when they are renamed
+    into a tenant directory (IN_MOVED_TO). New tenant directories are watched as they
+    appear. Files that exist when watching starts are reported at once, and all directories
+    are listed again if the kernel's event queue overflows.
+    """
+    name = "inotify"
+
+    def __init__(self, root):
+        self.root = root
+        self.libc = self._load_libc()
+        if self.libc is None:
+            raise OSError("inotify is not available on this system")
+        self.fd = None
+        # Watch descriptor -> tenant name, None for the root
+        self.watches = {}
+
+    @staticmethod
+    def _load_libc():
+        if not sys.platform.startswith("linux"):
+            return None
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return None
+        libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        return libc
+
+    @classmethod
+    def supported(cls):
+        try:
+            return cls._load_libc() is not None
+        except OSError:
+            return False
+
+    def _add_watch(self, path, mask, tenant):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed: {os.strerror(errno)}", path)
+        self.watches[wd] = tenant
+
+    async def _watch_tenant(self, tenant, submit):
+        try:
+            self._add_watch(os.path.join(self.root, tenant), IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR, tenant)
+        except FileNotFoundError:
+            return
+        # Files written before the watch was added produce no events
+        await self._rescan(tenant, submit)
+
+    async def _watch_all(self, submit):
+        watched = set(self.watches.values())
+        for entry in sorted(os.scandir(self.root), key=lambda entry: entry.name):
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name not in watched:
+                await self._watch_tenant(entry.name, submit)
+
+    async def run(self, submit):
+        """
+        Calls await submit(tenant, path) for every complete input file until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        loop.add_reader(self.fd, self._read_events, events)
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            self._add_watch(self.root, IN_CREATE | IN_MOVED_TO | IN_ONLYDIR, None)
+            await self._watch_all(submit)
+            while True:
+                wd, mask, name = await events.get()
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify event queue overflowed, listing all tenant directories")
+                    for tenant in list(self.watches.values()):
+                        if tenant is not None:
+                            await self._rescan(tenant, submit)
+                    await self._watch_all(submit)
+                elif mask & IN_IGNORED:
+                    # The directory was removed
+                    self.watches.pop(wd, None)
+                elif wd not in self.watches:
+                    continue
+                elif self.watches[wd] is None:
+                    if mask & IN_ISDIR and not name.startswith("."):
+                        await self._watch_tenant(name, submit)
+                elif not mask & IN_ISDIR and is_input_file(name):
+                    tenant = self.watches[wd]
+                    await submit(tenant, os.path.join(self.root, tenant, name))
+        finally:
+            loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+            self.watches = {}
+
+    async def _rescan(self, tenant, submit):
+        directory = os.path.join(self.root, tenant)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return
+        for name in names:
+            if is_input_file(name) and os.path.isfile(os.path.join(directory, name)):
+                await submit(tenant, os.path.join(directory, name))
+
+    def _read_events(self, events):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.put_nowait((wd, mask, name))
+
+WATCHERS = ("auto", "inotify", "polling")
+
+def get_watcher(watcher, root, poll_interval=1.0):
+    """
+    Returns the watcher for the given name, or the watcher itself if one is passed in.
+    "auto" uses inotify where it is available and falls back to polling.
+    """
+    if not isinstance(watcher, str):
+        return watcher
+    if watcher not in WATCHERS:
+        raise ValueError(f"Unknown watcher: {watcher}. Expected one of {', '.join(WATCHERS)}")
+    if watcher == "polling" or (watcher == "auto" and not InotifyWatcher.supported()):
+        return PollingWatcher(root, poll_interval)
+    return InotifyWatcher(root)
+
+class TenantQueue:
+    """
+    Input files waiting to be processed, by tenant.
+    get() hands out the files of one tenant at a time. It picks the tenant with the highest
+    priority among those with waiting files, and takes turns between tenants of equal
+    priority, so a tenant that drops many files cannot starve the others. A tenant is not
+    handed out again until task_done() is called for it, so each tenant's output directory
+    is only written by one run at a time; files that arrive meanwhile wait for its next turn.
+    """
+    def __init__(self, priorities=None):
+        self.priorities = dict(priorities or {})
+        # tenant -> {path: monotonic time it was queued}, in arrival order
+        self.pending = {}
+        # Tenants in the order they get their turn
+        self.turns = collections.deque()
+        self.busy = set()
+        self.condition = asyncio.Condition()
+
+    def __len__(self):
+        return sum(len(files) for files in self.pending.values())
+
+    async def put(self, tenant, path):
+        """
+        Queues an input file of a tenant. A file that is already waiting keeps its place.
+        """
+        async with self.condition:
+            files = self.pending.setdefault(tenant, {})
+            files.setdefault(path, time.monotonic())
+            if tenant not in self.turns:
+                self.turns.append(tenant)
+            self.condition.notify_all()
+
+    def _next_tenant(self):
+        ready = [tenant for tenant in self.turns if self.pending.get(tenant) and tenant not in self.busy]
+        if not ready:
+            return None
+        return max(ready, key=lambda tenant: self.priorities.get(tenant, 0))
+
+    async def get(self, max_files=None):
+        """
+        Waits for waiting files of a tenant that is not busy and returns the tenant and a list
+        of up to max_files (path, queued time) pairs, oldest first.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self._next_tenant() is not None)
+            tenant = self._next_tenant()
+            files = self.pending[tenant]
+            taken = list(files.items())[:max_files]
+            for path, _ in taken:
+                del files[path]
+            self.busy.add(tenant)
+            # The tenant goes to the back of the line of its priority
+            self.turns.remove(tenant)
+            self.turns.append(tenant)
+            return tenant, taken
+
+    async def task_done(self, tenant):
+        async with self.condition:
+            self.busy.discard(tenant)
+            self.condition.notify_all()
+
+    async def join(self):
+        """
+        Waits until no files are waiting and no tenant is busy.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.busy and not len(self))
+
+class ServiceStats:
+    """
+    Throughput and latency of a running Daemon. Latency is the time from when an input file
+    was queued until its batches were committed; queue wait is the part spent waiting for a
+    run. Percentiles are taken over the last window files. Per tenant, the latencies of all
+    files are summed up in latency_seconds_sum and counted in latency_seconds_count.
+    """
+    def __init__(self, window=1000):
+        self.started = time.monotonic()
+        self.start_time = time.time()
+        self.totals = collections.Counter()
+        self.tenants = collections.defaultdict(collections.Counter)
+        self.latencies = collections.deque(maxlen=window)
+        self.waits = collections.deque(maxlen=window)
+
+    def record(self, tenant, queued, started, finished, failed, counters):
+        """
+        Records a run over the files queued at the given times. failed is the set of paths that
+        failed, counters the counters of the run's metrics.
+        """
+        run = collections.Counter(
+            runs=1, run_seconds=finished - started, users_out=counters.get("users_out", 0),
+            files_skipped=counters.get("files_skipped", 0),
+            files_committed=counters.get("files_committed", 0), files_failed=len(failed),
+        )
+        self.totals.update(run)
+        self.tenants[tenant].update(run)
+        for path, queued_at in queued:
+            self.waits.append(started - queued_at)
+            if path not in failed:
+                self.latencies.append(finished - queued_at)
+                self.tenants[tenant].update(latency_seconds_sum=finished - queued_at, latency_seconds_count=1)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(values)
+        pick = lambda share: ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+        return {"p50": pick(0.5), "p95": pick(0.95), "max": ordered[-1]}
+
+    def summary(self, queue=None):
+        """
+        Returns the stats as a JSON-serializable dict, with the files waiting in queue.
+        """
+        uptime = time.monotonic() - self.started
+        waiting = {tenant: len(files) for tenant, files in queue.pending.items()} if queue is not None else {}
+        tenants = set(self.tenants) | set(waiting)
+        return {
+            "start_time": self.start_time,
+            "uptime_seconds": uptime,
+            "queued_files": sum(waiting.values()),
+            "users_per_sec": self.totals["users_out"] / uptime if uptime else 0.0,
+            "files_per_sec": self.totals["files_committed"] / uptime if uptime else 0.0,
+            "latency_seconds": self._percentiles(self.latencies),
+            "queue_wait_seconds": self._percentiles(self.waits),
+            "totals": dict(self.totals),
+            "tenants": {
+                tenant: dict(self.tenants.get(tenant, {}), queued_files=waiting.get(tenant, 0),
+                             priority=queue.priorities.get(tenant, 0) if queue is not None else 0)
+                for tenant in sorted(tenants)
+            },
+        }
+
+    def prometheus_text(self, queue=None, prefix="usersformatter_daemon"):
+        """
+        Returns the stats in the Prometheus text exposition format.
+        """
+        summary = self.summary(queue)
+        lines = []
+        metric = lambda name, *args: lines.extend(prometheus_metric(f"{prefix}_{name}", *args))
+
+        tenants = summary["tenants"]
+        metric("uptime_seconds", "gauge", "Seconds since the daemon started.", [({}, summary["uptime_seconds"])])
+        metric("users_per_second", "gauge", "Users committed per second since the daemon started.",
+               [({}, summary["users_per_sec"])])
+        metric("latency_seconds", "gauge", "Time from queueing an input file to committing it, over recent files.",
+               [({"quantile": name}, value) for name, value in summary["latency_seconds"].items()])
+        metric("queue_wait_seconds", "gauge", "Time input files waited for a run, over recent files.",
+               [({"quantile": name}, value) for name, value in summary["queue_wait_seconds"].items()])
+        metric("tenant_latency_seconds", "summary", "Time from queueing an input file to committing it per tenant.",
+               [({"tenant": tenant}, stats.get("latency_seconds_sum", 0.0), stats.get("latency_seconds_count", 0))
+                for tenant, stats in tenants.items()])
+        metric("queued_files", "gauge", "Input files waiting per tenant.",
+               [({"tenant": tenant}, stats["queued_files"]) for tenant, stats in tenants.items()])
+        for name in ("runs", "files_committed", "files_failed", "files_skipped", "users_out"):
+            metric(f"{name}_total", "counter", f"{name.replace('_', ' ').capitalize()} per tenant.",
+                   [({"tenant": tenant}, stats.get(name, 0)) for tenant, stats in tenants.items()])
+        return "\n".join(lines) + "\n"
+
+class Daemon:
+    """
+    Long-running service that processes input files as they arrive.
+    Every subdirectory of input_root is a tenant. Its input files are processed with
+    process_users into the same-named subdirectory of output_root, with one manifest per
+    tenant, so every file is committed atomically and skipped once committed, also across
+    restarts. The watcher ("auto", "inotify", "polling" or a watcher instance) queues complete
+    files, and up to max_concurrent_jobs runs take up to max_files_per_job waiting files of one
+    tenant each (see TenantQueue for the order and priorities).
+    The executor backend and encoder are created once and shared by all runs, so worker
+    processes and their transformers stay warm. Other keyword arguments are passed on to
+    process_users.
+    stats (see ServiceStats) are logged after every run and written to stats_path as JSON and
+    to stats_textfile_path in the Prometheus text format, if given.
+    """
+    def __init__(self, input_root, output_root, watcher="auto", poll_interval=1.0, priorities=None,
+                 max_concurrent_jobs=2, max_files_per_job=8, executor="thread", max_workers=None, encoder=None,
+                 stats_path=None, stats_textfile_path=None, **options):
+        if not options.get("incremental", True):
+            raise ValueError("The daemon only processes files incrementally")
+        self.input_root = input_root
+        self.output_root = output_root
+        self.watcher = get_watcher(watcher, input_root, poll_interval)
+        self.queue = TenantQueue(priorities)
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_files_per_job = max_files_per_job
+        self.executor = executor
+        self.max_workers = max_workers
+        self.encoder = encoder
+        self.stats_path = stats_path
+        self.stats_textfile_path = stats_textfile_path
+        self.options = options
+        self.stats = ServiceStats()
+        self.stopping = None
+
+    def stop(self):
+        """
+        Stops the daemon after the runs in progress have committed. Files still waiting are
+        picked up again when the daemon restarts.
+        """
+        if self.stopping is not None:
+            self.stopping.set()
+
+    async def run(self):
+        """
+        Runs until stop() is called or the task is cancelled.
+        """
+        self.stopping = asyncio.Event()
+        backend = get_executor_backend(self.executor, self.max_workers)
+        encoder = get_encoder(self.encoder, self.options.get("indent"))
+        logger.info("Watching %s with %s, transforming with %s (%d workers)", self.input_root, self.watcher.name,
+                    backend.name, backend.max_workers)
+        slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        jobs = set()
+        watch = asyncio.create_task(self.watcher.run(self.queue.put))
+        stopping = asyncio.create_task(self.stopping.wait())
+        try:
+            while True:
+                await slots.acquire()
+                get = asyncio.create_task(self.queue.get(self.max_files_per_job))
+                done, _ = await asyncio.wait({get, stopping, watch}, return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    slots.release()
+                    if watch in done:
+                        # Raises the watcher's error
+                        watch.result()
+                    break
+                tenant, files = get.result()
+                job = asyncio.create_task(self._run_job(tenant, files, backend, encoder))
+                jobs.add(job)
+                job.add_done_callback(lambda job: (jobs.discard(job), slots.release()))
+        finally:
+            for task in (watch, stopping):
+                task.cancel()
+            # Let runs in progress commit their files
+            await asyncio.shield(asyncio.gather(*jobs, return_exceptions=True))
+            if backend is not self.executor:
+                backend.close()
+            self.write_stats()
+
+    async def _run_job(self, tenant, files, backend, encoder):
+        started = time.monotonic()
+        metrics = RunMetrics()
+        paths = [path for path, _ in files]
+        try:
+            errors = await process_users(
+                os.path.join(self.input_root, tenant), os.path.join(self.output_root, tenant), executor=backend,
+                encoder=encoder, metrics=metrics, files=paths, **self.options
+            )
+            failed = {os.path.basename(path) for path, _ in errors}
+        except Exception as e:
+            logger.error("Run for tenant %s failed: %s", tenant, e)
+            failed = {os.path.basename(path) for path in paths}
+        finally:
+            await self.queue.task_done(tenant)
+        finished = time.monotonic()
+        named = [(os.path.basename(path), queued_at) for path, queued_at in files]
+        self.stats.record(tenant, named, started, finished, failed, metrics.counters)
+        logger.info("Tenant %s: %d files in %.2fs, %d users, %d failed, %d files queued", tenant, len(files),
+                    finished - started, metrics.counters.get("users_out", 0), len(failed), len(self.queue))
+        self.write_stats()
+
+    def write_stats(self):
+        if self.stats_path:
+            write_text_file(self.stats_path, json.dumps(self.stats.summary(self.queue), indent=2) + "\n")
+        if self.stats_textfile_path:
+            write_text_file(self.stats_textfile_path, self.stats.prometheus_text(self.queue))
+
+def parse_priority(value):
+    tenant, _, priority = value.rpartition("=")
+    if not tenant:
+        raise argparse.ArgumentTypeError(f"Expected TENANT=PRIORITY, got {value}")
+    try:
+        return tenant, int(priority)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Priority of {tenant} is not an integer: {priority}")
+
+def build_arg_parser():
+    """
+    Returns the command line parser of main(). Options after the daemon's own are passed on to
+    process_users like those of main.py.
+    """
+    parser = argparse.ArgumentParser(description="Processes Microsoft Graph users exports of many tenants as they arrive.")
+    parser.add_argument("input_root", help="directory with one subdirectory of input files per tenant")
+    parser.add_argument("output_root", help="directory the output of each tenant is written to a subdirectory of")
+    parser.add_argument("--watcher", choices=WATCHERS, default="auto", help="how new files are found (default: auto)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between listings of the polling watcher")
+    parser.add_argument("--priority", type=parse_priority, action="append", default=[], metavar="TENANT=PRIORITY",
+                        help="serve a tenant before those of lower priority (default: 0), can be repeated")
+    parser.add_argument("--max-concurrent-jobs", type=int, default=2, help="tenants processed at once (default: 2)")
+    parser.add_argument("--max-files-per-job", type=int, default=8, help="files of a tenant processed per run (default: 8)")
+    parser.add_argument("--stats-json", dest="stats_path", help="keep throughput and latency stats in this JSON file")
+    parser.add_argument("--stats-textfile", dest="stats_textfile_path",
+                        help="keep throughput and latency stats in this Prometheus text format file")
+    add_process_arguments(parser)
+    add_logging_arguments(parser)
+    return parser
+
+def main(argv=None):
+    """
+    Command line entry point. Runs until SIGINT or SIGTERM, then lets the runs in progress
+    commit. Returns the exit status.
+    """
+    args = vars(build_arg_parser().parse_args(argv))
+    configure_logging(args)
+    args["priorities"] = dict(args.pop("priority"))
+
+    async def serve():
+        daemon = Daemon(**args)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, daemon.stop)
+        await daemon.run()
+
+    try:
+        asyncio.run(serve())
+    except Exception as e:
+        logger.error("Fatal error: %s", e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from lazy_imports import LazyModule
+
+sqlite3 = LazyModule("sqlite3")
+
+DELTA_INDEX_FILE = "delta_index.sqlite"
+# Ids per IN (...) lookup, below SQLite's default limit of bound parameters
+LOOKUP_SIZE = 500
+
+def record_digest(encoded):
+    """
+    Returns a 16 byte digest of a transformed user as produced by the sink's encode().
+    Users serialized to bytes are hashed as they are, other records (such as the dicts of the
+    parquet sink) as canonical JSON.
+    """
+    if not isinstance(encoded, bytes):
+        encoded = json.dumps(encoded, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+class DeltaIndex:
+    """
+    On-disk index of the users emitted by earlier runs, stored as an SQLite database in the
+    output directory. Maps each user id to the digest of its transformed record, the input
+    file it was last seen in and the run that last saw it.
+    filter() drops users whose record did not change since the last run. The digests of a
+    file's users are staged in a pending table and only applied when the file is committed,
+    so a file that fails or a run that crashes leaves the index in step with the output.
+    All database work runs on one dedicated thread, keeping the event loop free and the
+    memory use independent of the number of ids.
+    """
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, DELTA_INDEX_FILE)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.run = None
+        self.connection = None
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def start_run(self, unprocessed_files=()):
+        """
+        Opens the index and starts a new run. unprocessed_files are names of input files that
+        this run skips; their users are not reported as deleted.
+        """
+        await self._call(self._start_run, list(unprocessed_files))
+
+    def _start_run(self, unprocessed_files):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY, hash BLOB NOT NULL, file TEXT NOT NULL, seen INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pending (file TEXT NOT NULL, id TEXT NOT NULL, hash BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TEMP TABLE unprocessed (file TEXT PRIMARY KEY);
+        """)
+        # Digests staged by a run that did not finish were never committed
+        self.connection.execute("DELETE FROM pending")
+        self.run = self._get_meta("run") + 1
+        self._set_meta("run", self.run)
+        self.connection.executemany("INSERT OR IGNORE INTO unprocessed VALUES (?)", [(name,) for name in unprocessed_files])
+        self.connection.commit()
+
+    def _get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    async def filter(self, file_name, ids, encoded_users, rows=None):
+        """
+        Returns the encoded users that are new or changed since the last run, in their
+        original order, and stages the digests of all users with an id for commit().
+        Users without an id are always returned.
+        With rows (database rows of the same users, see loaders) returns (encoded users, rows)
+        filtered alike. encoded_users may then be None, and the rows are digested instead.
+        """
+        return await self._call(self._filter, file_name, ids, encoded_users, rows)
+
+    def _filter(self, file_name, ids, encoded_users, rows=None):
+        records = encoded_users if encoded_users is not None else rows
+        digests = [record_digest(record) for record in records]
+        known = {}
+        keys = [user_id for user_id in ids if user_id is not None]
+        for start in range(0, len(keys), LOOKUP_SIZE):
+            lookup = keys[start:start + LOOKUP_SIZE]
+            query = f"SELECT id, hash FROM users WHERE id IN ({','.join('?' * len(lookup))})"
+            known.update(self.connection.execute(query, lookup))
+        self.connection.executemany(
+            "INSERT INTO pending VALUES (?, ?, ?)",
+            [(file_name, user_id, digest) for user_id, digest in zip(ids, digests) if user_id is not None],
+        )
+        changed = [user_id is None or known.get(user_id) != digest for user_id, digest in zip(ids, digests)]
+        if encoded_users is not None:
+            encoded_users = [encoded for encoded, keep in zip(encoded_users, changed) if keep]
+        if rows is None:
+            return encoded_users
+        return encoded_users, [row for row, keep in zip(rows, changed) if keep]
+
+    async def commit(self, file_name):
+        """
+        Applies the staged digests of a committed input file to the index.
+        """
+        await self._call(self._commit, file_name)
+
+    def _commit(self, file_name):
+        self.connection.execute(
+            """
+            INSERT INTO users SELECT id, hash, file, ? FROM pending WHERE file = ?
+            ON CONFLICT (id) DO UPDATE SET hash = excluded.hash, file = excluded.file, seen = excluded.seen
+            """,
+            (self.run, file_name),
+        )
+        self.connection.execute("DELETE FROM pending WHERE file = ?", (file_name,))
+        self.connection.commit()
+
+    async def discard(self, file_name):
+        """
+        Drops the staged digests of an input file that failed. Its users are not reported as
+        deleted at the end of the run.
+        """
+        await self._call(self._discard, file_name)
+
+    def _discard(self, file_name):
+        self.connection.execute("DELETE FROM pending WHERE file = ?", (file_name,))
+        self.connection.execute("INSERT OR IGNORE INTO unprocessed VALUES (?)", (file_name,))
+        self.connection.commit()
+
+    async def tombstones(self, batch_size):
+        """
+        Yields lists of up to batch_size ids that were in the index but were not seen by this
+        run, skipping users of unprocessed files, and removes them from the index once all
+        batches have been consumed.
+        """
+        cursor = await self._call(
+            self.connection.execute,
+            "SELECT id FROM users WHERE seen < ? AND file NOT IN (SELECT file FROM unprocessed) ORDER BY id",
+            (self.run,),
+        )
+        while True:
+            rows = await self._call(cursor.fetchmany, batch_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+        await self.remove_tombstones()
+
+    async def remove_tombstones(self):
+        """
+        Removes the ids that were not seen by this run from the index without listing them.
+        """
+        await self._call(self._remove_tombstones)
+
+    def _remove_tombstones(self):
+        self.connection.execute(
+            "DELETE FROM users WHERE seen < ? AND file NOT IN (SELECT file FROM unprocessed)", (self.run,)
+        )
+        self.connection.commit()
+
+    async def next_tombstone_index(self):
+        """
+        Returns the index of the next tombstone file. Tombstone files are numbered across runs
+        so earlier ones are never overwritten; the counter is saved together with the removal
+        of the tombstoned ids.
+        """
+        return await self._call(self._next_tombstone_index)
+
+    def _next_tombstone_index(self):
+        index = self._get_meta("next_tombstone")
+        self._set_meta("next_tombstone", index + 1)
+        return index
+
+    async def close(self):
+        if self.connection is not None:
+            await self._call(self.connection.close)
+            self.connection = None
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,125 @@
+import json
+from lazy_imports import lazy_import
+
+orjson = lazy_import("orjson")
+msgspec = lazy_import("msgspec")
+
+class JsonEncoder:
+    """
+    Serializes users with the standard library json module.
+    With indent=None (the default) the output is compact; otherwise every record is
+    pretty-printed with the given indentation.
+    For the same indent, all encoders produce the same bytes for strings, integers, booleans,
+    null and floats without an exponent, but not for every value: orjson and msgspec write
+    exponents without padding or sign (1e-7, 1e16) where json writes 1e-07 and 1e+16,
+    orjson rejects integers beyond 64 bits, and json writes NaN and Infinity where the others
+    write null. process_users records the encoder in its manifest for that reason.
+    """
+    name = "json"
+
+    def __init__(self, indent=None):
+        self.indent = indent
+        self.separators = (",", ":") if indent is None else (",", ": ")
+        # Batch files keep one record per line when pretty-printed
+        self.array_start, self.separator, self.array_end = (b"[", b",", b"]") if indent is None else (b"[\n", b",\n", b"\n]")
+
+    @classmethod
+    def supports(cls, indent):
+        return True
+
+    def encode(self, item):
+        """
+        Serializes a single user to UTF-8 JSON bytes.
+        """
+        return json.dumps(item, ensure_ascii=False, indent=self.indent, separators=self.separators).encode("utf-8")
+
+    def join(self, encoded_records):
+        """
+        Combines serialized users into the bytes of one JSON array.
+        """
+        return self.array_start + self.separator.join(encoded_records) + self.array_end
+
+    def encode_array(self, items):
+        """
+        Serializes a list of users into the bytes of one JSON array.
+        """
+        if self.indent is None:
+            return json.dumps(items, ensure_ascii=False, separators=self.separators).encode("utf-8")
+        return self.join([self.encode(item) for item in items])
+
+class OrjsonEncoder(JsonEncoder):
+    """
+    Serializes users with orjson. Only supports compact output and an indent of 2.
+    """
+    name = "orjson"
+
+    def __init__(self, indent=None):
+        super().__init__(indent)
+        self.option = orjson.OPT_INDENT_2 if indent == 2 else 0
+
+    @classmethod
+    def supports(cls, indent):
+        return orjson is not None and indent in (None, 2)
+
+    def encode(self, item):
+        return orjson.dumps(item, option=self.option)
+
+    def encode_array(self, items):
+        if self.indent is None:
+            return orjson.dumps(items)
+        return self.join([orjson.dumps(item, option=self.option) for item in items])
+
+class MsgspecEncoder(JsonEncoder):
+    """
+    Serializes users with msgspec.
+    """
+    name = "msgspec"
+
+    def __init__(self, indent=None):
+        super().__init__(indent)
+        self._encode = msgspec.json.Encoder().encode
+
+    @classmethod
+    def supports(cls, indent):
+        return msgspec is not None
+
+    def __getstate__(self):
+        # msgspec encoders cannot be pickled, process workers rebuild theirs
+        return {"indent": self.indent}
+
+    def __setstate__(self, state):
+        self.__init__(state["indent"])
+
+    def encode(self, item):
+        if self.indent is None:
+            return self._encode(item)
+        return msgspec.json.format(self._encode(item), indent=self.indent)
+
+    def encode_array(self, items):
+        if self.indent is None:
+            return self._encode(items)
+        return self.join([self.encode(item) for item in items])
+
+# Encoders in order of preference for auto-detection
+ENCODERS = {
+    "orjson": OrjsonEncoder,
+    "msgspec": MsgspecEncoder,
+    "json": JsonEncoder,
+}
+
+def get_encoder(encoder=None, indent=None):
+    """
+    Returns an encoder for the given name, or the encoder itself if one is passed in.
+    With encoder=None the fastest installed encoder that supports indent is picked.
+    """
+    if encoder is None:
+        for encoder_class in ENCODERS.values():
+            if encoder_class.supports(indent):
+                return encoder_class(indent)
+    if not isinstance(encoder, str):
+        return encoder
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {encoder}. Expected one of {', '.join(ENCODERS)}")
+    if not ENCODERS[encoder].supports(indent):
+        raise ValueError(f"Encoder {encoder} is not installed or does not support indent={indent}")
+    return ENCODERS[encoder](indent)
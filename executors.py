@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from columnar import get_columnar_encoder
+from sharding import RawChunk, transform_shard
+from routing import get_transformer
+
+# Transformation engines: one dict per user, whole columns per chunk, or one typed record per user
+ENGINES = ("record", "columnar", "typed")
+
+def transform_and_encode(transformer, chunk, sink, engine="record", timed=False, to_rows=None):
+    """
+    Transforms a chunk of users and encodes the results for the sink's batch writer.
+    The columnar engine is used when requested, the transformer has a declarative mapping
+    and the sink stores users as JSON text. The same goes for the typed engine and a typed
+    record model.
+    With to_rows (see loaders.BaseLoader) the transformed users are also turned into database
+    rows and (encoded users, rows) is returned; sink may then be None, which leaves encoded
+    users None. Rows are built from transform_batch() results, so the record engine is used.
+    With timed=True returns (result, transform seconds, encode seconds); the columnar and
+    typed engines do both at once and report all of it as transform time. Building rows
+    counts as encoding.
+    """
+    start = time.perf_counter() if timed else 0.0
+    if to_rows is None and engine == "typed" and sink.indent is not False:
+        # Imports msgspec, so only done for the typed engine
+        from records import get_typed_encoder
+        encode_typed = get_typed_encoder(transformer, sink.indent)
+        if encode_typed is not None:
+            encoded = encode_typed(transformer, chunk)
+            return (encoded, time.perf_counter() - start, 0.0) if timed else encoded
+    if to_rows is None and engine == "columnar" and sink.indent is not False:
+        encode_columns = get_columnar_encoder(transformer, sink.indent)
+        if encode_columns is not None:
+            encoded = encode_columns(chunk)
+            return (encoded, time.perf_counter() - start, 0.0) if timed else encoded
+    users = transformer.transform_batch(chunk)
+    transformed = time.perf_counter() if timed else 0.0
+    if to_rows is None:
+        encoded = sink.encode(users)
+    else:
+        encoded = (sink.encode(users) if sink is not None else None), to_rows(users)
+    if not timed:
+        return encoded
+    return encoded, transformed - start, time.perf_counter() - transformed
+
+class InlineBackend:
+    """
+    Runs transformation directly on the event loop.
+    Has the lowest overhead for small inputs but blocks the loop while a chunk is transformed.
+    """
+    name = "inline"
+    max_workers = 1
+    raw_chunks = False
+
+    async def transform(self, transformer, chunk, sink, engine="record", timed=False, to_rows=None):
+        return transform_and_encode(transformer, chunk, sink, engine, timed, to_rows)
+
+    async def transform_shard(self, transformer, shard, sink, engine, chunk_size, batch_size):
+        return transform_shard(transformer, shard, sink, engine, chunk_size, batch_size)
+
+    def close(self):
+        pass
+
+class ThreadBackend:
+    """
+    Runs transformation in a thread pool, keeping the event loop free for IO.
+    Transformation still holds the GIL, so it uses at most one core.
+    """
+    name = "thread"
+    raw_chunks = False
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    async def transform(self, transformer, chunk, sink, engine="record", timed=False, to_rows=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, transform_and_encode, transformer, chunk, sink, engine, timed, to_rows
+        )
+
+    async def transform_shard(self, transformer, shard, sink, engine, chunk_size, batch_size):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, transform_shard, transformer, shard, sink, engine, chunk_size, batch_size
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def _init_worker():
+    # Import the transformer registry up front so the first chunk does not pay for it
+    import main  # noqa: F401
+
+# Decoders of JSON arrays of typed records, by record model
+_array_decoders = {}
+
+def _serialize_chunk(chunk):
+    # Runs in the default thread pool; records are only imported for typed records, since they import msgspec
+    if chunk and not isinstance(chunk[0], dict):
+        from records import to_builtins
+        return json.dumps(chunk, ensure_ascii=False, default=to_builtins)
+    return json.dumps(chunk, ensure_ascii=False)
+
+def _decode_chunk(transformer, payload, sink, engine, to_rows):
+    # Users go straight into the input records of the typed engine when it will be used,
+    # see transform_and_encode
+    if engine == "typed" and to_rows is None and sink.indent is not False and transformer.record_model is not None:
+        model = transformer.record_model
+        decode = _array_decoders.get(model)
+        if decode is None:
+            decode = _array_decoders[model] = model.array_decoder()
+        return decode(payload)
+    return json.loads(payload)
+
+def _transform_serialized_chunk(transformer_class, external_ids, payload, sink, engine, timed, to_rows):
+    """
+    Entry point of process workers. Decodes a JSON array of users, transforms it with the
+    worker's shared instance of transformer_class, using the named external id strategy, and
+    returns the serialized results (and database rows with to_rows).
+    """
+    transformer = get_transformer(transformer_class, external_ids)
+    return transform_and_encode(transformer, _decode_chunk(transformer, payload, sink, engine, to_rows), sink, engine,
+                                timed, to_rows)
+
+def _transform_shard_in_worker(transformer_class, external_ids, shard, sink, engine, chunk_size, batch_size):
+    # Entry point of process workers for a byte range of an input file, see sharding.transform_shard
+    transformer = get_transformer(transformer_class, external_ids)
+    return transform_shard(transformer, shard, sink, engine, chunk_size, batch_size)
+
+class ProcessBackend:
+    """
+    Runs transformation in a pool of long-lived worker processes to use several cores.
+    Each chunk is shipped as a single JSON array rather than pickled dict by dict, and
+    the workers return users already serialized for the batch writer. With raw_chunks,
+    process_users hands it sharding.RawChunk items, the raw bytes of the users in the input
+    file, so users are only parsed once, by the workers; other chunks are encoded first.
+    Transformer classes are pickled by reference, so workers import them from their module
+    and they must be defined at the top level of one. External id strategies are passed by
+    name, so only those listed in EXTERNAL_ID_STRATEGIES are available to workers.
+    """
+    name = "process"
+    raw_chunks = True
+
+    def __init__(self, max_workers=None):
+        # Process pools take a while to import, so only runs of this backend do
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    async def transform(self, transformer, chunk, sink, engine="record", timed=False, to_rows=None):
+        loop = asyncio.get_running_loop()
+        if isinstance(chunk, RawChunk):
+            payload = chunk.data
+        else:
+            # Parsed users, and typed records as dicts, are encoded off the event loop
+            payload = await loop.run_in_executor(None, _serialize_chunk, chunk)
+        return await loop.run_in_executor(
+            self.executor, _transform_serialized_chunk, type(transformer), transformer.external_ids.name, payload, sink,
+            engine, timed, to_rows
+        )
+
+    async def transform_shard(self, transformer, shard, sink, engine, chunk_size, batch_size):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, _transform_shard_in_worker, type(transformer), transformer.external_ids.name, shard, sink,
+            engine, chunk_size, batch_size
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+EXECUTOR_BACKENDS = {
+    "inline": InlineBackend,
+    "thread": ThreadBackend,
+    "process": ProcessBackend,
+}
+
+def get_executor_backend(executor, max_workers=None):
+    """
+    Returns an executor backend for the given name, or the backend itself if one is passed in.
+    """
+    if not isinstance(executor, str):
+        return executor
+    if executor not in EXECUTOR_BACKENDS:
+        raise ValueError(f"Unknown executor backend: {executor}. Expected one of {', '.join(EXECUTOR_BACKENDS)}")
+    if executor == "inline":
+        return InlineBackend()
+    return EXECUTOR_BACKENDS[executor](max_workers)
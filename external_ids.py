@@ -0,0 +1,102 @@
+import hashlib
+import os
+import uuid
+
+# Namespace of the uuid5 external ids derived from Graph user ids
+GRAPH_USER_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://graph.microsoft.com/users")
+
+# Byte translations that set the version (high nibble of byte 6) and RFC 4122 variant
+# (top bits of byte 8) of a UUID
+_VERSION_4 = bytes((b & 0x0F) | 0x40 for b in range(256))
+_VERSION_5 = bytes((b & 0x0F) | 0x50 for b in range(256))
+_VARIANT = bytes((b & 0x3F) | 0x80 for b in range(256))
+
+def _format_uuid(hexed, start=0):
+    # Formats 32 hex digits at start as a canonical UUID string
+    return (f"{hexed[start:start + 8]}-{hexed[start + 8:start + 12]}-{hexed[start + 12:start + 16]}-"
+            f"{hexed[start + 16:start + 20]}-{hexed[start + 20:start + 32]}")
+
+class RandomExternalIds:
+    """
+    Generates a random uuid4 per user from os.urandom, one call per id.
+    This is the original behaviour of UserTransformer.
+    """
+    name = "uuid4"
+
+    def __call__(self, user):
+        return str(uuid.uuid4())
+
+class BulkRandomExternalIds:
+    """
+    Generates random version 4 UUIDs like RandomExternalIds, but draws the entropy for
+    block_size ids in one os.urandom call and formats them by slicing one hex string
+    instead of building a UUID object per id.
+    """
+    name = "bulk-random"
+
+    def __init__(self, block_size=4096):
+        self.block_size = block_size
+        self._ids = []
+
+    def _draw(self):
+        data = bytearray(os.urandom(16 * self.block_size))
+        data[6::16] = data[6::16].translate(_VERSION_4)
+        data[8::16] = data[8::16].translate(_VARIANT)
+        hexed = data.hex()
+        return [_format_uuid(hexed, start) for start in range(0, len(hexed), 32)]
+
+    def __call__(self, user):
+        # list.pop is atomic, so thread backend workers can share the pool; a refill race only
+        # draws one block too many
+        try:
+            return self._ids.pop()
+        except IndexError:
+            self._ids = self._draw()
+            return self._ids.pop()
+
+class DerivedExternalIds:
+    """
+    Derives the external id from the Graph user id as uuid5(namespace, id), so the same user
+    gets the same external_id on every run. Users without an id get a random uuid4.
+    Produces the same ids as uuid.uuid5 without creating a UUID object per id.
+    """
+    name = "uuid5"
+
+    def __init__(self, namespace=GRAPH_USER_NAMESPACE):
+        self.namespace = namespace
+        self._prefix = namespace.bytes
+        self._fallback = RandomExternalIds()
+
+    def __call__(self, user):
+        user_id = user.get("id")
+        if user_id is None:
+            return self._fallback(user)
+        digest = bytearray(hashlib.sha1(self._prefix + str(user_id).encode("utf-8")).digest()[:16])
+        digest[6] = _VERSION_5[digest[6]]
+        digest[8] = _VARIANT[digest[8]]
+        return _format_uuid(digest.hex())
+
+EXTERNAL_ID_STRATEGIES = {
+    "uuid4": RandomExternalIds,
+    "bulk-random": BulkRandomExternalIds,
+    "uuid5": DerivedExternalIds,
+}
+
+# Strategy instances by name, shared so mappings compiled for a strategy are reused
+_strategies = {}
+
+def get_external_id_strategy(strategy=None):
+    """
+    Returns the external id strategy for the given name, or the strategy itself if one is passed
+    in. Defaults to random uuid4 ids. Strategies are called with the source user record and
+    only for users that have no external_id.
+    """
+    if strategy is None:
+        strategy = "uuid4"
+    if not isinstance(strategy, str):
+        return strategy
+    if strategy not in EXTERNAL_ID_STRATEGIES:
+        raise ValueError(f"Unknown external id strategy: {strategy}. Expected one of {', '.join(EXTERNAL_ID_STRATEGIES)}")
+    if strategy not in _strategies:
+        _strategies[strategy] = EXTERNAL_ID_STRATEGIES[strategy]()
+    return _strategies[strategy]
@@ -0,0 +1,126 @@
+# Marks a field that is missing from the source record
+_MISSING = object()
+
+class Field:
+    """
+    Maps a single source field to a target field.
+    source is a key of the input record, or a dotted path into nested objects.
+    If the field is missing, default is used, or default_factory() when given, or
+    default_from(record) with the record the path starts from. Factories are only called for
+    records that actually lack the field.
+    """
+    def __init__(self, source, default=None, default_factory=None, default_from=None):
+        self.source = source
+        self.default = default
+        self.default_factory = default_factory
+        self.default_from = default_from
+
+class Nested:
+    """
+    Maps the fields of a nested source object into a new target structure.
+    spec describes the target structure with paths relative to the nested object.
+    The target value is None when the source object is missing or empty.
+    """
+    def __init__(self, source, spec):
+        self.source = source
+        self.spec = spec
+
+def compile_mapping(spec, name="mapped_transform"):
+    """
+    Compiles a declarative mapping into a specialized function that transforms one record.
+
+    spec is a dict describing the target record. Keys are target field names in output order and
+    values are either a source path string, a Field, a Nested, or a dict for a target grouping
+    built from fields at the current level. For example:
+
+        {
+            "Id": "id",
+            "external_id": Field("external_id", default_factory=make_id),
+            "signInActivity": Nested("signInActivity", {
+                "lastSignIn": {"dateTime": "lastSignInDateTime", "requestId": "lastSignInRequestId"},
+            }),
+        }
+
+    The mapping is turned into Python source once, so transforming a record is a straight run of
+    dict.get calls and a dict literal instead of a walk over the mapping.
+    """
+    compiler = _MappingCompiler()
+    body = []
+    result = compiler.build(spec, "record", body, "    ")
+    source = f"def {name}(record):\n" + "".join(body) + f"    return {result}\n"
+    namespace = dict(compiler.constants)
+    exec(compile(source, f"<mapping {name}>", "exec"), namespace)
+    function = namespace[name]
+    function.__source__ = source
+    return function
+
+class _MappingCompiler:
+    def __init__(self):
+        self.constants = {"_MISSING": _MISSING}
+        self.counter = 0
+
+    def new_name(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def constant(self, value):
+        name = self.new_name("_const")
+        self.constants[name] = value
+        return name
+
+    def build(self, spec, source, body, indent):
+        # Returns an expression for the target dict; values that need statements are computed into
+        # locals first, so the dict literal keeps the target key order of the spec.
+        items = []
+        for target, value in spec.items():
+            items.append(f"{target!r}: {self.value(value, source, body, indent)}")
+        return "{" + ", ".join(items) + "}"
+
+    def value(self, value, source, body, indent):
+        if isinstance(value, str):
+            value = Field(value)
+        if isinstance(value, dict):
+            return self.build(value, source, body, indent)
+        if isinstance(value, Nested):
+            parent = self.lookup(value.source, source, body, indent, "None")
+            result = self.new_name("_nested")
+            body.append(f"{indent}if {parent}:\n")
+            inner = []
+            expression = self.build(value.spec, parent, inner, indent + "    ")
+            body.extend(inner)
+            body.append(f"{indent}    {result} = {expression}\n")
+            body.append(f"{indent}else:\n")
+            body.append(f"{indent}    {result} = None\n")
+            return result
+        if isinstance(value, Field):
+            if value.default_factory is not None or value.default_from is not None:
+                result = self.lookup(value.source, source, body, indent, "_MISSING")
+                body.append(f"{indent}if {result} is _MISSING:\n")
+                if value.default_from is not None:
+                    body.append(f"{indent}    {result} = {self.constant(value.default_from)}({source})\n")
+                else:
+                    body.append(f"{indent}    {result} = {self.constant(value.default_factory)}()\n")
+                return result
+            default = "None" if value.default is None else self.constant(value.default)
+            if "." not in value.source:
+                return self.get(source, value.source, default)
+            return self.lookup(value.source, source, body, indent, default)
+        raise TypeError(f"Unsupported mapping value: {value!r}")
+
+    def get(self, source, key, default):
+        if default == "None":
+            return f"{source}.get({key!r})"
+        return f"{source}.get({key!r}, {default})"
+
+    def lookup(self, path, source, body, indent, default):
+        # Walks a dotted path into a local, yielding default if any step is missing
+        keys = path.split(".")
+        result = self.new_name("_value")
+        if len(keys) == 1:
+            body.append(f"{indent}{result} = {self.get(source, keys[0], default)}\n")
+            return result
+        body.append(f"{indent}{result} = {source}.get({keys[0]!r})\n")
+        for key in keys[1:-1]:
+            body.append(f"{indent}{result} = {result}.get({key!r}) if {result} is not None else None\n")
+        body.append(f"{indent}{result} = {self.get(result, keys[-1], default)} if {result} is not None else {default}\n")
+        return result
@@ -1,66 +1,493 @@
-import ijson
-import json
 import os
-import aiofiles
 import asyncio
+import logging
+import shutil
+import time
+from encoders import get_encoder
+from lazy_imports import LazyModule
+from sinks import get_sink
+from metrics import NULL_METRICS
+from parsers import get_parser, compile_projection, ProjectedItems, PARSE_MEMORY_BUDGET
 
-def read_json_stream(path):
+ijson = LazyModule("ijson")
+aiofiles = LazyModule("aiofiles")
+
+logger = logging.getLogger(__name__)
+
+def read_json_stream(path, parser=None, memory_budget=PARSE_MEMORY_BUDGET):
     """
     Reads JSON files with OData format.
-    Streams users from the 'value' array without loading the entire file into memory.
+    Streams users from the 'value' array without loading the entire file into memory, or
+    decodes the whole file at once with the bulk parser. parser is a name or instance from
+    parsers.py; None selects one by file size, see parsers.get_parser.
     """
-    with open(path, "r", encoding="utf-8") as f:
+    with open(path, "rb") as f:
+        parser = get_parser(parser, os.fstat(f.fileno()).st_size, memory_budget)
+        if not parser.streaming:
+            yield from parser.decode_file(f)
+            return
         # Use ijson to stream from the 'value' array in OData format
-        for user in ijson.items(f, "value.item"):
+        for user in parser.backend.items(f, "value.item"):
             yield user
 
-async def aread_json_stream(path):
+# Size of each byte chunk read from an input file by aread_json_stream
+READ_CHUNK_SIZE = 64 * 1024
+# Number of chunks that may be read ahead of the parser before the reader waits
+READ_AHEAD_CHUNKS = 4
+# Size of the reads used to sniff the @odata.context header
+HEADER_READ_SIZE = 2048
+
+class ODataStream:
+    """
+    Reads an OData JSON file through a single file handle.
+    read_context() sniffs the @odata.context field with ijson events, reading only as many
+    bytes as it takes to find it. users() then streams the 'value' array, replaying the
+    bytes the header sniff already read instead of opening the file a second time.
+    parser selects the ijson backend or the bulk parser (see parsers.get_parser); with None
+    it is picked by the size of the file once it is opened.
+    """
+    def __init__(self, path, read_size=READ_CHUNK_SIZE, read_ahead=READ_AHEAD_CHUNKS, parser=None,
+                 memory_budget=PARSE_MEMORY_BUDGET):
+        self.path = path
+        self.read_size = read_size
+        self.read_ahead = read_ahead
+        self.parser = parser
+        self.memory_budget = memory_budget
+        self.file = None
+        self.buffered = []
+        # @odata.context once read_context() has found it
+        self.context = None
+
+    async def __aenter__(self):
+        self.file = await aiofiles.open(self.path, "rb")
+        try:
+            self.parser = get_parser(self.parser, os.fstat(self.file.fileno()).st_size, self.memory_budget)
+        except BaseException:
+            await self.file.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.file.close()
+
+    def decodes_records(self):
+        """
+        Tells whether users() decodes the users of this file into typed records when given a
+        record model: always with the bulk parser, and with streaming parsers if numpy is
+        installed for the boundary scan.
+        """
+        if not self.parser.streaming:
+            return True
+        from sharding import numpy
+        return numpy is not None
+
+    async def read_context(self):
+        """
+        Returns the @odata.context of the file, or "" if it has none or the header cannot be parsed.
+        Stops at the first chunk that contains the field. If the 'value' array comes first, the
+        rest of the file is scanned for a trailing field and the body is re-read from the start.
+        """
+        events = ijson.sendable_list()
+        parser = self.parser.backend.parse_coro(events)
+        key = None
+        in_body = False
+        try:
+            while True:
+                data = await self.file.read(self.read_size if in_body else HEADER_READ_SIZE)
+                if not in_body:
+                    self.buffered.append(data)
+                if data:
+                    parser.send(data)
+                else:
+                    parser.close()
+                for prefix, event, value in events:
+                    if prefix == "":
+                        if event == "map_key":
+                            key = value
+                    elif key == "@odata.context" and prefix == key and event == "string":
+                        self.context = value
+                        return value
+                    elif key == "value" and prefix == key and event == "start_array":
+                        in_body = True
+                del events[:]
+                if not data:
+                    return ""
+        except ijson.JSONError:
+            # Leave malformed files to the body stream, which reports the error
+            return ""
+        finally:
+            # Stop the parser now rather than on garbage collection, where the pure Python
+            # backend reports the unread rest of the file as an unraisable error
+            try:
+                parser.close()
+            except ijson.JSONError:
+                pass
+            if in_body:
+                # Nothing was buffered past the start of the body, so read it again from the start
+                await self.file.seek(0)
+                self.buffered = []
+
+    async def raw_chunks(self, chunk_size):
+        """
+        Streams the 'value' array as sharding.RawChunk items that each hold the raw bytes of
+        the next chunk_size users, without parsing them (see sharding.value_array_slices). Chunks are cut in the default thread pool. Requires numpy.
+        """
+        # Imported here because sharding imports this module
+        from sharding import value_array_slices
+        self.buffered = []
+        loop = asyncio.get_running_loop()
+        slices = value_array_slices(self.file, chunk_size)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, slices, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            slices.close()
+
+    async def users(self, record_model=None, fields=None):
+        """
+        Streams users from the 'value' array asynchronously.
+        A reader task pulls fixed-size byte chunks off the file into a bounded queue,
+        and each chunk is fed to ijson's push parser so users are yielded as soon as
+        they are decoded. The reader blocks once read_ahead chunks are pending, so
+        memory stays bounded by read_size * read_ahead regardless of file size.
+        The bulk parser instead decodes the whole file in the default thread pool, straight
+        into the input records of record_model if one is given (see records.RecordModel).
+        With a record model, streamed files are decoded into records too, a block of whole
+        users at a time in the default thread pool (see sharding.decode_value_blocks), so no
+        dicts are built for them; this needs numpy, see decodes_records(). Otherwise streaming
+        parsers yield dicts. Given the input fields a transformer declares, parsers that
+        benefit from it leave every other field out while parsing.
+        """
+        if not self.parser.streaming:
+            self.buffered = []
+            loop = asyncio.get_running_loop()
+            for user in await loop.run_in_executor(None, self.parser.decode_file, self.file, record_model):
+                yield user
+            return
+        if record_model is not None and self.decodes_records():
+            # Imported here because sharding imports this module
+            from sharding import decode_value_blocks
+            self.buffered = []
+            loop = asyncio.get_running_loop()
+            blocks = decode_value_blocks(self.file, record_model.array_decoder())
+            try:
+                while True:
+                    users = await loop.run_in_executor(None, next, blocks, None)
+                    if users is None:
+                        break
+                    for user in users:
+                        yield user
+            finally:
+                blocks.close()
+            return
+        chunks = asyncio.Queue(maxsize=self.read_ahead)
+        buffered, self.buffered = self.buffered, []
+
+        async def reader():
+            try:
+                # Replay what the header sniff already read before reading on
+                for data in buffered:
+                    await chunks.put(data)
+                    if not data:
+                        return
+                while True:
+                    data = await self.file.read(self.read_size)
+                    await chunks.put(data)
+                    if not data:
+                        break
+            except Exception as e:
+                # Hand the error over to the consumer side
+                await chunks.put(e)
+
+        decoded = ijson.sendable_list()
+        if self.parser.projects(fields, self.context):
+            parser = self.parser.backend.basic_parse_coro(ProjectedItems(compile_projection(fields), decoded))
+        else:
+            parser = self.parser.backend.items_coro(decoded, "value.item")
+        reader_task = asyncio.create_task(reader())
+        try:
+            while True:
+                data = await chunks.get()
+                if isinstance(data, Exception):
+                    raise data
+                if not data:
+                    parser.close()
+                else:
+                    parser.send(data)
+                for user in decoded:
+                    yield user
+                del decoded[:]
+                if not data:
+                    break
+        finally:
+            reader_task.cancel()
+            try:
+                await reader_task
+            except asyncio.CancelledError:
+                pass
+
+async def aread_json_stream(path, read_size=READ_CHUNK_SIZE, read_ahead=READ_AHEAD_CHUNKS, parser=None,
+                            memory_budget=PARSE_MEMORY_BUDGET, fields=None):
     """
-    Async wrapper for read_json_stream using a thread pool.
-    Streams users from the 'value' array without loading the entire file into memory.
+    Streams users from the 'value' array of an OData JSON file asynchronously.
+    Memory stays bounded by read_size * read_ahead regardless of file size, see ODataStream.users(),
+    unless the bulk parser is selected. fields are the dotted paths of the fields that are needed,
+    which lets parsers that benefit from it skip the others; None reads every field.
     """
-    loop = asyncio.get_event_loop()
-    def generator():
-        with open(path, "r", encoding="utf-8") as f:
-            for user in ijson.items(f, "value.item"):
+    async with ODataStream(path, read_size, read_ahead, parser, memory_budget) as stream:
+        users = stream.users(fields=fields)
+        try:
+            async for user in users:
                 yield user
-    for user in await loop.run_in_executor(None, lambda: list(generator())):
-        yield user
+        finally:
+            # Stop the reader task before the file handle is closed
+            await users.aclose()
 
-async def write_json_stream(path, data_iterable):
+async def write_json_stream(path, data_iterable, encoder=None):
     """
     Writes transformed users to a JSON file as a simple array.
     Streams data without loading everything into memory.
     """
-    async with aiofiles.open(path, "w", encoding="utf-8") as f:
-        await f.write("[\n")
+    encoder = encoder or get_encoder()
+    async with aiofiles.open(path, "wb") as f:
+        await f.write(encoder.array_start)
         first = True
         async for item in data_iterable:
             if not first:
-                await f.write(",\n")
-            await f.write(json.dumps(item, ensure_ascii=False, indent=2))
+                await f.write(encoder.separator)
+            await f.write(encoder.encode(item))
             first = False
-        await f.write("\n]")
+        await f.write(encoder.array_end)
+
+def _write_file(path, render, batch):
+    data = render(batch)
+    # Write to a hidden temp file next to the target and rename it into place, so readers of
+    # the directory never see a partially written batch
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return len(data)
+
+async def write_rendered(path, render, batch):
+    """
+    Renders a batch into one buffer and writes the complete file with a single write.
+    Both steps run in the default thread pool, so rendering stays off the event loop and
+    opening, writing and closing the file costs one thread handoff instead of one per call.
+    The file appears atomically at path once it is complete. Returns the number of bytes written.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _write_file, path, render, batch)
+
+class BatchWriterPool:
+    """
+    Writes batch files with up to `writers` concurrent writer tasks fed from a bounded queue.
+    submit() waits while queue_depth batches are pending, which gives backpressure to the
+    producer. File names are chosen by the caller, so the order in which writes complete
+    does not affect the output.
+    Use as an async context manager to start and stop the writer tasks.
+    Write times are reported to metrics as the "write" stage.
+    """
+    def __init__(self, writers=4, queue_depth=None, metrics=None):
+        self.writers = writers
+        self.jobs = asyncio.Queue(maxsize=queue_depth or writers)
+        self.tasks = []
+        self.metrics = metrics or NULL_METRICS
+
+    async def __aenter__(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.writers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            for _ in self.tasks:
+                await self.jobs.put(None)
+            await asyncio.gather(*self.tasks)
+        else:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
 
-async def write_batches(output_dir, data_iterable, batch_size=100):
+    async def _worker(self):
+        while True:
+            job = await self.jobs.get()
+            if job is None:
+                return
+            path, render, batch, file, future = job
+            start = time.perf_counter() if self.metrics.enabled else 0.0
+            try:
+                size = await write_rendered(path, render, batch)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if self.metrics.enabled:
+                    self.metrics.observe("write", time.perf_counter() - start, file)
+                if not future.cancelled():
+                    future.set_result(size)
+
+    async def submit(self, path, render, batch, file=None):
+        """
+        Queues a batch for writing, waiting while the queue is full. file names the input file
+        the batch belongs to in metrics.
+        Returns a future that resolves to the number of bytes written once the file is in place.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self.metrics.enabled:
+            self.metrics.gauge("write_pool_queue", self.jobs.qsize())
+        await self.jobs.put((path, render, batch, file, future))
+        return future
+
+async def write_batches(output_dir, data_iterable, batch_size=100, encoder=None, sink=None, max_concurrent_writes=1):
     """
     Write batches of users to separate files asynchronously.
+    Each batch is rendered by the sink (JSON array by default) into one buffer and written
+    with a single write. Up to max_concurrent_writes batches are written at once.
+    """
+    sink = get_sink(sink, encoder)
+    pending = []
+
+    async with BatchWriterPool(max_concurrent_writes) as pool:
+        async def submit(batch):
+            batch_path = batch_file_path(output_dir, len(pending), sink.extension)
+            pending.append((batch_path, len(batch), await pool.submit(batch_path, sink.render_users, batch)))
+
+        batch = []
+        async for user in data_iterable:
+            batch.append(user)
+            if len(batch) == batch_size:
+                await submit(batch)
+                batch = []
+        if batch:
+            await submit(batch)
+
+    for batch_path, count, future in pending:
+        await future
+        logger.debug("Wrote %d users to %s", count, batch_path)
+
+# Directory inside output_dir that holds batches of input files that are still in progress
+STAGING_DIR = ".staging"
+
+def batch_file_path(output_dir, file_idx, extension=".json"):
+    """
+    Returns the path of the batch file with the given index.
+    """
+    return os.path.join(output_dir, f"users_{file_idx:03d}{extension}")
+
+class StagedBatchWriter:
+    """
+    Writes the batches of a single input file to a staging directory inside output_dir.
+    The batches only become visible as users_NNN.json files once commit() moves them into
+    place, so an input file that fails part way through can be discarded without leaving
+    partial output behind.
+    Users are passed in already encoded by the sink, so the writer only renders them into
+    one buffer per batch. With a BatchWriterPool, batches are written concurrently while
+    more users are added.
     """
-    batch = []
-    file_idx = 0
-    async for user in data_iterable:
-        batch.append(user)
-        if len(batch) == batch_size:
-            batch_path = os.path.join(output_dir, f"users_{file_idx:03d}.json")
-            await write_json_stream(batch_path, _async_iter(batch))
-            print(f"Wrote {len(batch)} users to {batch_path}")
-            batch = []
+    def __init__(self, output_dir, name, batch_size=100, sink=None, pool=None):
+        self.output_dir = output_dir
+        self.name = name
+        self.sink = get_sink(sink)
+        self.pool = pool
+        self.staging_dir = os.path.join(output_dir, STAGING_DIR, name)
+        self.batch_size = batch_size
+        self.batch = []
+        self.staged = []
+        # Names of the batch files, number of users and bytes moved into output_dir by commit()
+        self.committed = []
+        self.users = 0
+        self.bytes_written = 0
+        # Drop anything left behind by an earlier run that did not finish
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir)
+
+    async def add(self, encoded_users):
+        """
+        Adds serialized users, writing a staged batch file whenever batch_size users are pending.
+        """
+        self.batch.extend(encoded_users)
+        while len(self.batch) >= self.batch_size:
+            await self._write_batch(self.batch[:self.batch_size])
+            del self.batch[:self.batch_size]
+
+    def add_staged(self, parts):
+        """
+        Adds batch files that were already written to the staging directory, given as
+        (path, users, bytes) in order, behind the batches staged so far.
+        """
+        self.staged.extend(parts)
+
+    async def _write_batch(self, batch):
+        path = os.path.join(self.staging_dir, f"part_{len(self.staged):06d}{self.sink.extension}")
+        if self.pool is None:
+            written = await write_rendered(path, self.sink.render, batch)
+        else:
+            written = await self.pool.submit(path, self.sink.render, batch, self.name)
+        self.staged.append((path, len(batch), written))
+
+    async def _wait_for_writes(self):
+        # Raises the first write error only after every write has finished, and returns the
+        # number of bytes written
+        written = [size for _, _, size in self.staged if isinstance(size, int)]
+        futures = [future for _, _, future in self.staged if not isinstance(future, int)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return sum(written) + sum(results)
+
+    async def commit(self, file_idx):
+        """
+        Flushes the last partial batch, waits until all staged batches are written and moves
+        them into output_dir in order, numbering them from file_idx. Returns the next free file index.
+        """
+        if self.batch:
+            await self._write_batch(self.batch)
+            self.batch = []
+        self.bytes_written += await self._wait_for_writes()
+        for path, count, _ in self.staged:
+            batch_path = batch_file_path(self.output_dir, file_idx, self.sink.extension)
+            os.replace(path, batch_path)
+            self.committed.append(os.path.basename(batch_path))
+            self.users += count
+            logger.debug("Wrote %d users to %s", count, batch_path)
             file_idx += 1
-    if batch:
-        batch_path = os.path.join(output_dir, f"users_{file_idx:03d}.json")
-        await write_json_stream(batch_path, _async_iter(batch))
-        print(f"Wrote {len(batch)} users to {batch_path}")
-
-async def _async_iter(iterable):
-    for item in iterable:
-        yield item
+        self.staged = []
+        await self.discard()
+        return file_idx
+
+    async def discard(self):
+        """
+        Removes the staging directory together with any batches that were not committed,
+        once writes that are still in flight have finished.
+        """
+        self.batch = []
+        try:
+            await self._wait_for_writes()
+        except Exception:
+            pass
+        self.staged = []
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+def remove_staging_dir(output_dir):
+    """
+    Removes the staging directory of output_dir if no input file is using it anymore.
+    """
+    try:
+        os.rmdir(os.path.join(output_dir, STAGING_DIR))
+    except OSError:
+        pass
+
+def remove_batch_files(output_dir, names):
+    """
+    Removes batch files of output_dir by name, ignoring files that are already gone.
+    """
+    for name in names:
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except FileNotFoundError:
+            pass
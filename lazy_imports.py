@@ -0,0 +1,50 @@
+import importlib
+import importlib.util
+import sys
+
+class LazyModule:
+    """
+    Stands in for a module that is only imported when one of its attributes is first used,
+    so that short runs and the command line do not pay for packages they never touch.
+    The import goes through importlib, which holds the module's import lock, so threads that
+    first use the module at the same time all see it fully initialized. The module's
+    attributes are then copied onto the stand-in, so later lookups cost as much as on the
+    module itself.
+    """
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+def lazy_import(name):
+    """
+    Returns a LazyModule for an optional package if it is installed, or None if it is not,
+    in place of a try: import / except ImportError: None block. Packages that are already
+    imported are returned as they are.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    return LazyModule(name) if spec is not None else None
+
+class lazy_attribute:
+    """
+    Class attribute whose value is an attribute of another module, imported on first access.
+    Lets a class refer to something costly to import without importing it with the class.
+    """
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        return getattr(importlib.import_module(self.module), self.name)
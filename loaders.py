@@ -0,0 +1,303 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import NULL_METRICS
+from lazy_imports import LazyModule, lazy_import
+
+sqlite3 = LazyModule("sqlite3")
+asyncpg = lazy_import("asyncpg")
+
+# Columns of the users table, in the order of the rows produced by user_rows()
+USER_COLUMNS = (
+    "Id", "external_id", "mail", "type", "location", "is_enabled", "first_name", "last_name", "signInActivity",
+)
+# Name of the SQLite database created in the output directory by the "sqlite" loader
+SQLITE_FILE = "users.sqlite"
+
+def user_rows(users):
+    """
+    Turns transformed users into row tuples in USER_COLUMNS order. signInActivity is stored
+    as compact JSON text. Runs in the executor backend next to the transformation, so it must
+    stay a plain module-level function that process workers can import.
+    """
+    rows = []
+    append = rows.append
+    for user in users:
+        activity = user.get("signInActivity")
+        if activity is not None:
+            activity = json.dumps(activity, ensure_ascii=False, separators=(",", ":"))
+        append((
+            user.get("Id"), user.get("external_id"), user.get("mail"), user.get("type"), user.get("location"),
+            user.get("is_enabled"), user.get("first_name"), user.get("last_name"), activity,
+        ))
+    return rows
+
+class BaseLoader:
+    """
+    Loads transformed users into a database in batches of batch_size rows, upserting on Id.
+    Up to max_concurrent_loads batches are loaded at once by worker tasks fed from a bounded
+    queue, which gives backpressure to the pipeline like BatchWriterPool does for files.
+    Subclasses implement open(), load_rows() and close() for their database. to_rows turns
+    transformed users into rows in the executor backend.
+    start() opens the database and starts the workers, stop() stops them and closes it.
+    Load times are reported to metrics as the "load" stage.
+    """
+    name = None
+    to_rows = staticmethod(user_rows)
+
+    def __init__(self, batch_size=1000, max_concurrent_loads=4, queue_depth=None):
+        self.batch_size = batch_size
+        self.max_concurrent_loads = max_concurrent_loads
+        self.queue_depth = queue_depth or max_concurrent_loads
+        self.metrics = NULL_METRICS
+        self.jobs = None
+        self.tasks = []
+
+    async def open(self):
+        pass
+
+    async def load_rows(self, rows):
+        """
+        Upserts a batch of rows. Must be safe to call from several tasks at once.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def start(self, metrics=None):
+        self.metrics = metrics or NULL_METRICS
+        try:
+            await self.open()
+        except BaseException:
+            await self.close()
+            raise
+        self.jobs = asyncio.Queue(maxsize=self.queue_depth)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent_loads)]
+
+    async def stop(self, cancel=False):
+        """
+        Waits for the queued batches and closes the database, or drops them with cancel=True.
+        """
+        try:
+            if cancel:
+                for task in self.tasks:
+                    task.cancel()
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            else:
+                for _ in self.tasks:
+                    await self.jobs.put(None)
+                await asyncio.gather(*self.tasks)
+        finally:
+            self.tasks = []
+            await self.close()
+
+    async def _worker(self):
+        while True:
+            job = await self.jobs.get()
+            if job is None:
+                return
+            rows, file, future = job
+            start = time.perf_counter() if self.metrics.enabled else 0.0
+            try:
+                await self.load_rows(rows)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if self.metrics.enabled:
+                    self.metrics.observe("load", time.perf_counter() - start, file)
+                if not future.cancelled():
+                    future.set_result(len(rows))
+
+    async def submit(self, rows, file=None):
+        """
+        Queues a batch of rows for loading, waiting while the queue is full. file names the
+        input file the rows belong to in metrics.
+        Returns a future that resolves to the number of rows once they are loaded.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self.metrics.enabled:
+            self.metrics.gauge("load_queue", self.jobs.qsize())
+        await self.jobs.put((rows, file, future))
+        return future
+
+class FileLoad:
+    """
+    Collects the rows of one input file and submits them to a loader in batches of the
+    loader's batch_size. finish() waits until every batch of the file is loaded.
+    """
+    def __init__(self, loader, name):
+        self.loader = loader
+        self.name = name
+        self.rows = []
+        self.pending = []
+
+    async def add(self, rows):
+        self.rows.extend(rows)
+        batch_size = self.loader.batch_size
+        while len(self.rows) >= batch_size:
+            self.pending.append(await self.loader.submit(self.rows[:batch_size], self.name))
+            del self.rows[:batch_size]
+
+    async def finish(self):
+        """
+        Submits the last partial batch and waits for all batches of the file. Raises the first
+        load error only after every batch has finished. Returns the number of rows loaded.
+        """
+        if self.rows:
+            self.pending.append(await self.loader.submit(self.rows, self.name))
+            self.rows = []
+        results = await asyncio.gather(*self.pending, return_exceptions=True)
+        self.pending = []
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return sum(results)
+
+    async def discard(self):
+        """
+        Drops rows that were not submitted and waits for batches still in flight.
+        """
+        self.rows = []
+        await asyncio.gather(*self.pending, return_exceptions=True)
+        self.pending = []
+
+class DbApiLoader(BaseLoader):
+    """
+    Loads rows through a pool of DB-API 2.0 connections made by connect(). Blocking database
+    calls run on one dedicated thread per connection, and each batch is inserted with one
+    executemany() of upsert_sql and committed, on whichever connection is free.
+    """
+    name = "dbapi"
+
+    def __init__(self, connect, upsert_sql, batch_size=1000, max_concurrent_loads=4, queue_depth=None):
+        super().__init__(batch_size, max_concurrent_loads, queue_depth)
+        self.connect = connect
+        self.upsert_sql = upsert_sql
+        self.pool = None
+        self.connections = []
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.pool = asyncio.Queue()
+        for _ in range(self.max_concurrent_loads):
+            executor = ThreadPoolExecutor(max_workers=1)
+            connection = await loop.run_in_executor(executor, self.connect)
+            self.connections.append((connection, executor))
+            self.pool.put_nowait((connection, executor))
+
+    def _load(self, connection, rows):
+        try:
+            connection.cursor().executemany(self.upsert_sql, rows)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    async def load_rows(self, rows):
+        connection, executor = await self.pool.get()
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, self._load, connection, rows)
+        finally:
+            self.pool.put_nowait((connection, executor))
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        connections, self.connections = self.connections, []
+        for connection, executor in connections:
+            try:
+                await loop.run_in_executor(executor, connection.close)
+            finally:
+                executor.shutdown(wait=True)
+
+def upsert_statement(table, columns=USER_COLUMNS, placeholder="?"):
+    """
+    Returns an INSERT ... ON CONFLICT ("Id") DO UPDATE statement for the given columns, in
+    the syntax shared by SQLite and PostgreSQL. placeholder is "?" for qmark DB-API drivers or
+    "$" for numbered $1, $2, ... parameters.
+    """
+    names = ", ".join(f'"{column}"' for column in columns)
+    if placeholder == "$":
+        values = ", ".join(f"${index}" for index in range(1, len(columns) + 1))
+    else:
+        values = ", ".join(placeholder for _ in columns)
+    updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns if column != "Id")
+    return f'INSERT INTO "{table}" ({names}) VALUES ({values}) ON CONFLICT ("Id") DO UPDATE SET {updates}'
+
+class SqliteLoader(DbApiLoader):
+    """
+    Reference loader: upserts into a table of an SQLite database in WAL mode, so the loaded
+    users can be read while a run is still writing. SQLite has a single writer, so concurrent
+    batches queue up on its lock (waiting up to timeout seconds) while their rows are prepared.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, table="users", batch_size=1000, max_concurrent_loads=2, queue_depth=None, timeout=60.0):
+        super().__init__(self._connect, upsert_statement(table), batch_size, max_concurrent_loads, queue_depth)
+        self.path = path
+        self.table = table
+        self.timeout = timeout
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        connection.executescript(f"""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS "{self.table}" (
+                "Id" TEXT PRIMARY KEY, "external_id" TEXT, "mail" TEXT, "type" TEXT, "location" TEXT,
+                "is_enabled" INTEGER, "first_name" TEXT, "last_name" TEXT, "signInActivity" TEXT
+            );
+        """)
+        return connection
+
+class AsyncpgLoader(BaseLoader):
+    """
+    Upserts into a PostgreSQL table through an asyncpg connection pool, one executemany() per
+    batch. signInActivity is stored as jsonb. Requires asyncpg.
+    """
+    name = "asyncpg"
+
+    def __init__(self, dsn, table="users", batch_size=5000, max_concurrent_loads=4, queue_depth=None):
+        if asyncpg is None:
+            raise ValueError("The asyncpg loader requires the asyncpg package")
+        super().__init__(batch_size, max_concurrent_loads, queue_depth)
+        self.dsn = dsn
+        self.table = table
+        self.upsert_sql = upsert_statement(table, placeholder="$").replace("$9)", "$9::jsonb)")
+        self.pool = None
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.max_concurrent_loads)
+        await self.pool.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{self.table}" (
+                "Id" TEXT PRIMARY KEY, "external_id" TEXT, "mail" TEXT, "type" TEXT, "location" TEXT,
+                "is_enabled" BOOLEAN, "first_name" TEXT, "last_name" TEXT, "signInActivity" JSONB
+            )
+        """)
+
+    async def load_rows(self, rows):
+        async with self.pool.acquire() as connection:
+            await connection.executemany(self.upsert_sql, rows)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+LOADERS = {
+    "sqlite": lambda output_dir: SqliteLoader(os.path.join(output_dir, SQLITE_FILE)),
+}
+
+def get_loader(loader, output_dir):
+    """
+    Returns the loader for the given name, the loader itself if one is passed in, or None.
+    "sqlite" loads into users.sqlite in output_dir.
+    """
+    if loader is None or not isinstance(loader, str):
+        return loader
+    if loader not in LOADERS:
+        raise ValueError(f"Unknown loader: {loader}. Expected one of {', '.join(LOADERS)}")
+    return LOADERS[loader](output_dir)
@@ -1,137 +1,283 @@
 from transformer import UserTransformer, BaseTransformer
-from io_utils import aread_json_stream, write_batches
+from routing import TRANSFORMERS
+from io_utils import ODataStream, remove_staging_dir, remove_batch_files, write_rendered
+from executors import get_executor_backend, ENGINES, EXECUTOR_BACKENDS
+from encoders import get_encoder, ENCODERS
+from sinks import get_sink, SINKS
+from manifest import Manifest
+from delta import DeltaIndex
+from external_ids import get_external_id_strategy, EXTERNAL_ID_STRATEGIES
+from metrics import NULL_METRICS, RunMetrics
+from sharding import SHARD_MIN_SIZE
+from parsers import describe_parser, PARSE_MEMORY_BUDGET, PARSERS
+from loaders import get_loader, LOADERS
+from pipeline import Pipeline
+import argparse
 import asyncio
+import collections
+import logging
 import os
 import glob
-import json
-import aiofiles
+import sys
 
-# Registry for OData context to transformer mapping
-ODATA_TRANSFORMER_MAP = {
-    "users": UserTransformer,
-    # Add more mappings here as needed
-}
+logger = logging.getLogger(__name__)
+
+# Registry for OData context to transformer mapping. New entity types are registered with
+# routing.register_transformer (or ODATA_TRANSFORMER_MAP[path] = cls) from any module.
+ODATA_TRANSFORMER_MAP = TRANSFORMERS
 
 def get_transformer_class_from_odata(context: str):
     """
-    Selects the transformer class based on the OData context string.
+    Selects the transformer class based on the entity-set path of the OData context string.
     """
-    if not context:
-        return UserTransformer
-    for key, cls in ODATA_TRANSFORMER_MAP.items():
-        if key in context:
-            return cls
-    return UserTransformer
+    return ODATA_TRANSFORMER_MAP.route(context)[1]
 
 async def get_odata_context(file_path):
     """
     Reads the @odata.context field from the JSON file header asynchronously.
     """
-    async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-        # Read a small chunk to parse the header
-        content = await f.read(2048)
-        try:
-            data = json.loads(content)
-            return data.get("@odata.context", "")
-        except Exception:
-            return ""
-
-async def process_users(input_directory, output_dir, chunk_size=100, max_concurrent_files=2):
-    """
-    Processes user data from multiple JSON files.
-    Writes every 100 transformed users to a separate JSON file in output_dir.
-    Limits the number of concurrently processed files with max_concurrent_files.
-    Automatically selects the transformer based on the OData context.
-    """
-    file_errors = []
-
-    # Ensure output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    async def process_file(file_path, semaphore, results):
-        # Process a single file, respecting the concurrency limit.
-        async with semaphore:
-            try:
-                # Detect transformer from OData context
-                context = await get_odata_context(file_path)
-                transformer_class = get_transformer_class_from_odata(context)
-                transformer = transformer_class()
-                print(f"Processing file: {os.path.basename(file_path)} with transformer: {transformer_class.__name__}")
-                users = aread_json_stream(file_path)
-            except Exception as e:
-                # Record and skip files that fail to read
-                file_errors.append((file_path, f"Read error: {e}"))
-                return
-
-            file_failed = False
-            file_results = []
-
-            while True:
-                # Read users in chunks for parallel transformation
-                chunk = []
-                try:
-                    async for user in users:
-                        chunk.append(user)
-                        if len(chunk) == chunk_size:
-                            break
-                except Exception as e:
-                    # Record and skip files that fail to read a chunk
-                    file_errors.append((file_path, f"Chunk read error: {e}"))
-                    file_failed = True
-                    break
-
-                if not chunk:
-                    break
-
-                try:
-                    # Transform users in parallel using asyncio and thread pool
-                    loop = asyncio.get_running_loop()
-                    chunk_results = await asyncio.gather(
-                        *(loop.run_in_executor(None, transformer.transform, user) for user in chunk)
-                    )
-                    file_results.extend(chunk_results)
-                except Exception as e:
-                    # Record and skip files that fail to transform a chunk
-                    file_errors.append((file_path, f"Chunk transform error: {e}"))
-                    file_failed = True
-                    break
-
-            if not file_failed:
-                # Collect transformed users from successfully processed files
-                results.extend(file_results)
-
-    async def transformed_users_generator():
-        # Find all JSON files in the input directory
-        json_files = glob.glob(os.path.join(input_directory, "*.json"))
-        json_files.sort()
-        print(f"Processing {len(json_files)} JSON files from {input_directory}")
-
-        # Semaphore to limit concurrent file processing
-        semaphore = asyncio.Semaphore(max_concurrent_files)
-        results = []
-        # Launch file processing tasks with concurrency control
-        tasks = [process_file(file_path, semaphore, results) for file_path in json_files]
-        await asyncio.gather(*tasks)
-        # Yield all transformed users
-        for result in results:
-            yield result
+    async with ODataStream(file_path) as stream:
+        return await stream.read_context()
+
+# Options of process_users, which also takes them one by one as keyword arguments. See the
+# Configuration section of the README for what each of them does.
+ProcessOptions = collections.namedtuple("ProcessOptions", [
+    # Pipeline: users per chunk, files read at once, chunks waiting between the stages
+    "chunk_size", "max_concurrent_files", "queue_depth",
+    # Transformation
+    "executor", "max_workers", "engine", "external_ids",
+    # Output
+    "encoder", "indent", "sink", "batch_size", "max_concurrent_writes",
+    # Incremental and delta runs
+    "incremental", "delta", "tombstones",
+    # Parsing and sharding
+    "parser", "parse_memory_budget", "shards", "shard_min_size",
+    # Database loading
+    "loader", "write_files",
+    # Daemon: the input files of the run, None for all of them
+    "files",
+    # Metrics hook, see metrics.RunMetrics
+    "metrics",
+], defaults=[
+    100, 2, 4,
+    "thread", None, "record", None,
+    None, None, "json", None, 4,
+    True, False, False,
+    None, PARSE_MEMORY_BUDGET, 1, SHARD_MIN_SIZE,
+    None, True,
+    None,
+    None,
+])
+
+def check_options(options):
+    """
+    Raises ValueError for options that cannot be combined.
+    """
+    if options.engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {options.engine}. Expected one of {', '.join(ENGINES)}")
+    if options.delta and options.shards > 1:
+        raise ValueError("Delta mode cannot be combined with sharded files")
+    if options.loader is not None and options.shards > 1:
+        raise ValueError("Loaders cannot be combined with sharded files")
+    if options.loader is None and not options.write_files:
+        raise ValueError("A loader is required when batch files are not written")
+    if options.files is not None and not options.incremental:
+        # Starting over would drop the committed batches of the files left out
+        raise ValueError("Selected files cannot be processed with incremental=False")
+
+def load_manifest(output_dir, options, sink, loader):
+    """
+    Returns the manifest of output_dir, which is started over if the options that change the
+    contents of batch files differ from those it was written with, or with incremental=False.
+    """
+    # Encoders and engines differ in how they write some floats, see encoders.JsonEncoder
+    encoder_name = sink.encoder.name if getattr(sink, "encoder", None) is not None else None
+    settings = {"sink": sink.name, "encoder": encoder_name, "engine": options.engine, "batch_size": options.batch_size,
+                "indent": sink.indent, "external_ids": options.external_ids.name, "delta": options.delta}
+    if loader is not None:
+        settings.update(loader=loader.name, write_files=options.write_files)
+    manifest = Manifest.load(output_dir, settings)
+    if not options.incremental:
+        manifest.reset()
+    remove_batch_files(output_dir, manifest.stale_batches)
+    return manifest
+
+async def find_input_files(input_directory, manifest, files=None):
+    """
+    Returns (files to process, names of the files skipped as unchanged, names of the files
+    left out by files) for the *.json files of input_directory, in name order.
+    """
+    json_files = sorted(glob.glob(os.path.join(input_directory, "*.json")))
+    # Files of the directory that were not asked for are neither processed nor tombstoned
+    other_files = []
+    if files is not None:
+        names = {os.path.basename(file_path) for file_path in files}
+        other_files = [os.path.basename(file_path) for file_path in json_files if os.path.basename(file_path) not in names]
+        json_files = [file_path for file_path in json_files if os.path.basename(file_path) in names]
+
+    async def transformer_of(file_path):
+        # Files are read again when a route registered since sends them to another transformer
+        return ODATA_TRANSFORMER_MAP.route(await get_odata_context(file_path))[1].__name__
+
+    changed_files = [file_path for file_path in json_files if not await manifest.is_unchanged(file_path, transformer_of)]
+    skipped_files = [os.path.basename(file_path) for file_path in json_files if file_path not in changed_files]
+    return changed_files, skipped_files, other_files
+
+async def write_tombstones(delta_index, output_dir, encoder, batch_size):
+    """
+    Writes the ids that disappeared since the last run, one JSON array of ids per file.
+    """
+    tombstone_encoder = get_encoder(encoder)
+    async for ids in delta_index.tombstones(batch_size):
+        path = os.path.join(output_dir, f"tombstones_{await delta_index.next_tombstone_index():03d}.json")
+        await write_rendered(path, tombstone_encoder.encode_array, ids)
+        logger.info("Wrote %d tombstones to %s", len(ids), path)
+
+async def process_users(input_directory, output_dir, options=None, **kwargs):
+    """
+    Transforms the OData JSON files of input_directory into batch files in output_dir (see
+    pipeline.Pipeline), skipping files committed unchanged by an earlier run.
+    Options are given as a ProcessOptions, or as its fields by keyword, which override those
+    of options; the Configuration section of the README describes them.
+    Returns the (file path, error) pairs of the files that failed.
+    """
+    # Unknown keyword arguments raise TypeError, as they would for a function parameter
+    options = ProcessOptions(**{**(options or ProcessOptions())._asdict(), **kwargs})
+    check_options(options)
+    loader = get_loader(options.loader, output_dir)
+    # Also rejects unknown or missing parsers before any output is touched
+    parser_description = describe_parser(options.parser, options.parse_memory_budget)
+    metrics = options.metrics or NULL_METRICS
+    os.makedirs(output_dir, exist_ok=True)
 
+    options = options._replace(batch_size=options.batch_size or options.chunk_size,
+                               external_ids=get_external_id_strategy(options.external_ids))
+    sink = get_sink(options.sink, get_encoder(options.encoder, options.indent))
+    manifest = load_manifest(output_dir, options, sink, loader)
+    json_files, skipped_files, other_files = await find_input_files(input_directory, manifest, options.files)
+    if skipped_files:
+        logger.info("Skipping %d unchanged files", len(skipped_files))
+        metrics.count("files_skipped", len(skipped_files))
+    logger.info("Processing %d JSON files from %s", len(json_files), input_directory)
+
+    backend = get_executor_backend(options.executor, options.max_workers)
+    logger.info("Transforming with executor backend: %s (%d workers), sink: %s", backend.name, backend.max_workers, sink.name)
+    logger.info("Parsing with: %s", parser_description)
+    if loader is not None:
+        logger.info("Loading with: %s (batches of %d, %d concurrent)%s", loader.name, loader.batch_size,
+                    loader.max_concurrent_loads, "" if options.write_files else ", no batch files")
+    metrics.start_run(
+        input_directory=input_directory, output_dir=output_dir, executor=backend.name, max_workers=backend.max_workers,
+        engine=options.engine, sink=sink.name, chunk_size=options.chunk_size, batch_size=options.batch_size,
+        files=len(json_files), parser=parser_description, loader=loader.name if loader is not None else None,
+    )
+
+    delta_index = DeltaIndex(output_dir) if options.delta else None
     try:
-        # Write transformed users in batches to output directory asynchronously
-        await write_batches(output_dir, transformed_users_generator(), chunk_size)
-    except Exception as e:
-        raise e
+        if delta_index is not None:
+            await delta_index.start_run(skipped_files + other_files)
+        if loader is not None:
+            await loader.start(metrics)
+        pipeline = Pipeline(output_dir, options, sink, manifest, backend, loader, delta_index, metrics)
+        file_errors = await pipeline.run(json_files)
+        if loader is not None:
+            await loader.stop()
+        # Keep mtimes of files that were found unchanged by their hash
+        manifest.save()
+        if delta_index is not None:
+            if options.tombstones:
+                await write_tombstones(delta_index, output_dir, options.encoder, options.batch_size)
+            else:
+                await delta_index.remove_tombstones()
+    finally:
+        remove_staging_dir(output_dir)
+        if loader is not None and loader.tasks:
+            # Batches of a run that failed are dropped; the files they belong to were not recorded
+            await loader.stop(cancel=True)
+        if delta_index is not None:
+            await delta_index.close()
+        if backend is not options.executor:
+            backend.close()
 
-    # Print any errors encountered during processing
+    metrics.finish()
+
+    # Report any errors encountered during processing
     if file_errors:
-        print("\nErrors occurred while processing files:")
+        logger.error("Errors occurred while processing files:")
         for file_path, error in file_errors:
-            print(f"{file_path}: {error}")
+            logger.error("%s: %s", file_path, error)
+    return file_errors
 
-if __name__ == "__main__":
+def add_process_arguments(parser):
+    """
+    Adds the options that map one to one to process_users arguments to an argparse parser.
+    """
+    parser.add_argument("--chunk-size", type=int, default=100, help="users per transformed chunk (default: 100)")
+    parser.add_argument("--batch-size", type=int, help="users per batch file (default: chunk size)")
+    parser.add_argument("--max-concurrent-files", type=int, default=2, help="input files read at once (default: 2)")
+    parser.add_argument("--queue-depth", type=int, default=4, help="chunks waiting between stages (default: 4)")
+    parser.add_argument("--max-concurrent-writes", type=int, default=4, help="batch files written at once (default: 4)")
+    parser.add_argument("--executor", choices=EXECUTOR_BACKENDS, default="thread", help="transform backend (default: thread)")
+    parser.add_argument("--max-workers", type=int, help="threads or processes of the executor (default: by CPU count)")
+    parser.add_argument("--engine", choices=ENGINES, default="record", help="transformation engine (default: record)")
+    parser.add_argument("--parser", choices=PARSERS, help="input parser (default: selected per file)")
+    parser.add_argument("--parse-memory-budget", type=int, default=PARSE_MEMORY_BUDGET,
+                        help="largest file in bytes decoded in bulk by parser auto-selection")
+    parser.add_argument("--sink", choices=SINKS, default="json", help="batch file format (default: json)")
+    parser.add_argument("--encoder", choices=ENCODERS, help="JSON encoder (default: fastest installed)")
+    parser.add_argument("--indent", type=int, help="indentation of the output JSON (default: compact)")
+    parser.add_argument("--loader", choices=LOADERS, help="also load the users into a database")
+    parser.add_argument("--no-files", dest="write_files", action="store_false",
+                        help="only load the users with --loader, without writing batch files")
+    parser.add_argument("--full", dest="incremental", action="store_false", help="process unchanged files again")
+    parser.add_argument("--delta", action="store_true", help="only write new and changed users")
+    parser.add_argument("--tombstones", action="store_true", help="write the ids of deleted users in delta mode")
+    parser.add_argument("--external-ids", choices=EXTERNAL_ID_STRATEGIES, help="how missing external ids are generated")
+    parser.add_argument("--shards", type=int, default=1, help="byte ranges each large file is split into (default: 1)")
+    parser.add_argument("--shard-min-size", type=int, default=SHARD_MIN_SIZE, help="smallest file in bytes that is split")
+
+def add_logging_arguments(parser):
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true", help="also log every batch file")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+
+def configure_logging(args):
+    """
+    Sets up logging for the -v/-q options and removes them from the parsed arguments dict.
+    """
+    verbose, quiet = args.pop("verbose"), args.pop("quiet")
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING if quiet else logging.INFO, format="%(message)s")
+
+def build_arg_parser():
+    """
+    Returns the command line parser of main(). Options map one to one to process_users arguments.
+    """
+    parser = argparse.ArgumentParser(description="Transforms Microsoft Graph users exports into batch files.")
+    parser.add_argument("input_directory", nargs="?", default="usersapi", help="directory of OData JSON files (default: usersapi)")
+    parser.add_argument("output_dir", nargs="?", default="transformed_users", help="output directory (default: transformed_users)")
+    add_process_arguments(parser)
+    parser.add_argument("--metrics-json", help="write a JSON run summary to this path")
+    parser.add_argument("--metrics-textfile", help="write Prometheus text format metrics to this path")
+    add_logging_arguments(parser)
+    return parser
+
+def main(argv=None):
+    """
+    Command line entry point. Returns the exit status: 0 on success, 1 if any file failed or
+    the run could not start.
+    """
+    args = vars(build_arg_parser().parse_args(argv))
+    configure_logging(args)
+    metrics_json, metrics_textfile = args.pop("metrics_json"), args.pop("metrics_textfile")
+    if metrics_json or metrics_textfile:
+        args["metrics"] = RunMetrics(metrics_json, metrics_textfile)
     try:
         # Run the user processing pipeline asynchronously
-        asyncio.run(process_users("usersapi", "transformed_users"))
+        file_errors = asyncio.run(process_users(**args))
     except Exception as e:
-        print(f"Fatal error: {e}")
\ No newline at end of file
+        logger.error("Fatal error: %s", e)
+        return 1
+    return 1 if file_errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_READ_SIZE = 1024 * 1024
+
+def hash_file(path):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(HASH_READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+def fingerprint_file(path):
+    """
+    Returns the size, mtime and content hash of a file. The file is stat'ed before it is
+    hashed, so a change made while hashing shows up as a changed mtime on the next run.
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": hash_file(path)}
+
+class Manifest:
+    """
+    Record of the input files already processed into output_dir, stored as manifest.json next
+    to the batch files.
+    Every committed input file is listed with its size, mtime, content hash, the transformer
+    used and the batch files it produced, together with the next free batch index. The
+    manifest is saved after every committed file, so a run that crashes resumes after the
+    last committed file.
+    settings holds the options that change the contents of batch files (sink, encoder, engine,
+    batch size, indent, external id strategy, delta mode). A manifest written with different settings is
+    ignored and everything is processed again.
+    """
+    def __init__(self, output_dir, settings=None):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.settings = settings or {}
+        self.files = {}
+        self.next_index = 0
+        # Batch files of the loaded manifest that are not listed anymore and can be removed
+        self.stale_batches = []
+
+    @classmethod
+    def load(cls, output_dir, settings=None):
+        """
+        Loads the manifest of output_dir, or returns an empty one if there is none or it was
+        written with other settings.
+        """
+        manifest = cls(output_dir, settings)
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") != MANIFEST_VERSION:
+            return manifest
+        if data.get("settings") != manifest.settings:
+            # Batches written with other settings are replaced by this run
+            manifest.stale_batches = [batch for entry in data.get("files", {}).values() for batch in entry["batches"]]
+            return manifest
+        manifest.files = data.get("files", {})
+        manifest.next_index = data.get("next_index", 0)
+        return manifest
+
+    def reset(self):
+        """
+        Forgets all committed files so everything is processed again from batch index 0.
+        Their batch files are added to stale_batches.
+        """
+        self.stale_batches.extend(batch for entry in self.files.values() for batch in entry["batches"])
+        self.files = {}
+        self.next_index = 0
+
+    async def is_unchanged(self, path, transformer_of=None):
+        """
+        Returns True if the input file was committed before and has not changed since.
+        Size and mtime are compared first; the content is only hashed when the size matches
+        but the mtime does not.
+        transformer_of is an optional coroutine function returning the name of the transformer
+        the file would be read with now. It is only awaited for files whose content is unchanged,
+        and a file that would be read with another transformer than recorded counts as changed.
+        """
+        entry = self.files.get(os.path.basename(path))
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(None, hash_file, path)
+            if digest != entry["sha256"]:
+                return False
+            # Same content with a new mtime, e.g. after a copy; remember it to skip the hash next time
+            entry["mtime_ns"] = stat.st_mtime_ns
+        return transformer_of is None or await transformer_of(path) == entry["transformer"]
+
+    def record(self, path, fingerprint, transformer, batches, users):
+        """
+        Records a committed input file and the batch files it produced. Batch files that an
+        earlier version of the file produced are returned so the caller can remove them once
+        the manifest is saved.
+        """
+        name = os.path.basename(path)
+        previous = self.files.get(name)
+        self.files[name] = dict(fingerprint, transformer=transformer, batches=batches, users=users)
+        if previous is None:
+            return []
+        return [batch for batch in previous["batches"] if batch not in batches]
+
+    def save(self):
+        """
+        Writes the manifest to a temp file and renames it into place, so an interrupted save
+        leaves the previous manifest intact.
+        """
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "next_index": self.next_index,
+            "files": self.files,
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,216 @@
+import json
+import os
+import time
+
+class NullMetrics:
+    """
+    Metrics hook of process_users that records nothing.
+    A metrics hook receives stage timings with observe(), totals with count() and sampled
+    values such as queue depths with gauge(), optionally attributed to an input file.
+    The pipeline only measures anything when enabled is True, so the disabled hook costs
+    one attribute check per chunk.
+    """
+    enabled = False
+
+    def start_run(self, **info):
+        pass
+
+    def observe(self, stage, seconds, file=None):
+        pass
+
+    def count(self, name, value=1, file=None):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def finish(self):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+class RunMetrics(NullMetrics):
+    """
+    Collects the metrics of one process_users run in memory and exports them when the run
+    finishes: as a JSON run summary to json_path and in the Prometheus text format to
+    textfile_path (for the node_exporter textfile collector). Both files are written to a
+    temp file and renamed into place, so scrapers never read a partial file.
+    Stages reported by process_users are header (OData context sniffing), parse, transform,
+    encode and write, shard (parsing, transforming and writing one byte range of a sharded
+    file) and load (upserting one batch of rows with a loader). Counters are users_in,
+    users_out, users_loaded, bytes_in, bytes_out, batches and files_committed, files_failed
+    and files_skipped.
+    """
+    enabled = True
+
+    def __init__(self, json_path=None, textfile_path=None, prefix="usersformatter"):
+        self.json_path = json_path
+        self.textfile_path = textfile_path
+        self.prefix = prefix
+        self.info = {}
+        # stage -> [calls, total seconds, max seconds]
+        self.stages = {}
+        self.counters = {}
+        # gauge -> [samples, sum, max]
+        self.gauges = {}
+        # file -> {"stages": {stage: seconds}, counter: value}
+        self.files = {}
+        self.started = None
+        self.start_time = None
+        self.duration = None
+
+    def start_run(self, **info):
+        self.info = info
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+
+    def _file(self, file):
+        stats = self.files.get(file)
+        if stats is None:
+            stats = self.files[file] = {"stages": {}}
+        return stats
+
+    def observe(self, stage, seconds, file=None):
+        stats = self.stages.get(stage)
+        if stats is None:
+            self.stages[stage] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+        if file is not None:
+            file_stages = self._file(file)["stages"]
+            file_stages[stage] = file_stages.get(stage, 0.0) + seconds
+
+    def count(self, name, value=1, file=None):
+        self.counters[name] = self.counters.get(name, 0) + value
+        if file is not None:
+            stats = self._file(file)
+            stats[name] = stats.get(name, 0) + value
+
+    def gauge(self, name, value):
+        stats = self.gauges.get(name)
+        if stats is None:
+            self.gauges[name] = [1, value, value]
+        else:
+            stats[0] += 1
+            stats[1] += value
+            if value > stats[2]:
+                stats[2] = value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+        if self.json_path:
+            self.write_json(self.json_path)
+        if self.textfile_path:
+            self.write_textfile(self.textfile_path)
+
+    def _elapsed(self):
+        if self.duration is not None:
+            return self.duration
+        return time.perf_counter() - self.started if self.started is not None else 0.0
+
+    def executor_utilization(self):
+        """
+        Returns the share of the executor's capacity spent transforming and encoding, or on
+        shards: worker busy time divided by wall time times the number of workers.
+        """
+        elapsed = self._elapsed()
+        workers = self.info.get("max_workers") or 1
+        busy = sum(self.stages.get(stage, (0, 0.0))[1] for stage in ("transform", "encode", "shard"))
+        return busy / (elapsed * workers) if elapsed else 0.0
+
+    def summary(self):
+        """
+        Returns the metrics of the run as a JSON-serializable dict.
+        """
+        elapsed = self._elapsed()
+        return {
+            "info": self.info,
+            "start_time": self.start_time,
+            "duration_seconds": elapsed,
+            "users_per_sec": self.counters.get("users_in", 0) / elapsed if elapsed else 0.0,
+            "executor_utilization": self.executor_utilization(),
+            "counters": dict(self.counters),
+            "stages": {
+                stage: {"calls": calls, "seconds": total, "max_seconds": longest}
+                for stage, (calls, total, longest) in self.stages.items()
+            },
+            "gauges": {
+                name: {"samples": samples, "mean": total / samples, "max": largest}
+                for name, (samples, total, largest) in self.gauges.items()
+            },
+            "files": self.files,
+        }
+
+    def prometheus_text(self):
+        """
+        Returns the metrics of the run in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        lines = []
+        metric = lambda name, *args: lines.extend(prometheus_metric(f"{self.prefix}_{name}", *args))
+
+        metric("run_start_timestamp_seconds", "gauge", "Unix time the last run started.", [({}, summary["start_time"])])
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.", [({}, summary["duration_seconds"])])
+        metric("users_per_second", "gauge", "Users read per second in the last run.", [({}, summary["users_per_sec"])])
+        metric("executor_utilization_ratio", "gauge", "Share of executor capacity spent transforming and encoding.",
+               [({}, summary["executor_utilization"])])
+        metric("stage_seconds_total", "counter", "Time spent per pipeline stage in the last run.",
+               [({"stage": stage}, stats["seconds"]) for stage, stats in summary["stages"].items()])
+        metric("stage_calls_total", "counter", "Timed calls per pipeline stage in the last run.",
+               [({"stage": stage}, stats["calls"]) for stage, stats in summary["stages"].items()])
+        metric("stage_max_seconds", "gauge", "Longest single call per pipeline stage in the last run.",
+               [({"stage": stage}, stats["max_seconds"]) for stage, stats in summary["stages"].items()])
+        counters = summary["counters"]
+        for name, label, values, help_text in _COUNTER_METRICS:
+            samples = [({label: value} if label else {}, counters.get(f"{name}_{value}" if label else name, 0))
+                       for value in values]
+            metric(f"{name}_total", "counter", help_text, samples)
+        metric("queue_depth_max", "gauge", "Largest sampled depth per queue in the last run.",
+               [({"queue": name}, stats["max"]) for name, stats in summary["gauges"].items()])
+        metric("queue_depth_mean", "gauge", "Mean sampled depth per queue in the last run.",
+               [({"queue": name}, stats["mean"]) for name, stats in summary["gauges"].items()])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        write_text_file(path, json.dumps(self.summary(), indent=2) + "\n")
+
+    def write_textfile(self, path):
+        write_text_file(path, self.prometheus_text())
+
+# Run counters exported as one Prometheus counter per unit: (counter prefix, label, label values, help)
+_COUNTER_METRICS = (
+    ("users", "stage", ("in", "out", "loaded"), "Users read, written and loaded in the last run."),
+    ("bytes", "direction", ("in", "out"), "Bytes read and written in the last run."),
+    ("batches", None, (None,), "Batch files written in the last run."),
+    ("files", "state", ("committed", "failed", "skipped"), "Input files committed, failed and skipped in the last run."),
+)
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def prometheus_metric(name, kind, help_text, samples):
+    """
+    Returns the lines of one metric in the Prometheus text exposition format. samples are
+    (labels, value) pairs, where labels is a dict; for kind "summary" they are
+    (labels, sum, count), written as the metric's _sum and _count samples.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    suffixes = ("_sum", "_count") if kind == "summary" else ("",)
+    for labels, *values in samples:
+        label_text = ",".join(f'{key}="{_escape_label(str(val))}"' for key, val in labels.items())
+        label_text = f"{{{label_text}}}" if label_text else ""
+        for suffix, value in zip(suffixes, values):
+            lines.append(f"{name}{suffix}{label_text} {value!r}")
+    return lines
+
+def write_text_file(path, text):
+    """
+    Writes text to a temp file and renames it to path, so readers never see a partial file.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
@@ -0,0 +1,294 @@
+import mmap
+import os
+from lazy_imports import LazyModule, lazy_import
+
+ijson = LazyModule("ijson")
+orjson = lazy_import("orjson")
+msgspec = lazy_import("msgspec")
+
+# Largest input file, in bytes, that auto-selection decodes in one piece with the bulk parser
+PARSE_MEMORY_BUDGET = 32 * 1024 * 1024
+# Decoded users take several times the memory of their JSON text. The bulk parser is only
+# auto-selected if this many times the file size is available
+BULK_MEMORY_FACTOR = 8
+
+def _ijson_backend(name):
+    try:
+        return ijson.get_backend(name)
+    except Exception:
+        return None
+
+class IjsonParser:
+    """
+    Streams users with one ijson backend: "yajl2_c" (C extension) or "python" (pure Python,
+    always available but many times slower).
+    The backend module provides items(), items_coro() and parse_coro() like ijson itself.
+    """
+    streaming = True
+
+    def __init__(self, backend):
+        self.name = backend
+        self.backend = _ijson_backend(backend)
+
+    def projects(self, fields, context=None):
+        """
+        Tells whether users should be read with a projection (see ProjectedItems) to the input
+        fields a transformer declares, given the @odata.context of the file.
+        The python backend produces every event in Python anyway, so skipping unneeded values
+        always saves building them. yajl2_c builds whole users in C, which is faster than
+        handling the events of the needed fields in Python unless most fields are unneeded, so
+        it only projects files whose $select lists PROJECTION_MIN_WIDTH times as many fields.
+        """
+        if fields is None:
+            return False
+        if self.name == "python":
+            return True
+        selected = selected_fields(context)
+        declared = {path.split(".", 1)[0] for path in fields}
+        return selected is not None and len(selected) >= PROJECTION_MIN_WIDTH * len(declared)
+
+    @classmethod
+    def supports(cls, backend):
+        return _ijson_backend(backend) is not None
+
+class BulkParser:
+    """
+    Memory-maps a whole file and decodes it in one call with orjson, or msgspec if orjson is
+    not installed. Much faster than streaming, but every user of the file is held in memory
+    at once, so it is only meant for files that fit a memory budget.
+    The @odata.context header is still sniffed with the fastest ijson backend.
+    """
+    streaming = False
+    name = "bulk"
+
+    def __init__(self):
+        self.backend = _ijson_backend("yajl2_c") or _ijson_backend("python")
+        if orjson is not None:
+            self._decode = orjson.loads
+        else:
+            # Only the 'value' field is decoded, other top-level fields are skipped
+            document_type = msgspec.defstruct("ODataDocument", [("value", list, [])])
+            decode = msgspec.json.Decoder(document_type).decode
+            self._decode = lambda data: {"value": decode(data).value}
+
+    @classmethod
+    def supports(cls):
+        return orjson is not None or msgspec is not None
+
+    def decode_file(self, f, record_model=None):
+        """
+        Returns the list of users in the 'value' array of the open binary file f.
+        With a typed record model (see records.RecordModel) users are decoded straight into
+        its input records, skipping the fields they do not declare.
+        """
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Empty JSON document")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                if record_model is not None:
+                    return self._typed_decoder(record_model)(view)
+                document = self._decode(view)
+        if isinstance(document, dict):
+            return document.get("value") or []
+        return []
+
+    def _typed_decoder(self, record_model):
+        decoder = _typed_decoders.get(record_model)
+        if decoder is None:
+            decoder = _typed_decoders[record_model] = record_model.decoder()
+        return decoder
+
+# Decoders of the typed record models in use
+_typed_decoders = {}
+
+# Parser names accepted by get_parser
+PARSERS = ("yajl2_c", "python", "bulk")
+
+# Files whose $select lists at least this many times the top-level fields a transformer reads
+# are parsed with a projection by yajl2_c
+PROJECTION_MIN_WIDTH = 4
+
+def selected_fields(context):
+    """
+    Returns the fields listed in the $select part of an @odata.context such as
+    "...$metadata#users(id,mail)", or None if it lists none.
+    """
+    if not context or not context.endswith(")") or "(" not in context:
+        return None
+    selected = context[context.rindex("(") + 1:-1]
+    return [field.strip() for field in selected.split(",") if field.strip()] or None
+
+def available_memory():
+    """
+    Returns the bytes of RAM currently available, or None where that cannot be determined.
+    """
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def get_parser(parser=None, size=None, memory_budget=PARSE_MEMORY_BUDGET):
+    """
+    Returns a parser for the given name ("yajl2_c", "python" or "bulk"), or the parser itself
+    if one is passed in.
+    With parser=None one is picked for a file of size bytes: "bulk" if it is installed, the
+    file is at most memory_budget bytes and BULK_MEMORY_FACTOR times its size is available,
+    otherwise the fastest installed ijson backend.
+    """
+    if parser is None:
+        if size is not None and size <= memory_budget and BulkParser.supports():
+            available = available_memory()
+            if available is None or size * BULK_MEMORY_FACTOR <= available:
+                return BulkParser()
+        return IjsonParser("yajl2_c" if IjsonParser.supports("yajl2_c") else "python")
+    if not isinstance(parser, str):
+        return parser
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser: {parser}. Expected one of {', '.join(PARSERS)}")
+    if parser == "bulk":
+        if not BulkParser.supports():
+            raise ValueError("Parser bulk requires orjson or msgspec")
+        return BulkParser()
+    if not IjsonParser.supports(parser):
+        raise ValueError(f"ijson backend {parser} is not installed")
+    return IjsonParser(parser)
+
+def describe_parser(parser=None, memory_budget=PARSE_MEMORY_BUDGET):
+    """
+    Returns a short description of the parser selection, for logging.
+    """
+    if parser is not None:
+        return get_parser(parser).name
+    streaming = get_parser(None).name
+    if not BulkParser.supports():
+        return f"auto ({streaming})"
+    return f"auto (bulk up to {memory_budget / (1024 * 1024):.0f} MB, else {streaming})"
+
+_START_EVENTS = ("start_map", "start_array")
+_END_EVENTS = ("end_map", "end_array")
+# Marks a map key whose value is left out of the projection
+_SKIP = object()
+
+class ProjectedItems:
+    """
+    Target for an ijson basic_parse_coro() that collects the users of the top-level 'value'
+    array into items, keeping only the fields of projection (see compile_projection).
+    Events of left out values are only counted to find where the value ends, so no dicts or
+    lists are built for them. An object whose keys are all left out keeps its first key, with
+    None as value, so it stays truthy like the non-empty object of the input.
+    """
+    def __init__(self, projection, items):
+        self.projection = projection
+        self.items = items
+        # 0: before the document, 1: in the top-level object, 2: in the 'value' array, 3: done
+        self.state = 0
+        self.key = None
+        # Depth inside a value that is being skipped
+        self.skip = 0
+        # [container, projection, current key, first left out key] of the containers being built
+        self.stack = []
+
+    def send(self, event_value):
+        event, value = event_value
+        if self.skip:
+            if event in _START_EVENTS:
+                self.skip += 1
+            elif event in _END_EVENTS:
+                self.skip -= 1
+            return
+        stack = self.stack
+        if not stack:
+            self._send_outside_items(event, value)
+            return
+        frame = stack[-1]
+        container = frame[0]
+        if event == "map_key":
+            projection = frame[1]
+            if projection is None or value in projection:
+                frame[2] = value
+            else:
+                frame[2] = _SKIP
+                if frame[3] is None:
+                    frame[3] = value
+            return
+        if event in _END_EVENTS:
+            stack.pop()
+            if not container and frame[3] is not None:
+                container[frame[3]] = None
+            if not stack:
+                self.items.append(container)
+            return
+        if type(container) is dict:
+            key = frame[2]
+            if key is _SKIP:
+                if event in _START_EVENTS:
+                    self.skip = 1
+                return
+            projection = frame[1]
+            projection = projection[key] if projection is not None else None
+        else:
+            key = None
+            projection = frame[1]
+        if event == "start_map":
+            value = {}
+            stack.append([value, projection, None, None])
+        elif event == "start_array":
+            value = []
+            stack.append([value, projection, None, None])
+        if key is None:
+            container.append(value)
+        else:
+            container[key] = value
+
+    def _send_outside_items(self, event, value):
+        if self.state == 2:
+            # An item of the 'value' array starts, or the array ends
+            if event == "start_map":
+                self.stack.append([{}, self.projection, None, None])
+            elif event == "start_array":
+                self.stack.append([[], None, None, None])
+            elif event == "end_array":
+                self.state = 1
+            else:
+                self.items.append(value)
+        elif self.state == 1:
+            if event == "map_key":
+                self.key = value
+            elif event == "end_map":
+                self.state = 3
+            elif self.key == "value" and event == "start_array":
+                self.state = 2
+            elif event in _START_EVENTS:
+                self.skip = 1
+        elif self.state == 0 and event == "start_map":
+            self.state = 1
+
+def compile_projection(fields):
+    """
+    Turns the input fields a transformer declares, as dotted paths such as "id" or
+    "signInActivity.lastSignInDateTime", into a tree of dicts in which None keeps the whole
+    value. Returns None, which keeps everything, if fields is None.
+    """
+    if fields is None:
+        return None
+    projection = {}
+    for path in fields:
+        node = projection
+        keys = path.split(".")
+        for key in keys[:-1]:
+            child = node.get(key, _SKIP)
+            if child is None:
+                break
+            if child is _SKIP:
+                child = node[key] = {}
+            node = child
+        else:
+            node[keys[-1]] = None
+    return projection
@@ -0,0 +1,344 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+import sharding
+from routing import TRANSFORMERS, get_transformer
+from io_utils import ODataStream, StagedBatchWriter, BatchWriterPool, remove_batch_files
+from manifest import fingerprint_file
+from sharding import Shard, split_value_array
+from loaders import FileLoad
+
+logger = logging.getLogger(__name__)
+
+class Pipeline:
+    """
+    The stages of one process_users run: file readers, a transform stage and a batch writer,
+    connected by bounded queues, so batches are written while files are still being read and
+    at most queue_depth chunks wait in each queue. A file's batches are staged and committed
+    to the manifest, in input file order, once the whole file has been transformed.
+    options is a main.ProcessOptions with the external id strategy and batch size resolved.
+    """
+    def __init__(self, output_dir, options, sink, manifest, backend, loader=None, delta_index=None, metrics=None):
+        self.output_dir = output_dir
+        self.options = options
+        self.sink = sink
+        self.manifest = manifest
+        self.backend = backend
+        self.loader = loader
+        self.delta_index = delta_index
+        self.metrics = metrics
+        self.timed = metrics.enabled
+        # Users are only encoded for batch files if they are written, and turned into rows for the loader
+        self.chunk_sink = sink if options.write_files else None
+        self.to_rows = loader.to_rows if loader is not None else None
+        # Backends that parse users themselves are handed raw chunks, which needs numpy to find the users;
+        # delta mode needs the ids of the users on the event loop
+        self.raw_chunks = (getattr(backend, "raw_chunks", False) and delta_index is None
+                           and sharding.numpy is not None)
+        self.file_errors = []
+        self.failed_files = set()
+        # Size, mtime and hash of each input file and the name of the transformer it was read with
+        self.fingerprints = {}
+        self.transformer_names = {}
+        # Engine of each input file, where it differs from options.engine
+        self.file_engines = {}
+        # Staged batch writer and rows being loaded of each input file in progress
+        self.writers = {}
+        self.loads = {}
+        self.json_files = []
+        self.pool = None
+        self.transform_queue = None
+        self.write_queue = None
+
+    async def run(self, json_files):
+        """
+        Processes json_files and returns the (file path, error) pairs of those that failed.
+        """
+        options = self.options
+        self.json_files = json_files
+        self.transform_queue = asyncio.Queue(maxsize=options.queue_depth)
+        self.write_queue = asyncio.Queue(maxsize=options.queue_depth)
+        async with BatchWriterPool(options.max_concurrent_writes, options.queue_depth, self.metrics) as self.pool:
+            tasks = [asyncio.create_task(stage()) for stage in (self.read_files, self.transform_chunks, self.write_chunks)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+        return self.file_errors
+
+    def fail_file(self, file_path, error):
+        # Record only the first error of a file; later stages drop its remaining chunks
+        if file_path not in self.failed_files:
+            self.failed_files.add(file_path)
+            self.file_errors.append((file_path, error))
+
+    # Readers
+
+    async def read_files(self):
+        # Semaphore to limit concurrent file processing
+        semaphore = asyncio.Semaphore(self.options.max_concurrent_files)
+        await asyncio.gather(*(self.read_file(file_path, semaphore) for file_path in self.json_files))
+        await self.transform_queue.put(None)
+
+    async def read_file(self, file_path, semaphore):
+        # Read a single file in chunks, respecting the concurrency limit.
+        options = self.options
+        file_name = os.path.basename(file_path)
+        async with semaphore:
+            self.writers[file_path] = StagedBatchWriter(self.output_dir, file_name, options.batch_size, self.sink, self.pool)
+            if self.loader is not None:
+                self.loads[file_path] = FileLoad(self.loader, file_name)
+            try:
+                loop = asyncio.get_running_loop()
+                fingerprint = self.fingerprints[file_path] = await loop.run_in_executor(None, fingerprint_file, file_path)
+                self.metrics.count("bytes_in", fingerprint["size"], file_name)
+                async with ODataStream(file_path, parser=options.parser, memory_budget=options.parse_memory_budget) as stream:
+                    if options.shards > 1 and fingerprint["size"] >= options.shard_min_size:
+                        await self.read_shards(file_path, stream)
+                    elif self.raw_chunks:
+                        await self.read_raw_chunks(file_path, stream)
+                    else:
+                        await self.read_chunks(file_path, stream)
+            except Exception as e:
+                # Record and skip files that fail to read
+                self.fail_file(file_path, f"Read error: {e}")
+            # Mark the end of the file so the writer can commit or discard it
+            await self.transform_queue.put((file_path, None, None))
+
+    async def read_transformer(self, file_path, stream):
+        # Detect transformer from OData context, reusing the stream's file handle for the body
+        file_name = os.path.basename(file_path)
+        start = time.perf_counter() if self.timed else 0.0
+        context = await stream.read_context()
+        if self.timed:
+            self.metrics.observe("header", time.perf_counter() - start, file_name)
+        transformer_class = TRANSFORMERS.route(context)[1]
+        self.transformer_names[file_path] = transformer_class.__name__
+        logger.info("Processing file: %s with transformer: %s, parser: %s", file_name, transformer_class.__name__,
+                    stream.parser.name)
+        return get_transformer(transformer_class, self.options.external_ids)
+
+    async def read_raw_chunks(self, file_path, stream):
+        # Hand the raw bytes of each chunk of users to the backend, whose workers parse them
+        transformer = await self.read_transformer(file_path, stream)
+        chunks = stream.raw_chunks(self.options.chunk_size)
+        await self._queue_chunks(file_path, transformer, chunks, lambda chunk: chunk.users)
+
+    async def read_chunks(self, file_path, stream):
+        transformer = await self.read_transformer(file_path, stream)
+        # The typed engine has users decoded straight into its input records, and streaming
+        # parsers may skip the fields the transformer does not read
+        record_model = transformer.record_model if self.options.engine == "typed" else None
+        if record_model is not None and not stream.decodes_records():
+            # Converting streamed dicts into records costs more than transforming the dicts
+            self.file_engines[file_path] = "record"
+            record_model = None
+        users = stream.users(record_model, transformer.input_fields)
+        await self._queue_chunks(file_path, transformer, _chunked(users, self.options.chunk_size), len)
+
+    async def _queue_chunks(self, file_path, transformer, chunks, count_users):
+        file_name = os.path.basename(file_path)
+        timed = self.timed
+        count = 0
+        # Parse time excludes the time spent waiting for room in the transform queue
+        parse_time = 0.0
+        start = time.perf_counter() if timed else 0.0
+        try:
+            async for chunk in chunks:
+                if file_path in self.failed_files:
+                    break
+                count += count_users(chunk)
+                if timed:
+                    parse_time += time.perf_counter() - start
+                await self.transform_queue.put((file_path, transformer, chunk))
+                if timed:
+                    start = time.perf_counter()
+            if timed:
+                parse_time += time.perf_counter() - start
+        except Exception as e:
+            # Record and skip files that fail to read a chunk
+            self.fail_file(file_path, f"Chunk read error: {e}")
+        finally:
+            await chunks.aclose()
+            if timed:
+                self.metrics.observe("parse", parse_time, file_name)
+                self.metrics.count("users_in", count, file_name)
+
+    async def read_shards(self, file_path, stream):
+        # Hand byte ranges of the file to the transform stage instead of parsed chunks
+        transformer = await self.read_transformer(file_path, stream)
+        loop = asyncio.get_running_loop()
+        ranges = await loop.run_in_executor(None, split_value_array, file_path, self.options.shards)
+        logger.info("Split %s into %d shards", os.path.basename(file_path), len(ranges))
+        staging_dir = self.writers[file_path].staging_dir
+        for index, (start, end) in enumerate(ranges):
+            if file_path in self.failed_files:
+                break
+            shard = Shard(file_path, start, end, os.path.join(staging_dir, f"shard_{index:04d}"))
+            await self.transform_queue.put((file_path, transformer, shard))
+
+    # Transform stage
+
+    async def transform_chunks(self):
+        backend = self.backend
+        pending = collections.deque()
+        while True:
+            if self.timed:
+                self.metrics.gauge("transform_queue", self.transform_queue.qsize())
+            item = await self.transform_queue.get()
+            if item is None:
+                break
+            file_path, transformer, chunk = item
+            if chunk is None:
+                pending.append((file_path, None, None, False))
+            elif isinstance(chunk, Shard):
+                if file_path not in self.failed_files:
+                    task = asyncio.ensure_future(self.transform_shard(file_path, transformer, chunk))
+                    pending.append((file_path, task, None, True))
+            elif file_path not in self.failed_files:
+                # Transform the whole chunk in one backend call to keep dispatch overhead per chunk, not per user
+                task = asyncio.ensure_future(backend.transform(
+                    transformer, chunk, self.chunk_sink, self.file_engines.get(file_path, self.options.engine),
+                    self.timed, self.to_rows,
+                ))
+                # Delta mode matches transformed users to the index by their source id
+                ids = [user.get("id") for user in chunk] if self.delta_index is not None else None
+                pending.append((file_path, task, ids, False))
+            while pending and (len(pending) > backend.max_workers or pending[0][1] is None):
+                await self.forward_oldest(pending)
+        while pending:
+            await self.forward_oldest(pending)
+        await self.write_queue.put(None)
+
+    async def transform_shard(self, file_path, transformer, shard):
+        options = self.options
+        start = time.perf_counter() if self.timed else 0.0
+        parts = await self.backend.transform_shard(transformer, shard, self.sink, options.engine, options.chunk_size,
+                                                   options.batch_size)
+        if self.timed:
+            file_name = os.path.basename(file_path)
+            self.metrics.observe("shard", time.perf_counter() - start, file_name)
+            self.metrics.count("users_in", sum(count for _, count, _ in parts), file_name)
+        return parts
+
+    async def forward_oldest(self, pending):
+        # Pass on the oldest chunk in flight, keeping chunks in the order they were read
+        file_path, task, ids, sharded = pending.popleft()
+        if task is None:
+            await self.write_queue.put((file_path, None, None, False))
+            return
+        try:
+            chunk_results = await task
+        except Exception as e:
+            # Record and skip files that fail to transform a chunk
+            self.fail_file(file_path, f"{'Shard' if sharded else 'Chunk'} transform error: {e}")
+            return
+        if sharded:
+            # The shard's batches are already staged, only their (path, users, bytes) are passed on
+            if file_path not in self.failed_files:
+                await self.write_queue.put((file_path, chunk_results, None, True))
+            return
+        if self.timed:
+            chunk_results, transform_time, encode_time = chunk_results
+            self.metrics.observe("transform", transform_time, os.path.basename(file_path))
+            self.metrics.observe("encode", encode_time, os.path.basename(file_path))
+        if file_path not in self.failed_files:
+            await self.write_queue.put((file_path, chunk_results, ids, False))
+
+    # Writer
+
+    async def write_chunks(self):
+        json_files = self.json_files
+        finished = set()
+        next_file = 0
+        file_idx = self.manifest.next_index
+        while True:
+            if self.timed:
+                self.metrics.gauge("write_queue", self.write_queue.qsize())
+            item = await self.write_queue.get()
+            if item is None:
+                break
+            file_path, chunk_results, ids, sharded = item
+            if chunk_results is not None:
+                if sharded:
+                    self.writers[file_path].add_staged(chunk_results)
+                elif file_path not in self.failed_files:
+                    await self.write_chunk(file_path, chunk_results, ids)
+                continue
+            finished.add(file_path)
+            # Commit finished files in input order so batch indices are deterministic
+            while next_file < len(json_files) and json_files[next_file] in finished:
+                file_idx = await self.finish_file(json_files[next_file], file_idx)
+                next_file += 1
+
+    async def write_chunk(self, file_path, chunk_results, ids):
+        rows = None
+        if self.loader is not None:
+            chunk_results, rows = chunk_results
+        if self.delta_index is not None:
+            filtered = await self.delta_index.filter(os.path.basename(file_path), ids, chunk_results, rows)
+            chunk_results, rows = filtered if rows is not None else (filtered, None)
+        if rows is not None:
+            await self.loads[file_path].add(rows)
+        if self.options.write_files:
+            await self.writers[file_path].add(chunk_results)
+
+    async def finish_file(self, file_path, file_idx):
+        # Commits or discards a file whose chunks are all written; returns the next free batch index
+        file_name = os.path.basename(file_path)
+        writer = self.writers.pop(file_path)
+        file_load = self.loads.pop(file_path, None)
+        loaded = None
+        if file_load is not None and file_path not in self.failed_files:
+            # A file only counts as done once all of its users are loaded
+            try:
+                loaded = await file_load.finish()
+            except Exception as e:
+                self.fail_file(file_path, f"Load error: {e}")
+        if file_path in self.failed_files:
+            if file_load is not None:
+                await file_load.discard()
+            await writer.discard()
+            self.metrics.count("files_failed")
+            if self.delta_index is not None:
+                await self.delta_index.discard(file_name)
+            return file_idx
+        file_idx = await writer.commit(file_idx)
+        users = writer.users if self.options.write_files else loaded
+        if self.timed:
+            self.metrics.count("files_committed")
+            self.metrics.count("users_out", users, file_name)
+            if file_load is not None:
+                self.metrics.count("users_loaded", loaded, file_name)
+            self.metrics.count("bytes_out", writer.bytes_written, file_name)
+            self.metrics.count("batches", len(writer.committed), file_name)
+        if self.delta_index is not None:
+            await self.delta_index.commit(file_name)
+        # Save the manifest after every file so a crashed run resumes from here
+        self.manifest.next_index = file_idx
+        replaced = self.manifest.record(
+            file_path, self.fingerprints[file_path], self.transformer_names[file_path], writer.committed, users
+        )
+        self.manifest.save()
+        # Batches of delta runs only hold that run's changes, so earlier ones are kept
+        if self.delta_index is None:
+            remove_batch_files(self.output_dir, replaced)
+        return file_idx
+
+async def _chunked(users, chunk_size):
+    # Groups an async iterator of users into lists of chunk_size users, the last one shorter
+    chunk = []
+    try:
+        async for user in users:
+            chunk.append(user)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        await users.aclose()
@@ -0,0 +1,158 @@
+from typing import Any, Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if msgspec is not None:
+    UNSET = msgspec.UNSET
+
+    class _GraphRecord(msgspec.Struct, gc=False):
+        """
+        Base of the input records. get() reads a field like dict.get reads a key, so
+        transformers written for dicts also accept these records.
+        """
+        def get(self, key, default=None):
+            value = getattr(self, key, default)
+            return default if value is UNSET else value
+
+    class GraphUser(_GraphRecord):
+        """
+        The fields of a Graph user that UserTransformer reads. Any other field of the input,
+        such as mobilePhone or otherMails, is skipped while decoding.
+        external_id is UNSET when missing, so missing and null ids can be told apart.
+        signInActivity stays a dict: an object that only holds keys UserTransformer does not
+        read must stay truthy, as it is for the record engine, and a Struct would drop them.
+        """
+        id: Any = None
+        external_id: Any = UNSET
+        mail: Any = None
+        userType: Any = None
+        usageLocation: Any = None
+        accountEnabled: Any = None
+        givenName: Any = None
+        surname: Any = None
+        signInActivity: Optional[dict] = None
+
+    class SignIn(msgspec.Struct, gc=False):
+        dateTime: Any
+        requestId: Any
+
+    class SignInActivity(msgspec.Struct, gc=False):
+        lastSignIn: SignIn
+        lastNonInteractiveSignIn: SignIn
+        lastSuccessfulSignIn: SignIn
+
+    class TransformedUser(msgspec.Struct, gc=False):
+        """
+        Output record of UserTransformer. Fields are encoded in declaration order, which
+        matches the keys of the dicts UserTransformer.transform() returns.
+        """
+        Id: Any
+        external_id: Any
+        mail: Any
+        type: Any
+        location: Any
+        is_enabled: Any
+        first_name: Any
+        last_name: Any
+        signInActivity: Optional[SignInActivity]
+
+def transform_graph_users(users, external_ids):
+    """
+    Transforms GraphUser records into TransformedUser records, the typed equivalent of
+    UserTransformer.transform_batch(). Missing external ids are generated with external_ids.
+    """
+    transformed = []
+    append = transformed.append
+    for user in users:
+        external_id = user.external_id
+        if external_id is UNSET:
+            external_id = external_ids(user)
+        activity = user.signInActivity
+        if activity:
+            get = activity.get
+            activity = SignInActivity(
+                SignIn(get("lastSignInDateTime"), get("lastSignInRequestId")),
+                SignIn(get("lastNonInteractiveSignInDateTime"), get("lastNonInteractiveSignInRequestId")),
+                SignIn(get("lastSuccessfulSignInDateTime"), get("lastSuccessfulSignInRequestId")),
+            )
+        else:
+            activity = None
+        append(TransformedUser(
+            user.id, external_id, user.mail, user.userType, user.usageLocation, user.accountEnabled,
+            user.givenName, user.surname, activity,
+        ))
+    return transformed
+
+class RecordModel:
+    """
+    Typed record model of a transformer: the msgspec Struct users are decoded into and a
+    function transform(users, external_ids) that turns a list of them into output Structs.
+    Transformers that declare one can run on the typed engine.
+    """
+    def __init__(self, input_type, transform):
+        self.input_type = input_type
+        self.transform = transform
+
+    def decoder(self):
+        """
+        Returns a function that decodes the bytes of an OData document into the list of
+        input records of its 'value' array.
+        """
+        document_type = msgspec.defstruct("ODataDocument", [("value", list[self.input_type], [])])
+        decode = msgspec.json.Decoder(document_type).decode
+        return lambda data: decode(data).value
+
+    def array_decoder(self):
+        """
+        Returns a function that decodes the bytes of a JSON array of users into a list of
+        input records, see sharding.decode_value_blocks.
+        """
+        return msgspec.json.Decoder(list[self.input_type]).decode
+
+# Typed model of UserTransformer, or None without msgspec
+USER_RECORD_MODEL = RecordModel(GraphUser, transform_graph_users) if msgspec is not None else None
+
+def to_builtins(value):
+    """
+    json.dumps default hook that serializes records as plain dicts, leaving out UNSET fields.
+    """
+    if msgspec is not None and isinstance(value, msgspec.Struct):
+        return msgspec.to_builtins(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _compile_typed(model, indent):
+    input_type = model.input_type
+    transform = model.transform
+    encode = msgspec.json.Encoder().encode
+    format_json = msgspec.json.format
+
+    def encode_typed(transformer, chunk):
+        # Chunks from streaming parsers hold dicts, which are converted first
+        users = [user if type(user) is input_type else msgspec.convert(user, input_type) for user in chunk]
+        transformed = transform(users, transformer.external_ids)
+        if indent is None:
+            return [encode(user) for user in transformed]
+        return [format_json(encode(user), indent=indent) for user in transformed]
+    return encode_typed
+
+# Compiled encoders per record model and indent
+_encoders = {}
+
+def get_typed_encoder(transformer, indent=None):
+    """
+    Returns a function encode_typed(transformer, chunk) that transforms a chunk of users with
+    the transformer's record model and returns the UTF-8 JSON bytes of each output record,
+    exactly as the encoders module produces them for the same indent, with floats written the
+    way msgspec writes them (see encoders.JsonEncoder). Returns None if
+    msgspec is not installed or the transformer has no record model.
+    """
+    model = getattr(transformer, "record_model", None)
+    if model is None or msgspec is None:
+        return None
+    key = (id(model), indent)
+    if key not in _encoders:
+        _encoders[key] = (model, _compile_typed(model, indent))
+    return _encoders[key][1]
@@ -0,0 +1,184 @@
+import threading
+from collections.abc import MutableMapping
+from external_ids import get_external_id_strategy
+
+def _split_path(fragment):
+    # Splits at slashes outside of parentheses and quoted keys, e.g. in groups('a/b')/members
+    segments, start, depth, quoted = [], 0, 0, False
+    for index, char in enumerate(fragment):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "/" and depth == 0:
+            segments.append(fragment[start:index])
+            start = index + 1
+    segments.append(fragment[start:])
+    return segments
+
+def parse_entity_set(context):
+    """
+    Returns the entity-set path of an @odata.context URL as a tuple of lower case segments,
+    without keys, $select lists and markers such as $entity or $delta:
+
+        https://graph.microsoft.com/beta/$metadata#users(id,mail)             ("users",)
+        $metadata#directory/deletedItems/microsoft.graph.user     ("directory", "deleteditems", "microsoft.graph.user")
+        $metadata#groups('1')/members                             ("groups", "members")
+        $metadata#Collection(microsoft.graph.user)                ("microsoft.graph.user",)
+
+    A context without "#" is read as the path itself.
+    """
+    fragment = context.rpartition("#")[2].strip()
+    path = []
+    for segment in _split_path(fragment):
+        segment = segment.strip()
+        if segment.startswith("Collection(") and segment.endswith(")"):
+            segment = segment[len("Collection("):-1]
+        segment = segment.partition("(")[0].strip()
+        if segment and not segment.startswith("$"):
+            path.append(segment.lower())
+    return tuple(path)
+
+class ODataRouter(MutableMapping):
+    """
+    Registry of transformer classes by OData entity-set path, e.g. "users" or
+    "directory/deletedItems". Behaves like a dict of path to class, so paths can also be
+    registered with router[path] = cls.
+    route() matches the whole entity-set path of a context (see parse_entity_set) segment by
+    segment against a trie of the registered paths. "users" matches users(id,mail) and
+    users('1')/$entity, but not users('1')/memberOf, a navigation property that holds other
+    objects and needs its own registration such as "users/memberOf". Type casts such as
+    directory/deletedItems/microsoft.graph.user only narrow the set, so a qualified segment
+    without a registration of its own is skipped. Contexts that match no registered path, or
+    are empty, go to the default class. The trie is rebuilt on the first lookup after a
+    change, and results are cached per context string.
+    """
+    def __init__(self, routes=None, default=None, cache_size=1024):
+        self._routes = {}
+        self._default = default
+        self.cache_size = cache_size
+        self._trie = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.update(routes or {})
+
+    @property
+    def default(self):
+        return self._default
+
+    @default.setter
+    def default(self, transformer_class):
+        with self._lock:
+            self._default = transformer_class
+            self._cache = {}
+
+    def __getitem__(self, path):
+        return self._routes[path]
+
+    def __setitem__(self, path, transformer_class):
+        with self._lock:
+            self._routes[path] = transformer_class
+            self._trie = None
+            self._cache = {}
+
+    def __delitem__(self, path):
+        with self._lock:
+            del self._routes[path]
+            self._trie = None
+            self._cache = {}
+
+    def __iter__(self):
+        return iter(self._routes)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def register(self, path, transformer_class=None, default=False):
+        """
+        Registers transformer_class for the entity-set path, and as the default with
+        default=True. Without a class, returns a class decorator that does the same:
+
+            @register_transformer("groups")
+            class GroupTransformer(MappingTransformer): ...
+        """
+        def register_class(cls):
+            if default:
+                self.default = cls
+            self[path] = cls
+            return cls
+        return register_class if transformer_class is None else register_class(transformer_class)
+
+    def _compile(self):
+        # Nodes map a segment to the next node; the None key holds the route ending there
+        trie = {}
+        for path, cls in self._routes.items():
+            node = trie
+            for segment in parse_entity_set(path):
+                node = node.setdefault(segment, {})
+            node[None] = (path, cls)
+        return trie
+
+    def route(self, context):
+        """
+        Returns (registered path, transformer class) for an @odata.context. If no registered
+        path matches the whole entity-set path, the class is the default and the path the one
+        it is registered under, if any.
+        """
+        cache = self._cache
+        found = cache.get(context)
+        if found is not None:
+            return found
+        with self._lock:
+            if self._trie is None:
+                self._trie = self._compile()
+            node = self._trie
+            for segment in parse_entity_set(context or ""):
+                child = node.get(segment)
+                if child is not None:
+                    node = child
+                elif "." not in segment:
+                    # Unregistered navigation properties and entity sets go to the default
+                    node = {}
+                    break
+            found = node.get(None, (self.name_of(self.default), self.default))
+            if len(self._cache) >= self.cache_size:
+                self._cache = {}
+            self._cache[context] = found
+        return found
+
+    def name_of(self, transformer_class):
+        """
+        Returns the path a transformer class is registered under, or None.
+        """
+        for path, cls in self._routes.items():
+            if cls is transformer_class:
+                return path
+        return None
+
+# Transformer registry used by process_users; transformer.py registers UserTransformer for
+# "users" and as the default
+TRANSFORMERS = ODataRouter()
+register_transformer = TRANSFORMERS.register
+
+# Shared transformer instances, keyed by class and external id strategy
+_instances = {}
+
+def get_transformer(transformer_class, external_ids=None):
+    """
+    Returns the shared instance of transformer_class using the given external id strategy.
+    Transformers are stateless after __init__, so one instance serves every file and chunk,
+    also in worker threads and processes, and its mapping and encoders are only compiled once.
+    """
+    external_ids = get_external_id_strategy(external_ids)
+    key = (transformer_class, external_ids)
+    transformer = _instances.get(key)
+    if transformer is None:
+        # Built without arguments, so transformers with their own __init__ need not take the strategy
+        transformer = transformer_class()
+        transformer.external_ids = external_ids
+        transformer = _instances.setdefault(key, transformer)
+    return transformer
@@ -0,0 +1,274 @@
+import collections
+import mmap
+import os
+import re
+from io_utils import _write_file
+from lazy_imports import LazyModule, lazy_import
+
+ijson = LazyModule("ijson")
+numpy = lazy_import("numpy")
+
+# Bytes scanned per numpy block by split_value_array
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+# Size of the reads of a shard worker
+SHARD_READ_SIZE = 1024 * 1024
+# Input files smaller than this are not split by process_users
+SHARD_MIN_SIZE = 64 * 1024 * 1024
+# Bytes scanned per numpy block by value_array_slices, and decoded per call by decode_value_blocks
+RECORD_BLOCK_SIZE = 1024 * 1024
+
+# A byte range of the 'value' array of the input file at path, and the directory its batches are staged in
+Shard = collections.namedtuple("Shard", ["path", "start", "end", "staging_dir"])
+# The raw bytes of a JSON array of users, and how many users it holds
+RawChunk = collections.namedtuple("RawChunk", ["data", "users"])
+
+# JSON tokens that matter for finding the 'value' array: whole strings and structural characters
+_HEADER_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]:,]', re.DOTALL)
+
+def find_value_array(mm):
+    """
+    Returns the offset just past the '[' of the top-level 'value' array, or None if the
+    document has none. Scans the tokens before the array, which for OData files is only
+    the header.
+    """
+    depth = 0
+    key = None
+    expect_key = False
+    for match in _HEADER_TOKEN.finditer(mm):
+        token = match.group()
+        if token in (b"{", b"["):
+            if depth == 1 and key == b'"value"' and token == b"[":
+                return match.end()
+            depth += 1
+            expect_key = token == b"{" and depth == 1
+        elif token in (b"}", b"]"):
+            depth -= 1
+        elif depth == 1 and token == b",":
+            expect_key = True
+        elif depth == 1 and expect_key and token.startswith(b'"'):
+            key = token
+            expect_key = False
+    return None
+
+def _is_escaped(mm, position):
+    # A quote is escaped if an odd number of backslashes directly precede it
+    count = 0
+    while position > 0 and mm[position - 1] == 0x5C:
+        count += 1
+        position -= 1
+    return count % 2 == 1
+
+def scan_record_ends(mm, start, block_size=SCAN_BLOCK_SIZE):
+    """
+    Scans the array whose contents begin at start and yields, per block, a numpy array of
+    the offsets just past each top-level element's closing '}' in the block, followed by
+    the offset of the array's closing ']' as a plain int.
+    Works on blocks of block_size bytes: quotes that are not escaped toggle the in-string
+    state, brackets outside strings change the depth, and elements end where the depth
+    returns to zero. State is carried from block to block.
+    """
+    structural = numpy.zeros(256, dtype=bool)
+    structural[[0x22, 0x5B, 0x5D, 0x7B, 0x7D]] = True
+    in_string = 0
+    depth = 0
+    size = len(mm)
+    position = start
+    while position < size:
+        count = min(block_size, size - position)
+        data = numpy.frombuffer(mm, dtype=numpy.uint8, count=count, offset=position)
+        try:
+            offsets = numpy.flatnonzero(structural[data])
+            chars = data[offsets]
+            # Escaped quotes are rare, so only quotes right after a backslash, or at the start of the
+            # block where the backslash would be in the previous one, are checked one by one
+            preceded = (data[numpy.maximum(offsets - 1, 0)] == 0x5C) | (offsets == 0)
+        finally:
+            # Only the copies made above are kept: a view of the map that is still alive when the
+            # caller closes it, e.g. after the error below, turns into a BufferError
+            del data
+        quotes = chars == 0x22
+        for index in numpy.flatnonzero(quotes & preceded):
+            if _is_escaped(mm, position + int(offsets[index])):
+                quotes[index] = False
+        # A character is inside a string if an odd number of real quotes come before it
+        parity = (numpy.cumsum(quotes) + in_string) & 1
+        outside = (chars != 0x22) & (parity == 0)
+        brackets = chars[outside]
+        bracket_offsets = offsets[outside]
+        steps = numpy.where((brackets == 0x7B) | (brackets == 0x5B), 1, -1)
+        depths = numpy.cumsum(steps) + depth
+        closed = numpy.flatnonzero(depths < 0)
+        if len(closed):
+            # The array ends inside this block
+            last = closed[0]
+            ends = bracket_offsets[:last][(depths[:last] == 0) & (brackets[:last] == 0x7D)]
+            yield ends + position + 1
+            yield position + int(bracket_offsets[last])
+            return
+        yield bracket_offsets[(depths == 0) & (brackets == 0x7D)] + position + 1
+        if len(quotes):
+            in_string = int(parity[-1])
+        if len(depths):
+            depth = int(depths[-1])
+        position += count
+    raise ValueError("The 'value' array is not closed")
+
+def split_value_array(path, shards, block_size=SCAN_BLOCK_SIZE):
+    """
+    Splits the 'value' array of an OData file into at most shards byte ranges of about equal
+    size that each hold whole users, in file order. Returns a list of (start, end) offsets.
+    A range may begin with the separators between users, which shard workers skip.
+    Requires numpy; without it, or if there is no 'value' array, the whole array is one range.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = find_value_array(mm)
+            if start is None:
+                return []
+            size = len(mm)
+            if numpy is None or shards <= 1:
+                # Without a scan the end of the array is the last ']' in the file
+                return [(start, mm.rfind(b"]"))]
+            targets = [start + (size - start) * i // shards for i in range(1, shards)]
+            cuts = []
+            end = None
+            for ends in scan_record_ends(mm, start, block_size):
+                if isinstance(ends, int):
+                    end = ends
+                    break
+                # The first element end at or after each target becomes a cut
+                while targets and len(ends) and ends[-1] >= targets[0]:
+                    cut = int(ends[numpy.searchsorted(ends, targets.pop(0))])
+                    if not cuts or cut > cuts[-1]:
+                        cuts.append(cut)
+    cuts = [cut for cut in cuts if cut < end]
+    bounds = [start] + cuts + [end]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+def value_array_slices(f, chunk_size=None, block_size=RECORD_BLOCK_SIZE):
+    """
+    Yields a RawChunk for each run of consecutive users of the 'value' array of the open
+    binary file f: the raw bytes of the users wrapped in [ and ], a JSON array that decodes
+    on its own. With chunk_size, runs hold chunk_size users, the last one fewer;
+    without, a run holds the users that end in one block of block_size bytes scanned with
+    scan_record_ends. Requires numpy.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        raise ValueError("Empty JSON document")
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = find_value_array(mm)
+        if start is None:
+            return
+        scan = scan_record_ends(mm, start, block_size)
+        try:
+            with memoryview(mm) as view:
+                def run(position, end, users):
+                    # Skip the separators after the previous user
+                    first = mm.find(b"{", position, end)
+                    return RawChunk(b"".join((b"[", view[first:end], b"]")), users)
+
+                position = last = start
+                pending = 0
+                for ends in scan:
+                    if isinstance(ends, int) or not len(ends):
+                        continue
+                    if chunk_size is None:
+                        last = int(ends[-1])
+                        yield run(position, last, len(ends))
+                        position = last
+                        continue
+                    for index in range(chunk_size - pending - 1, len(ends), chunk_size):
+                        end = int(ends[index])
+                        yield run(position, end, chunk_size)
+                        position = end
+                    pending = (pending + len(ends)) % chunk_size
+                    last = int(ends[-1])
+                if pending:
+                    yield run(position, last, pending)
+        finally:
+            # The scan holds numpy views of the map until it is closed
+            scan.close()
+
+def decode_value_blocks(f, decode, block_size=RECORD_BLOCK_SIZE):
+    """
+    Yields the users of the 'value' array of the open binary file f in lists, one per block
+    of block_size bytes scanned with scan_record_ends. The raw bytes of the users that end in
+    a block are decoded with one call of decode, e.g. a msgspec decoder of a list of records,
+    so no dicts are built for them. Only one block of users is held at a time. Requires numpy.
+    """
+    slices = value_array_slices(f, None, block_size)
+    try:
+        for data, _ in slices:
+            yield decode(data)
+    finally:
+        slices.close()
+
+def read_shard(path, start, end, read_size=SHARD_READ_SIZE):
+    """
+    Yields lists of the users decoded from the byte range start..end of path, which holds
+    whole elements of the 'value' array.
+    """
+    decoded = ijson.sendable_list()
+    parser = ijson.items_coro(decoded, "item")
+    parser.send(b"[")
+    started = False
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(read_size, remaining))
+            if not data:
+                raise ValueError(f"{path} ended before byte {end}")
+            remaining -= len(data)
+            if not started:
+                # Skip the separator left over from the previous range
+                data = data.lstrip(b", \t\r\n")
+                started = bool(data)
+                if not started:
+                    # An empty send would end the parser's input
+                    continue
+            parser.send(data)
+            if decoded:
+                yield list(decoded)
+                del decoded[:]
+    parser.send(b"]")
+    parser.close()
+    if decoded:
+        yield list(decoded)
+
+def transform_shard(transformer, shard, sink, engine, chunk_size, batch_size):
+    """
+    Parses, transforms and writes one Shard of a file, see split_value_array.
+    Users are transformed in chunks of chunk_size and written to the shard's staging_dir as
+    batch files of batch_size users. Returns (path, users, bytes) per batch file, in order.
+    """
+    # Imported here because executors runs shards in its backends
+    from executors import transform_and_encode
+    staging_dir = shard.staging_dir
+    os.makedirs(staging_dir, exist_ok=True)
+    parts = []
+    chunk = []
+    batch = []
+
+    def write(users):
+        part_path = os.path.join(staging_dir, f"part_{len(parts):06d}{sink.extension}")
+        parts.append((part_path, len(users), _write_file(part_path, sink.render, users)))
+
+    def flush(users):
+        batch.extend(transform_and_encode(transformer, users, sink, engine))
+        while len(batch) >= batch_size:
+            write(batch[:batch_size])
+            del batch[:batch_size]
+
+    for users in read_shard(shard.path, shard.start, shard.end):
+        chunk.extend(users)
+        while len(chunk) >= chunk_size:
+            flush(chunk[:chunk_size])
+            del chunk[:chunk_size]
+    if chunk:
+        flush(chunk)
+    if batch:
+        write(batch)
+    return parts
@@ -0,0 +1,153 @@
+import io
+import zlib
+from encoders import get_encoder
+from lazy_imports import lazy_import
+
+zstandard = lazy_import("zstandard")
+pyarrow = lazy_import("pyarrow")
+
+class BaseSink:
+    """
+    Output format of the batch files.
+    Writing is split in two steps: encode() serializes transformed users and runs in the
+    executor backend, render() turns a batch of encoded users into the file contents and
+    runs in the thread pool when the batch is written. Sinks are pickled to process workers,
+    so they only hold plain settings.
+    """
+    name = None
+    extension = None
+    # Indent of the per-user JSON text the columnar engine has to produce for this sink, or
+    # False if the sink does not store users as JSON text and cannot use the columnar engine
+    indent = False
+
+    def encode(self, users):
+        return users
+
+    def render(self, encoded_users):
+        raise NotImplementedError
+
+    def render_users(self, users):
+        """
+        Returns the file contents for a batch of transformed users.
+        """
+        return self.render(self.encode(users))
+
+class JsonArraySink(BaseSink):
+    """
+    Writes each batch as a JSON array (users_NNN.json).
+    """
+    name = "json"
+    extension = ".json"
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder or get_encoder()
+        self.indent = self.encoder.indent
+
+    def encode(self, users):
+        encode = self.encoder.encode
+        return [encode(user) for user in users]
+
+    def render(self, encoded_users):
+        return self.encoder.join(encoded_users)
+
+    def render_users(self, users):
+        return self.encoder.encode_array(users)
+
+class NdjsonSink(JsonArraySink):
+    """
+    Writes each batch as newline-delimited JSON (users_NNN.ndjson), one compact user per line.
+    """
+    name = "ndjson"
+    extension = ".ndjson"
+
+    def __init__(self, encoder=None):
+        # NDJSON needs one user per line, so the output is always compact
+        encoder = encoder or get_encoder()
+        if encoder.indent is not None:
+            encoder = get_encoder(encoder.name)
+        super().__init__(encoder)
+
+    def render(self, encoded_users):
+        if not encoded_users:
+            return b""
+        return b"\n".join(encoded_users) + b"\n"
+
+    def render_users(self, users):
+        return self.render(self.encode(users))
+
+class CompressedNdjsonSink(NdjsonSink):
+    """
+    Writes each batch as compressed newline-delimited JSON (users_NNN.ndjson.gz or .ndjson.zst).
+    Users are fed to a streaming compressor one line at a time, so the uncompressed batch is
+    never joined into one buffer.
+    """
+    COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, compression="gzip", encoder=None, level=None):
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}. Expected one of {', '.join(self.COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        super().__init__(encoder)
+        self.compression = compression
+        self.level = level
+        self.name = f"ndjson-{compression}"
+        self.extension = NdjsonSink.extension + self.COMPRESSIONS[compression]
+
+    def _compressor(self):
+        if self.compression == "zstd":
+            level = 3 if self.level is None else self.level
+            return zstandard.ZstdCompressor(level=level).compressobj()
+        # wbits=31 produces a gzip container; level 6 trades a little size for much more speed than 9
+        level = 6 if self.level is None else self.level
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def render(self, encoded_users):
+        compressor = self._compressor()
+        parts = []
+        for line in encoded_users:
+            parts.append(compressor.compress(line))
+            parts.append(compressor.compress(b"\n"))
+        parts.append(compressor.flush())
+        return b"".join(parts)
+
+class ParquetSink(BaseSink):
+    """
+    Writes each batch as a Parquet file (users_NNN.parquet) holding the batch as one row group.
+    Nested objects such as signInActivity become Parquet structs. Requires pyarrow.
+    """
+    name = "parquet"
+    extension = ".parquet"
+
+    def __init__(self, compression="snappy"):
+        if pyarrow is None:
+            raise ValueError("The parquet sink requires the pyarrow package")
+        self.compression = compression
+
+    def render(self, encoded_users):
+        import pyarrow.parquet
+        table = pyarrow.Table.from_pylist(encoded_users)
+        buffer = io.BytesIO()
+        pyarrow.parquet.write_table(table, buffer, row_group_size=max(len(encoded_users), 1), compression=self.compression)
+        return buffer.getvalue()
+
+SINKS = {
+    "json": JsonArraySink,
+    "ndjson": NdjsonSink,
+    "ndjson-gzip": lambda encoder: CompressedNdjsonSink("gzip", encoder),
+    "ndjson-zstd": lambda encoder: CompressedNdjsonSink("zstd", encoder),
+    "parquet": lambda encoder: ParquetSink(),
+}
+
+def get_sink(sink=None, encoder=None):
+    """
+    Returns the output sink for the given name, or the sink itself if one is passed in.
+    Defaults to JSON array batch files.
+    """
+    if sink is None:
+        sink = "json"
+    if not isinstance(sink, str):
+        return sink
+    if sink not in SINKS:
+        raise ValueError(f"Unknown sink: {sink}. Expected one of {', '.join(SINKS)}")
+    return SINKS[sink](encoder)
@@ -0,0 +1,22 @@
+import os
+import json
+
+def write_users_file(path, users):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#users", "value": users}, f)
+
+def make_users(prefix, count, name="Jane", sign_in=False):
+    # With sign_in, every other user has a signInActivity
+    return [{"id": f"{prefix}{i}", "external_id": f"x{prefix}{i}", "givenName": name,
+             **({"signInActivity": {"lastSignInDateTime": "t"} if i % 2 else None} if sign_in else {})}
+            for i in range(count)]
+
+def batch_files(output_dir):
+    return sorted(fname for fname in os.listdir(output_dir) if fname.startswith("users_"))
+
+def read_output(output_dir):
+    batches = []
+    for fname in batch_files(output_dir):
+        with open(os.path.join(output_dir, fname), "r", encoding="utf-8") as f:
+            batches.append(json.load(f))
+    return batches
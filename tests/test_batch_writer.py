@@ -3,7 +3,8 @@ import shutil
 import json
 import unittest
 import asyncio
-from io_utils import write_batches
+import time
+from io_utils import write_batches, StagedBatchWriter, BatchWriterPool
 
 class TestBatchWrite(unittest.TestCase):
     def setUp(self):
@@ -60,5 +61,51 @@ class TestBatchWrite(unittest.TestCase):
             data = json.load(f)
         self.assertEqual(len(data), 42)
 
+class TestConcurrentBatchWrite(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_concurrent_batch_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_indices_do_not_depend_on_completion_order(self):
+        """Earlier batches finish last, but the files are still numbered in the order users were added"""
+        class SlowFirstSink:
+            extension = ".json"
+
+            def render(self, batch):
+                # The first batch holds the lowest ids and renders slowest
+                time.sleep(0.05 if batch[0] == 0 else 0)
+                return json.dumps(batch).encode("utf-8")
+
+        async def write():
+            async with BatchWriterPool(writers=4) as pool:
+                writer = StagedBatchWriter(self.test_dir, "input.json", batch_size=10, sink=SlowFirstSink(), pool=pool)
+                await writer.add(list(range(35)))
+                return await writer.commit(0)
+
+        self.assertEqual(asyncio.run(write()), 4)
+        self.assertEqual(sorted(os.listdir(self.test_dir)), [".staging", "users_000.json", "users_001.json", "users_002.json", "users_003.json"])
+        with open(os.path.join(self.test_dir, "users_000.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), list(range(10)))
+        with open(os.path.join(self.test_dir, "users_003.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), list(range(30, 35)))
+
+    def test_write_batches_leaves_no_temp_files(self):
+        users = [{"id": i} for i in range(250)]
+
+        async def generate():
+            for user in users:
+                yield user
+
+        asyncio.run(write_batches(self.test_dir, generate(), batch_size=100, max_concurrent_writes=3))
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["users_000.json", "users_001.json", "users_002.json"])
+        with open(os.path.join(self.test_dir, "users_002.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), users[200:])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
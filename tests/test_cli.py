@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from main import main
+from helpers import batch_files
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_cli_input"
+        self.output_dir = "test_cli_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+        with open(os.path.join(self.input_dir, "users.json"), "w", encoding="utf-8") as f:
+            json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#users",
+                       "value": [{"id": str(i), "external_id": f"x{i}"} for i in range(5)]}, f)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_options_reach_process_users(self):
+        metrics_path = os.path.join(self.output_dir, "metrics.json")
+        status = main([self.input_dir, self.output_dir, "-q", "--chunk-size", "2", "--sink", "ndjson",
+                       "--executor", "inline", "--engine", "columnar", "--metrics-json", metrics_path])
+        self.assertEqual(status, 0)
+        batches = batch_files(self.output_dir)
+        self.assertEqual(batches, ["users_000.ndjson", "users_001.ndjson", "users_002.ndjson"])
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["info"]["executor"], "inline")
+
+    def test_failed_files_set_exit_status(self):
+        with open(os.path.join(self.input_dir, "broken.json"), "w", encoding="utf-8") as f:
+            f.write('{"value": [{"id": ')
+        self.assertEqual(main([self.input_dir, self.output_dir, "-q"]), 1)
+        self.assertEqual(main([self.input_dir, self.output_dir, "-q", "--shards", "2", "--delta"]), 1)
+
+    def test_invalid_arguments_exit(self):
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit) as raised:
+            main([self.input_dir, self.output_dir, "--engine", "vectorized"])
+        self.assertEqual(raised.exception.code, 2)
+
+    def test_optional_packages_are_imported_lazily(self):
+        code = ("import sys, main; print(','.join(m for m in ('numpy', 'msgspec', 'sqlite3', 'multiprocessing', "
+                "'ijson', 'aiofiles', 'records') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import glob
+import unittest
+import uuid
+from unittest import mock
+from columnar import compile_columnar, get_columnar_encoder
+from field_mapping import Field, Nested, compile_mapping
+from encoders import JsonEncoder
+from io_utils import read_json_stream
+from transformer import UserTransformer, MappingTransformer, MappedUserTransformer, USER_FIELD_MAPPING
+from executors import transform_and_encode
+from sinks import JsonArraySink
+
+class TestColumnarEncoder(unittest.TestCase):
+    def assert_matches_records(self, spec, rows):
+        for indent in (None, 2, 4):
+            with self.subTest(indent=indent):
+                encode_record = JsonEncoder(indent).encode
+                expected = [encode_record(record) for record in map(compile_mapping(spec), rows)]
+                self.assertEqual(compile_columnar(spec, indent)(rows), expected)
+
+    def test_user_mapping_on_sample_files(self):
+        """Given the bundled sample users, columnar output should be byte-identical to UserTransformer"""
+        users = []
+        for path in sorted(glob.glob(os.path.join("usersapi", "fake_users_part_*.json"))):
+            users.extend(read_json_stream(path))
+        users.extend([{}, {"id": "1", "external_id": "ext-1", "signInActivity": {}}])
+
+        fixed = uuid.UUID("12345678-1234-5678-1234-567812345678")
+        for indent in (None, 2):
+            with self.subTest(indent=indent), mock.patch("uuid.uuid4", return_value=fixed):
+                encode_record = JsonEncoder(indent).encode
+                expected = [encode_record(user) for user in UserTransformer().transform_batch(users)]
+                result = get_columnar_encoder(UserTransformer(), indent)(users)
+                self.assertEqual(result, expected)
+
+    def test_value_types(self):
+        rows = [
+            {"a": "naïve \"quoted\" %s", "b": 1, "c": 1.5, "d": True, "e": [1, {"x": None}], "f": {}},
+            {"a": None, "b": False, "c": -2, "d": [], "e": {"nested": ["y"]}, "f": "\n"},
+        ]
+        self.assert_matches_records({"a": "a", "b%s": "b", "c": "c", "d": "d", "e": "e", "f": "f"}, rows)
+
+    def test_groupings_defaults_and_paths(self):
+        spec = {
+            "name": {"first": "givenName", "last": Field("surname", default="unknown")},
+            "city": "address.city",
+            "activity": Nested("activity", {"last": {"at": "lastDateTime", "tags": "tags"}}),
+            "empty": {},
+        }
+        rows = [
+            {"givenName": "Jane", "address": {"city": "Oslo"}, "activity": {"lastDateTime": "t", "tags": ["a"]}},
+            {"surname": "Doe", "address": None, "activity": {}},
+            {},
+        ]
+        self.assert_matches_records(spec, rows)
+
+    def test_empty_chunk(self):
+        self.assertEqual(compile_columnar(USER_FIELD_MAPPING)([]), [])
+
+    def test_transformer_without_mapping(self):
+        class Plain(MappingTransformer):
+            pass
+        self.assertIsNone(get_columnar_encoder(Plain()))
+
+    def test_subclasses_can_opt_out_of_the_user_mapping(self):
+        class NamesOnly(UserTransformer):
+            mapping = None
+
+            def transform(self, user):
+                return {"Id": user.get("id"), "name": user.get("givenName")}
+
+        class Renamed(MappedUserTransformer):
+            mapping = {"Id": "id", "name": "givenName"}
+
+        users = [{"id": "1", "external_id": "x", "givenName": "Jane"}]
+        self.assertIsNone(get_columnar_encoder(NamesOnly(), None))
+        for transformer in (NamesOnly(), Renamed(), Renamed("uuid5")):
+            with self.subTest(transformer=type(transformer).__name__):
+                expected = [{"Id": "1", "name": "Jane"}]
+                self.assertEqual(transformer.transform_batch(users), expected)
+                self.assertEqual(transform_and_encode(transformer, users, JsonArraySink(JsonEncoder()), "columnar"),
+                                 [JsonEncoder().encode(user) for user in expected])
+
+if __name__ == "__main__":
+    unittest.main()
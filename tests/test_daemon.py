@@ -0,0 +1,166 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from daemon import Daemon, TenantQueue, InotifyWatcher, ServiceStats
+from main import process_users
+
+def drop_file(directory, name, users):
+    # Written under a hidden name and renamed into place, as producers should
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#users",
+                   "value": [{"id": f"{name}-{i}", "external_id": f"x{i}"} for i in range(users)]}, f)
+    os.replace(temp_path, os.path.join(directory, name))
+
+async def wait_for(predicate, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError("condition not reached")
+        await asyncio.sleep(0.02)
+
+class TestTenantQueue(unittest.TestCase):
+    def test_priority_and_turns(self):
+        async def run():
+            queue = TenantQueue({"vip": 5})
+            for name in ("a1", "a2", "a3"):
+                await queue.put("a", name)
+            await queue.put("b", "b1")
+            await queue.put("vip", "v1")
+            # A file that is already waiting keeps its place
+            await queue.put("a", "a1")
+            order = []
+            tenant, files = await queue.get(max_files=2)
+            order.append((tenant, [path for path, _ in files]))
+            await queue.task_done(tenant)
+            first, files = await queue.get(max_files=2)
+            order.append((first, [path for path, _ in files]))
+            # a is busy, so b gets its turn even though a has files waiting
+            second, files = await queue.get(max_files=2)
+            order.append((second, [path for path, _ in files]))
+            await queue.task_done(first)
+            await queue.task_done(second)
+            third, files = await queue.get(max_files=2)
+            order.append((third, [path for path, _ in files]))
+            await queue.task_done(third)
+            await asyncio.wait_for(queue.join(), 1)
+            return order
+        self.assertEqual(asyncio.run(run()), [
+            ("vip", ["v1"]), ("a", ["a1", "a2"]), ("b", ["b1"]), ("a", ["a3"]),
+        ])
+
+    def test_latency_percentiles(self):
+        stats = ServiceStats()
+        stats.record("a", [("f1", 0.0), ("f2", 1.0)], 2.0, 4.0, {"f2"}, {"users_out": 3, "files_committed": 1})
+        summary = stats.summary()
+        self.assertEqual(summary["latency_seconds"], {"p50": 4.0, "p95": 4.0, "max": 4.0})
+        self.assertEqual(summary["queue_wait_seconds"]["max"], 2.0)
+        self.assertEqual(summary["tenants"]["a"]["files_failed"], 1)
+        stats.record("a", [("f3", 3.0)], 4.0, 5.0, set(), {"users_out": 1, "files_committed": 1})
+        summary = stats.summary()
+        self.assertEqual((summary["tenants"]["a"]["latency_seconds_sum"], summary["tenants"]["a"]["latency_seconds_count"]),
+                         (6.0, 2))
+        text = stats.prometheus_text()
+        self.assertIn('usersformatter_daemon_users_out_total{tenant="a"} 4', text)
+        self.assertIn("# TYPE usersformatter_daemon_tenant_latency_seconds summary", text)
+        self.assertIn('usersformatter_daemon_tenant_latency_seconds_sum{tenant="a"} 6.0', text)
+        self.assertIn('usersformatter_daemon_tenant_latency_seconds_count{tenant="a"} 2', text)
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.root = "test_daemon_root"
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        self.input_root = os.path.join(self.root, "input")
+        self.output_root = os.path.join(self.root, "output")
+        self.stats_path = os.path.join(self.root, "stats.json")
+        os.makedirs(self.input_root)
+
+    def tearDown(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+
+    def output_ids(self, tenant):
+        ids = []
+        directory = os.path.join(self.output_root, tenant)
+        for fname in sorted(os.listdir(directory)):
+            if fname.startswith("users_"):
+                with open(os.path.join(directory, fname), "r", encoding="utf-8") as f:
+                    ids.extend(user["Id"] for user in json.load(f))
+        return ids
+
+    def run_daemon(self, watcher, drops, expected_files):
+        async def run():
+            daemon = Daemon(self.input_root, self.output_root, watcher=watcher, poll_interval=0.02,
+                            max_files_per_job=1, executor="inline", stats_path=self.stats_path)
+            task = asyncio.create_task(daemon.run())
+            try:
+                for tenant, name, users in drops:
+                    drop_file(os.path.join(self.input_root, tenant), name, users)
+                    await asyncio.sleep(0.01)
+                await wait_for(lambda: daemon.stats.totals["files_committed"] + daemon.stats.totals["files_skipped"]
+                               >= expected_files)
+            finally:
+                daemon.stop()
+                await asyncio.wait_for(task, 10)
+            return daemon.stats.summary(daemon.queue)
+        return asyncio.run(run())
+
+    def check_watcher(self, watcher):
+        drop_file(os.path.join(self.input_root, "t1"), "a.json", 3)
+        summary = self.run_daemon(watcher, [("t2", "b.json", 2), ("t1", "c.json", 4)], 3)
+        self.assertEqual(self.output_ids("t1"), [f"a.json-{i}" for i in range(3)] + [f"c.json-{i}" for i in range(4)])
+        self.assertEqual(self.output_ids("t2"), ["b.json-0", "b.json-1"])
+        self.assertEqual(summary["totals"]["users_out"], 9)
+        self.assertEqual(summary["tenants"]["t1"]["files_committed"], 2)
+        with open(self.stats_path, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["totals"]["files_committed"], 3)
+        # A restart finds the committed files again and skips them
+        summary = self.run_daemon(watcher, [], 3)
+        self.assertEqual(summary["totals"].get("files_committed", 0), 0)
+        self.assertEqual(len(self.output_ids("t1")), 7)
+
+    def test_polling_watcher(self):
+        self.check_watcher("polling")
+
+    def test_inotify_watcher(self):
+        if not InotifyWatcher.supported():
+            self.skipTest("inotify is not available")
+        self.check_watcher("inotify")
+
+    def test_full_runs_are_rejected(self):
+        with self.assertRaises(ValueError):
+            Daemon(self.input_root, self.output_root, incremental=False)
+
+class TestSelectedFiles(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_selected_input"
+        self.output_dir = "test_selected_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_only_selected_files_are_processed(self):
+        for name in ("a.json", "b.json"):
+            drop_file(self.input_dir, name, 2)
+        run = lambda files, **kwargs: asyncio.run(process_users(
+            self.input_dir, self.output_dir, files=files, delta=True, tombstones=True, **kwargs))
+        self.assertEqual(run([os.path.join(self.input_dir, "b.json"), "missing.json"]), [])
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(list(json.load(f)["files"]), ["b.json"])
+        run(["a.json"])
+        # Users of b.json were left out of the second run but are not tombstoned
+        self.assertFalse(any(fname.startswith("tombstones_") for fname in os.listdir(self.output_dir)))
+        with self.assertRaises(ValueError):
+            run(["a.json"], incremental=False)
+
+if __name__ == "__main__":
+    unittest.main()
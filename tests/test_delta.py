@@ -0,0 +1,70 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from main import process_users
+from helpers import write_users_file, make_users
+
+class TestDeltaMode(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_delta_input"
+        self.output_dir = "test_delta_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def run_delta(self, **kwargs):
+        """Runs process_users in delta mode and returns the ids written and the tombstones of this run"""
+        before = set(os.listdir(self.output_dir)) if os.path.exists(self.output_dir) else set()
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, delta=True, tombstones=True, **kwargs))
+        ids, deleted = [], []
+        for fname in sorted(set(os.listdir(self.output_dir)) - before):
+            with open(os.path.join(self.output_dir, fname), "r", encoding="utf-8") as f:
+                if fname.startswith("users_"):
+                    ids.extend(user["Id"] for user in json.load(f))
+                elif fname.startswith("tombstones_"):
+                    deleted.extend(json.load(f))
+        return ids, deleted
+
+    def test_only_changed_users_are_written(self):
+        users = make_users("a", 25)
+        write_users_file(os.path.join(self.input_dir, "a.json"), users)
+        self.assertEqual(self.run_delta(), ([f"a{i}" for i in range(25)], []))
+
+        # Nothing changed: the file is processed again but no users are written
+        self.assertEqual(self.run_delta(incremental=False), ([], []))
+
+        users[3]["givenName"] = "John"
+        del users[7]
+        users.append({"id": "a99", "external_id": "xa99"})
+        write_users_file(os.path.join(self.input_dir, "a.json"), users)
+        self.assertEqual(self.run_delta(), (["a3", "a99"], ["a7"]))
+
+        # A user that comes back after being tombstoned is written again
+        users.append({"id": "a7", "external_id": "xa7", "givenName": "Jane"})
+        write_users_file(os.path.join(self.input_dir, "a.json"), users)
+        self.assertEqual(self.run_delta(), (["a7"], []))
+
+    def test_users_of_skipped_and_failed_files_are_kept(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), make_users("a", 5))
+        write_users_file(os.path.join(self.input_dir, "b.json"), make_users("b", 5))
+        self.run_delta()
+
+        # a.json is skipped as unchanged and b.json fails, neither may produce tombstones
+        with open(os.path.join(self.input_dir, "b.json"), "w", encoding="utf-8") as f:
+            f.write('{"value": [{"id": ')
+        self.assertEqual(self.run_delta(), ([], []))
+
+        # Once b.json reads again its unchanged users are still known
+        write_users_file(os.path.join(self.input_dir, "b.json"), make_users("b", 4))
+        self.assertEqual(self.run_delta(), ([], ["b4"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import json
+import pickle
+import shutil
+import unittest
+import asyncio
+from encoders import ENCODERS, JsonEncoder, OrjsonEncoder, MsgspecEncoder, get_encoder
+from io_utils import write_batches
+
+USERS = [
+    {"Id": "1", "mail": "naïve@example.com", "is_enabled": True, "tags": [], "signInActivity": None},
+    {"Id": "2", "mail": None, "is_enabled": False, "tags": ["a", {"b": 1}], "signInActivity": {"lastSignIn": {"dateTime": "t"}}},
+]
+
+class TestEncoders(unittest.TestCase):
+    def installed(self, indent):
+        return [cls(indent) for cls in ENCODERS.values() if cls.supports(indent)]
+
+    def test_encoders_produce_identical_bytes(self):
+        for indent in (None, 2, 4):
+            reference = JsonEncoder(indent)
+            for encoder in self.installed(indent):
+                with self.subTest(encoder=encoder.name, indent=indent):
+                    self.assertEqual([encoder.encode(user) for user in USERS], [reference.encode(user) for user in USERS])
+                    self.assertEqual(encoder.encode_array(USERS), reference.encode_array(USERS))
+
+    def test_float_exponents_and_big_integers_differ(self):
+        # orjson and msgspec write exponents without padding or sign, and orjson only takes 64 bit integers
+        values = {"small": 1e-7, "large": 1e16, "plain": 0.1, "big": 2 ** 70}
+        expected = {
+            "json": b'{"small":1e-07,"large":1e+16,"plain":0.1,"big":1180591620717411303424}',
+            "msgspec": b'{"small":1e-7,"large":1e16,"plain":0.1,"big":1180591620717411303424}',
+        }
+        for encoder in self.installed(None):
+            with self.subTest(encoder=encoder.name):
+                if encoder.name == "orjson":
+                    self.assertEqual(encoder.encode({"small": 1e-7, "large": 1e16}), b'{"small":1e-7,"large":1e16}')
+                    with self.assertRaises(TypeError):
+                        encoder.encode(values)
+                else:
+                    self.assertEqual(encoder.encode(values), expected[encoder.name])
+                    self.assertEqual(json.loads(encoder.encode(values)), values)
+
+    def test_array_is_valid_json(self):
+        for indent in (None, 2):
+            encoder = JsonEncoder(indent)
+            with self.subTest(indent=indent):
+                self.assertEqual(json.loads(encoder.join([encoder.encode(user) for user in USERS])), USERS)
+                self.assertEqual(json.loads(encoder.join([])), [])
+
+    def test_compact_is_default(self):
+        self.assertIsNone(get_encoder().indent)
+        self.assertNotIn(b"\n", get_encoder().encode_array(USERS))
+
+    def test_auto_detection_respects_indent(self):
+        self.assertTrue(get_encoder(indent=4).supports(4))
+
+    def test_named_and_instance_encoders(self):
+        encoder = JsonEncoder(2)
+        self.assertIs(get_encoder(encoder), encoder)
+        self.assertIsInstance(get_encoder("json", 2), JsonEncoder)
+        with self.assertRaises(ValueError):
+            get_encoder("yaml")
+
+    @unittest.skipUnless(OrjsonEncoder.supports(None), "orjson is not installed")
+    def test_orjson_rejects_unsupported_indent(self):
+        with self.assertRaises(ValueError):
+            get_encoder("orjson", 4)
+
+    def test_encoders_can_be_pickled(self):
+        """Process workers receive the encoder by pickle"""
+        for encoder in self.installed(2):
+            with self.subTest(encoder=encoder.name):
+                copy = pickle.loads(pickle.dumps(encoder))
+                self.assertEqual(copy.encode(USERS[1]), encoder.encode(USERS[1]))
+
+class TestWriteBatches(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_encoder_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_write_batches_with_encoder(self):
+        users = [{"id": i, "name": f"User {i}"} for i in range(25)]
+
+        async def user_gen():
+            for user in users:
+                yield user
+
+        asyncio.run(write_batches(self.test_dir, user_gen(), batch_size=10, encoder=JsonEncoder(2)))
+        batches = []
+        for fname in sorted(os.listdir(self.test_dir)):
+            with open(os.path.join(self.test_dir, fname), "rb") as f:
+                data = f.read()
+            self.assertTrue(data.startswith(b"[\n{\n  "))
+            batches.append(json.loads(data))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual([user for batch in batches for user in batch], users)
+
+if __name__ == "__main__":
+    unittest.main()
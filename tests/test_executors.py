@@ -0,0 +1,69 @@
+import unittest
+import asyncio
+import json
+from executors import get_executor_backend, InlineBackend, transform_and_encode
+from sharding import RawChunk
+from transformer import UserTransformer, MappedUserTransformer
+from encoders import JsonEncoder
+from sinks import BaseSink, JsonArraySink
+
+USERS = [
+    {"id": str(i), "external_id": f"ext-{i}", "givenName": f"User {i}",
+     "signInActivity": {"lastSignInDateTime": "2023-10-01T12:00:00Z"} if i % 2 else None}
+    for i in range(20)
+]
+
+class TestExecutorBackends(unittest.TestCase):
+    def run_backend(self, name):
+        backend = get_executor_backend(name, max_workers=2)
+        try:
+            return asyncio.run(backend.transform(UserTransformer(), USERS, JsonArraySink(JsonEncoder())))
+        finally:
+            backend.close()
+
+    def test_inline_output_is_serialized_transform(self):
+        encoded = self.run_backend("inline")
+        transformer = UserTransformer()
+        self.assertEqual([json.loads(user) for user in encoded], [transformer.transform(user) for user in USERS])
+
+    def test_thread_matches_inline(self):
+        self.assertEqual(self.run_backend("thread"), transform_and_encode(UserTransformer(), USERS, JsonArraySink(JsonEncoder())))
+
+    def test_process_matches_inline(self):
+        self.assertEqual(self.run_backend("process"), transform_and_encode(UserTransformer(), USERS, JsonArraySink(JsonEncoder())))
+
+    def test_process_parses_raw_chunks(self):
+        chunk = RawChunk(json.dumps(USERS).encode(), len(USERS))
+        sink = JsonArraySink(JsonEncoder())
+        backend = get_executor_backend("process", max_workers=1)
+        try:
+            for engine in ("record", "typed"):
+                with self.subTest(engine=engine):
+                    encoded = asyncio.run(backend.transform(UserTransformer(), chunk, sink, engine))
+                    self.assertEqual(encoded, transform_and_encode(UserTransformer(), USERS, sink))
+        finally:
+            backend.close()
+
+    def test_process_workers_import_unregistered_transformers(self):
+        backend = get_executor_backend("process", max_workers=1)
+        try:
+            encoded = asyncio.run(backend.transform(MappedUserTransformer(), USERS, JsonArraySink(JsonEncoder())))
+        finally:
+            backend.close()
+        self.assertEqual(encoded, transform_and_encode(UserTransformer(), USERS, JsonArraySink(JsonEncoder())))
+
+    def test_columnar_falls_back_for_non_json_sinks(self):
+        """Sinks that do not store JSON text get transformed dicts even with the columnar engine"""
+        result = transform_and_encode(UserTransformer(), USERS, BaseSink(), "columnar")
+        self.assertEqual(result, UserTransformer().transform_batch(USERS))
+
+    def test_backend_instance_is_passed_through(self):
+        backend = InlineBackend()
+        self.assertIs(get_executor_backend(backend), backend)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_executor_backend("gpu")
+
+if __name__ == "__main__":
+    unittest.main()
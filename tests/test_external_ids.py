@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+import uuid
+from unittest import mock
+from external_ids import (
+    BulkRandomExternalIds, DerivedExternalIds, GRAPH_USER_NAMESPACE, RandomExternalIds, get_external_id_strategy,
+)
+from main import process_users
+from transformer import UserTransformer, MappedUserTransformer
+from columnar import get_columnar_encoder
+from routing import get_transformer
+from helpers import read_output
+
+class TestExternalIdStrategies(unittest.TestCase):
+    def test_uuid5_matches_uuid_module(self):
+        strategy = DerivedExternalIds()
+        for user_id in ("87d349ed-44d7-43e1-9a83-5f2406dee5bd", "1", "naïve"):
+            self.assertEqual(strategy({"id": user_id}), str(uuid.uuid5(GRAPH_USER_NAMESPACE, user_id)))
+
+    def test_uuid5_without_id_is_random(self):
+        self.assertEqual(uuid.UUID(DerivedExternalIds()({})).version, 4)
+
+    def test_bulk_random_ids_are_unique_version_4(self):
+        strategy = BulkRandomExternalIds(block_size=64)
+        ids = [strategy({}) for _ in range(1000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        for value in ids:
+            parsed = uuid.UUID(value)
+            self.assertEqual((parsed.version, parsed.variant), (4, uuid.RFC_4122))
+            self.assertEqual(str(parsed), value)
+
+    def test_get_strategy(self):
+        self.assertIsInstance(get_external_id_strategy(), RandomExternalIds)
+        self.assertIs(get_external_id_strategy("uuid5"), get_external_id_strategy("uuid5"))
+        with self.assertRaises(ValueError):
+            get_external_id_strategy("uuid7")
+
+class TestTransformerExternalIds(unittest.TestCase):
+    def test_strategy_only_called_for_users_without_external_id(self):
+        strategy = mock.Mock(return_value="generated")
+        users = [{"id": "1", "external_id": "given"}, {"id": "2"}]
+        for transformer in (UserTransformer(strategy), MappedUserTransformer(strategy)):
+            with self.subTest(transformer=type(transformer).__name__):
+                strategy.reset_mock()
+                results = transformer.transform_batch(users)
+                self.assertEqual([user["external_id"] for user in results], ["given", "generated"])
+                strategy.assert_called_once_with(users[1])
+
+    def test_engines_agree_on_derived_ids(self):
+        users = [{"id": str(i)} for i in range(5)]
+        transformer = UserTransformer("uuid5")
+        expected = [json.dumps(user, separators=(",", ":")).encode("utf-8") for user in transformer.transform_batch(users)]
+        self.assertEqual(get_columnar_encoder(transformer)(users), expected)
+
+class TestTransformerInit(unittest.TestCase):
+    def test_strategy_is_assigned_after_construction(self):
+        class Tagged(MappedUserTransformer):
+            def __init__(self):
+                self.tag = "t"
+
+        user = {"id": "1"}
+        transformer = get_transformer(Tagged, "uuid5")
+        self.assertIs(transformer, get_transformer(Tagged, "uuid5"))
+        self.assertEqual(transformer.transform(user)["external_id"], str(uuid.uuid5(GRAPH_USER_NAMESPACE, "1")))
+        self.assertEqual(get_columnar_encoder(transformer, None)([user]), [json.dumps(transformer.transform(user),
+                                                                                     separators=(",", ":")).encode()])
+        # Until a strategy is assigned, transformers use the default one
+        self.assertIs(Tagged().external_ids, get_external_id_strategy())
+
+class TestProcessUsersExternalIds(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_external_ids_input"
+        self.output_dir = "test_external_ids_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+        with open(os.path.join(self.input_dir, "a.json"), "w", encoding="utf-8") as f:
+            json.dump({"value": [{"id": f"a{i}"} for i in range(25)]}, f)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def read_external_ids(self):
+        return [user["external_id"] for batch in read_output(self.output_dir) for user in batch]
+
+    def test_derived_ids_are_stable_across_runs_and_backends(self):
+        expected = [str(uuid.uuid5(GRAPH_USER_NAMESPACE, f"a{i}")) for i in range(25)]
+        for executor in ("inline", "process"):
+            with self.subTest(executor=executor):
+                shutil.rmtree(self.output_dir, ignore_errors=True)
+                asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, executor=executor,
+                                          max_workers=1, external_ids="uuid5"))
+                self.assertEqual(self.read_external_ids(), expected)
+
+    def test_delta_mode_recognizes_users_without_external_id(self):
+        for expected_count in (25, 0):
+            asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, delta=True, incremental=False,
+                                      external_ids="uuid5"))
+            self.assertEqual(len(self.read_external_ids()), expected_count)
+
+if __name__ == "__main__":
+    unittest.main()
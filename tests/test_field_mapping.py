@@ -0,0 +1,72 @@
+import os
+import glob
+import unittest
+import uuid
+from unittest import mock
+from field_mapping import Field, Nested, compile_mapping
+from encoders import JsonEncoder
+from io_utils import read_json_stream
+from transformer import UserTransformer, MappedUserTransformer
+
+class TestCompileMapping(unittest.TestCase):
+    def test_renames_and_keeps_target_order(self):
+        transform = compile_mapping({"b": "x", "a": "y"})
+        result = transform({"y": 2, "x": 1, "z": 3})
+        self.assertEqual(list(result.items()), [("b", 1), ("a", 2)])
+
+    def test_missing_fields_use_defaults(self):
+        transform = compile_mapping({"a": "x", "b": Field("y", default="none")})
+        self.assertEqual(transform({}), {"a": None, "b": "none"})
+
+    def test_default_factory_only_called_when_missing(self):
+        factory = mock.Mock(return_value="generated")
+        transform = compile_mapping({"id": Field("id", default_factory=factory)})
+        self.assertEqual(transform({"id": "given"}), {"id": "given"})
+        factory.assert_not_called()
+        self.assertEqual(transform({}), {"id": "generated"})
+        factory.assert_called_once()
+
+    def test_dotted_source_path(self):
+        transform = compile_mapping({"city": "address.city"})
+        self.assertEqual(transform({"address": {"city": "Oslo"}}), {"city": "Oslo"})
+        self.assertEqual(transform({"address": None}), {"city": None})
+        self.assertEqual(transform({}), {"city": None})
+
+    def test_grouping_and_nested_source(self):
+        transform = compile_mapping({
+            "name": {"first": "givenName", "last": "surname"},
+            "activity": Nested("activity", {"last": {"at": "lastDateTime"}}),
+        })
+        self.assertEqual(
+            transform({"givenName": "Jane", "surname": "Doe", "activity": {"lastDateTime": "t"}}),
+            {"name": {"first": "Jane", "last": "Doe"}, "activity": {"last": {"at": "t"}}}
+        )
+        self.assertEqual(transform({"activity": {}})["activity"], None)
+
+    def test_unsupported_value(self):
+        with self.assertRaises(TypeError):
+            compile_mapping({"a": 1})
+
+class TestMappedUserTransformer(unittest.TestCase):
+    def test_byte_identical_to_user_transformer(self):
+        """Given the bundled sample users, the compiled mapping should serialize exactly like UserTransformer"""
+        users = []
+        for path in sorted(glob.glob(os.path.join("usersapi", "fake_users_part_*.json"))):
+            users.extend(read_json_stream(path))
+        users.append({})
+        users.append({"id": "1", "external_id": "ext-1", "signInActivity": {}})
+
+        encode_record = JsonEncoder(indent=2).encode
+        fixed = uuid.UUID("12345678-1234-5678-1234-567812345678")
+        with mock.patch("uuid.uuid4", return_value=fixed):
+            expected = [encode_record(user) for user in UserTransformer().transform_batch(users)]
+            result = [encode_record(user) for user in MappedUserTransformer().transform_batch(users)]
+
+        self.assertEqual(result, expected)
+
+    def test_invalid_input(self):
+        with self.assertRaises(Exception):
+            MappedUserTransformer().transform(None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from io_utils import aread_json_stream, read_json_stream, ODataStream, HEADER_READ_SIZE
+
+class TestJsonStream(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_stream_input"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.path = os.path.join(self.test_dir, "users.json")
+        self.users = [{"id": str(i), "givenName": f"User {i}", "otherMails": [f"u{i}@example.com"]} for i in range(250)]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#users", "value": self.users}, f, indent=4)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def collect(self, **kwargs):
+        async def run():
+            return [user async for user in aread_json_stream(self.path, **kwargs)]
+        return asyncio.run(run())
+
+    def test_streams_all_users_in_order(self):
+        self.assertEqual(self.collect(), self.users)
+
+    def test_small_chunks_split_records(self):
+        """Users that span chunk boundaries should still be decoded correctly"""
+        self.assertEqual(self.collect(read_size=7, read_ahead=1), self.users)
+
+    def test_matches_sync_reader(self):
+        self.assertEqual(self.collect(read_size=1024), list(read_json_stream(self.path)))
+
+    def test_early_close_stops_reader(self):
+        """Abandoning the stream early should not leave the reader task running"""
+        async def run():
+            stream = aread_json_stream(self.path, read_size=16, read_ahead=1)
+            first = await stream.__anext__()
+            await stream.aclose()
+            await asyncio.sleep(0)
+            pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            return first, pending
+        first, pending = asyncio.run(run())
+        self.assertEqual(first, self.users[0])
+        self.assertEqual(pending, [])
+
+    def test_truncated_file_raises(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"value": [{"id": "1"}, {"id": ')
+        with self.assertRaises(Exception):
+            self.collect()
+
+class TestODataContext(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_context_input"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.path = os.path.join(self.test_dir, "users.json")
+        self.context = "https://graph.microsoft.com/beta/$metadata#users(id,mail)"
+        self.users = [{"id": str(i), "mail": f"user{i}@example.com"} for i in range(500)]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write(self, document):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(document)
+
+    def sniff(self, **kwargs):
+        """Returns the context, the file position after sniffing and the users streamed afterwards"""
+        async def run():
+            async with ODataStream(self.path, **kwargs) as stream:
+                context = await stream.read_context()
+                position = await stream.file.tell()
+                users = [user async for user in stream.users()]
+                return context, position, users
+        return asyncio.run(run())
+
+    def test_context_first_reads_only_header(self):
+        self.write(json.dumps({"@odata.context": self.context, "value": self.users}, indent=4))
+        context, position, users = self.sniff()
+        self.assertEqual(context, self.context)
+        self.assertLessEqual(position, HEADER_READ_SIZE)
+        self.assertEqual(users, self.users)
+
+    def test_large_header_before_context(self):
+        next_link = "https://graph.microsoft.com/beta/users?$skiptoken=" + "x" * 10000
+        self.write(json.dumps({"@odata.nextLink": next_link, "@odata.count": 500,
+                               "@odata.context": self.context, "value": self.users}))
+        context, _, users = self.sniff(read_size=100)
+        self.assertEqual(context, self.context)
+        self.assertEqual(users, self.users)
+
+    def test_context_after_value(self):
+        self.write(json.dumps({"value": self.users, "@odata.context": self.context}))
+        context, _, users = self.sniff()
+        self.assertEqual(context, self.context)
+        self.assertEqual(users, self.users)
+
+    def test_nested_context_key_is_ignored(self):
+        self.write(json.dumps({"@odata": {"context": "nested"}, "value": self.users}))
+        context, _, users = self.sniff()
+        self.assertEqual(context, "")
+        self.assertEqual(users, self.users)
+
+    def test_missing_context(self):
+        self.write(json.dumps({"value": self.users}))
+        context, _, users = self.sniff()
+        self.assertEqual(context, "")
+        self.assertEqual(users, self.users)
+
+    def test_small_file_read_entirely_by_sniff(self):
+        self.write(json.dumps({"value": self.users[:2], "@odata.context": self.context}))
+        context, _, users = self.sniff()
+        self.assertEqual(context, self.context)
+        self.assertEqual(users, self.users[:2])
+
+    def test_bundled_sample_routes_to_users(self):
+        self.path = os.path.join("usersapi", "fake_users_part_1.json")
+        context, _, users = self.sniff()
+        self.assertIn("#users(", context)
+        self.assertEqual(len(users), 1250)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import sqlite3
+import unittest
+import asyncio
+from main import process_users
+from loaders import SqliteLoader, FileLoad, get_loader, upsert_statement, user_rows, SQLITE_FILE
+from helpers import write_users_file, make_users, batch_files, read_output
+
+class FailingLoader(SqliteLoader):
+    async def load_rows(self, rows):
+        if any(row[0] == "b3" for row in rows):
+            raise RuntimeError("load failed")
+        await super().load_rows(rows)
+
+class TestLoaders(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_loaders_input"
+        self.output_dir = "test_loaders_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+        self.db_path = os.path.join(self.output_dir, SQLITE_FILE)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def loaded(self):
+        with sqlite3.connect(self.db_path) as connection:
+            return {row[0]: row[1:] for row in connection.execute('SELECT * FROM users ORDER BY "Id"')}
+
+    def test_loads_alongside_batch_files(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), make_users("a", 25, sign_in=True))
+        write_users_file(os.path.join(self.input_dir, "b.json"), make_users("b", 7, sign_in=True))
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, loader="sqlite"))
+        users = {user["Id"]: user for batch in read_output(self.output_dir) for user in batch}
+        loaded = self.loaded()
+        self.assertEqual(len(loaded), 32)
+        self.assertEqual(set(loaded), set(users))
+        self.assertEqual(loaded["a1"][0], "xa1")
+        self.assertEqual(json.loads(loaded["a1"][-1]), users["a1"]["signInActivity"])
+        self.assertIsNone(loaded["a0"][-1])
+
+    def test_loader_only_upserts_changes(self):
+        path = os.path.join(self.input_dir, "a.json")
+        write_users_file(path, make_users("a", 12, sign_in=True))
+        for executor in ("inline", "process"):
+            with self.subTest(executor=executor):
+                asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=5, loader="sqlite",
+                                          write_files=False, executor=executor, max_workers=2, incremental=False))
+                self.assertEqual(batch_files(self.output_dir), [])
+                self.assertEqual(len(self.loaded()), 12)
+        write_users_file(path, make_users("a", 14, name="John", sign_in=True))
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=5, loader="sqlite", write_files=False))
+        loaded = self.loaded()
+        self.assertEqual(len(loaded), 14)
+        self.assertEqual({row[5] for row in loaded.values()}, {"John"})
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["files"]["a.json"]["users"], 14)
+
+    def test_failed_load_is_retried(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), make_users("a", 4, sign_in=True))
+        write_users_file(os.path.join(self.input_dir, "b.json"), make_users("b", 6, sign_in=True))
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=2, loader=FailingLoader(self.db_path, batch_size=2)))
+        # Batch files of the file that failed to load are not committed
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(list(json.load(f)["files"]), ["a.json"])
+        self.assertEqual(len(batch_files(self.output_dir)), 2)
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=2, loader="sqlite"))
+        self.assertEqual(len(self.loaded()), 10)
+        self.assertEqual(len(batch_files(self.output_dir)), 5)
+
+    def test_delta_mode_loads_only_changes(self):
+        path = os.path.join(self.input_dir, "a.json")
+        write_users_file(path, make_users("a", 5, sign_in=True))
+        run = lambda: asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=2, loader="sqlite",
+                                                write_files=False, delta=True, incremental=False))
+        run()
+        self.assertEqual(len(self.loaded()), 5)
+        users = make_users("a", 5, sign_in=True)
+        users[3]["givenName"] = "Changed"
+        write_users_file(path, users)
+        loader_rows = []
+        original = SqliteLoader.load_rows
+        async def record(loader, rows):
+            loader_rows.extend(rows)
+            await original(loader, rows)
+        SqliteLoader.load_rows = record
+        try:
+            run()
+        finally:
+            SqliteLoader.load_rows = original
+        self.assertEqual([row[0] for row in loader_rows], ["a3"])
+        self.assertEqual(self.loaded()["a3"][5], "Changed")
+
+    def test_file_load_batches_rows(self):
+        async def run():
+            loader = SqliteLoader(self.db_path, batch_size=3)
+            await loader.start()
+            try:
+                load = FileLoad(loader, "a.json")
+                for start in range(0, 10, 4):
+                    await load.add(user_rows({"Id": str(i)} for i in range(start, min(start + 4, 10))))
+                self.assertEqual(len(load.pending), 3)
+                return await load.finish()
+            finally:
+                await loader.stop()
+        os.makedirs(self.output_dir)
+        self.assertEqual(asyncio.run(run()), 10)
+        self.assertEqual(len(self.loaded()), 10)
+
+    def test_options_are_validated(self):
+        self.assertIsNone(get_loader(None, self.output_dir))
+        with self.assertRaises(ValueError):
+            get_loader("oracle", self.output_dir)
+        with self.assertRaises(ValueError):
+            asyncio.run(process_users(self.input_dir, self.output_dir, write_files=False))
+        with self.assertRaises(ValueError):
+            asyncio.run(process_users(self.input_dir, self.output_dir, loader="sqlite", shards=2))
+
+    def test_upsert_statement(self):
+        self.assertEqual(
+            upsert_statement("t", ("Id", "mail"), placeholder="$"),
+            'INSERT INTO "t" ("Id", "mail") VALUES ($1, $2) ON CONFLICT ("Id") DO UPDATE SET "mail" = excluded."mail"',
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import unittest
+import asyncio
+from manifest import Manifest, fingerprint_file
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_manifest_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.input_path = os.path.join(self.test_dir, "input.json")
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write('{"value": []}')
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def record_input(self, settings=None):
+        manifest = Manifest(self.test_dir, settings)
+        manifest.next_index = 1
+        manifest.record(self.input_path, fingerprint_file(self.input_path), "UserTransformer", ["users_000.json"], 0)
+        manifest.save()
+
+    def test_same_content_with_new_mtime_is_unchanged(self):
+        self.record_input()
+        stat = os.stat(self.input_path)
+        os.utime(self.input_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        manifest = Manifest.load(self.test_dir)
+        self.assertEqual(manifest.next_index, 1)
+        self.assertTrue(asyncio.run(manifest.is_unchanged(self.input_path)))
+        self.assertEqual(manifest.files["input.json"]["mtime_ns"], stat.st_mtime_ns + 10**9)
+
+    def test_changed_content_is_detected(self):
+        self.record_input()
+        stat = os.stat(self.input_path)
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write('{"value": [1]}')
+        os.utime(self.input_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertFalse(asyncio.run(Manifest.load(self.test_dir).is_unchanged(self.input_path)))
+
+    def test_other_transformer_is_a_change(self):
+        self.record_input()
+        manifest = Manifest.load(self.test_dir)
+
+        async def transformer_of(name):
+            return name
+
+        self.assertTrue(asyncio.run(manifest.is_unchanged(self.input_path, lambda path: transformer_of("UserTransformer"))))
+        self.assertFalse(asyncio.run(manifest.is_unchanged(self.input_path, lambda path: transformer_of("GroupTransformer"))))
+
+    def test_other_settings_discard_manifest(self):
+        self.record_input({"sink": "json"})
+        manifest = Manifest.load(self.test_dir, {"sink": "ndjson"})
+        self.assertEqual(manifest.files, {})
+        self.assertEqual(manifest.next_index, 0)
+        self.assertEqual(manifest.stale_batches, ["users_000.json"])
+
+if __name__ == "__main__":
+    unittest.main()
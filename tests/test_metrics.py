@@ -0,0 +1,67 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from main import process_users
+from metrics import RunMetrics
+from helpers import write_users_file
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_metrics_input"
+        self.output_dir = "test_metrics_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+        os.makedirs(self.output_dir)
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}", "external_id": "x"} for i in range(25)])
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}", "external_id": "x"} for i in range(15)])
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_summary_covers_stages_files_and_queues(self):
+        for executor in ("thread", "process"):
+            with self.subTest(executor=executor):
+                json_path = os.path.join(self.output_dir, f"{executor}.json")
+                metrics = RunMetrics(json_path=json_path)
+                asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, executor=executor, max_workers=2,
+                                          incremental=False, metrics=metrics))
+                with open(json_path, "r", encoding="utf-8") as f:
+                    summary = json.load(f)
+
+                counters = summary["counters"]
+                self.assertEqual((counters["users_in"], counters["users_out"], counters["batches"]), (40, 40, 5))
+                self.assertEqual(counters["files_committed"], 2)
+                self.assertGreater(counters["bytes_out"], 0)
+                self.assertEqual(set(summary["stages"]), {"header", "parse", "transform", "encode", "write"})
+                self.assertEqual(summary["stages"]["transform"]["calls"], 5)
+                self.assertEqual(summary["files"]["a.json"]["users_in"], 25)
+                self.assertEqual(summary["files"]["b.json"]["batches"], 2)
+                self.assertIn("write", summary["files"]["a.json"]["stages"])
+                self.assertIn("transform_queue", summary["gauges"])
+                self.assertEqual(summary["info"]["executor"], executor)
+
+    def test_prometheus_textfile(self):
+        textfile_path = os.path.join(self.output_dir, "usersformatter.prom")
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, metrics=RunMetrics(textfile_path=textfile_path)))
+        with open(textfile_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertIn("# TYPE usersformatter_stage_seconds_total counter", lines)
+        self.assertIn('usersformatter_users_total{stage="in"} 40', lines)
+        self.assertIn('usersformatter_files_total{state="skipped"} 0', lines)
+        self.assertIn("# TYPE usersformatter_bytes_total counter", lines)
+        self.assertIn("# TYPE usersformatter_batches_total counter", lines)
+        self.assertFalse(any("events_total" in line for line in lines))
+        for line in lines:
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                float(value)
+                self.assertTrue(name.startswith("usersformatter_"))
+
+if __name__ == "__main__":
+    unittest.main()
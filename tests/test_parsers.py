@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+import ijson
+from io_utils import aread_json_stream, read_json_stream, ODataStream
+from parsers import get_parser, compile_projection, selected_fields, BulkParser, IjsonParser, ProjectedItems, PARSERS
+from main import process_users
+from helpers import write_users_file, batch_files
+
+class TestParsers(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_parsers_input"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.path = os.path.join(self.test_dir, "users.json")
+        # signInActivity objects that only hold fields UserTransformer does not read must not vanish
+        activities = [{"foo": {"bar": [1]}}, {}, None, {"lastSignInDateTime": "t", "foo": 1}]
+        self.users = [{"id": str(i), "givenName": f"Ünïcode {i}", "otherMails": [f"u{i}@example.com"],
+                       "signInActivity": activities[i % 4]} for i in range(50)]
+        write_users_file(self.path, self.users)
+        self.installed = [name for name in PARSERS
+                          if (BulkParser.supports() if name == "bulk" else IjsonParser.supports(name))]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def collect(self, parser, **kwargs):
+        async def run():
+            return [user async for user in aread_json_stream(self.path, parser=parser, **kwargs)]
+        return asyncio.run(run())
+
+    def test_parsers_read_same_users(self):
+        for name in self.installed:
+            with self.subTest(parser=name):
+                self.assertEqual(self.collect(name), self.users)
+                self.assertEqual(list(read_json_stream(self.path, parser=name)), self.users)
+
+    def test_context_is_read_with_every_parser(self):
+        async def run(name):
+            async with ODataStream(self.path, parser=name) as stream:
+                return await stream.read_context(), [user async for user in stream.users()]
+        for name in self.installed:
+            with self.subTest(parser=name):
+                context, users = asyncio.run(run(name))
+                self.assertEqual(context, "https://graph.microsoft.com/beta/$metadata#users")
+                self.assertEqual(users, self.users)
+
+    def test_auto_selection_follows_memory_budget(self):
+        size = os.path.getsize(self.path)
+        if BulkParser.supports():
+            self.assertEqual(get_parser(None, size, memory_budget=size).name, "bulk")
+        self.assertTrue(get_parser(None, size, memory_budget=size - 1).streaming)
+        self.assertTrue(get_parser(None).streaming)
+
+    def test_bulk_parser_rejects_truncated_file(self):
+        if not BulkParser.supports():
+            self.skipTest("orjson or msgspec is not installed")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"value": [{"id": "1"}, {"id": ')
+        with self.assertRaises(Exception):
+            self.collect("bulk")
+
+    def test_projection_keeps_only_declared_fields(self):
+        async def run():
+            fields = ("id", "otherMails", "signInActivity.lastSignInDateTime")
+            return [user async for user in aread_json_stream(self.path, parser="python", read_size=7, fields=fields)]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"@odata.nextLink": {"value": [1]}, "value": [
+                {"id": "1", "mail": {"a": [1, {"b": 2}]}, "otherMails": ["x", {"y": []}], "signInActivity": None},
+                {"signInActivity": {"lastSignInDateTime": "t", "lastSignInRequestId": "r"}, "id": "2"},
+                [1, 2],
+            ], "@odata.context": "https://graph.microsoft.com/beta/$metadata#users"}, f)
+        self.assertEqual(asyncio.run(run()), [
+            {"id": "1", "otherMails": ["x", {"y": []}], "signInActivity": None},
+            {"signInActivity": {"lastSignInDateTime": "t"}, "id": "2"},
+            [1, 2],
+        ])
+
+    def test_projection_keeps_objects_with_only_undeclared_fields_truthy(self):
+        async def run():
+            fields = ("id", "signInActivity.lastSignInDateTime")
+            return [user async for user in aread_json_stream(self.path, parser="python", fields=fields)]
+        write_users_file(self.path, [{"id": "1", "signInActivity": {"foo": [1], "bar": 2}}, {"id": "2", "signInActivity": {}},
+                                     {"mail": "m"}])
+        self.assertEqual(asyncio.run(run()), [{"id": "1", "signInActivity": {"foo": None}},
+                                              {"id": "2", "signInActivity": {}}, {"mail": None}])
+
+    def test_projection_matches_items_without_fields(self):
+        items = []
+        parser = ijson.get_backend("python").basic_parse_coro(ProjectedItems(None, items))
+        with open(self.path, "rb") as f:
+            parser.send(f.read())
+        parser.close()
+        self.assertEqual(items, self.users)
+
+    def test_parsers_produce_same_output(self):
+        outputs = {}
+        for name in self.installed:
+            output_dir = os.path.join(self.test_dir, f"output_{name}")
+            asyncio.run(process_users(self.test_dir, output_dir, chunk_size=20, parser=name, external_ids="uuid5"))
+            with open(os.path.join(output_dir, "users_000.json"), "r", encoding="utf-8") as f:
+                self.assertEqual([user["signInActivity"] is None for user in json.load(f)[:4]], [False, True, True, False])
+            outputs[name] = []
+            for fname in batch_files(output_dir):
+                with open(os.path.join(output_dir, fname), "rb") as f:
+                    outputs[name].append(f.read())
+        for name in self.installed:
+            with self.subTest(parser=name):
+                self.assertEqual(outputs[name], outputs["python"])
+
+    def test_yajl2_c_only_projects_wide_selects(self):
+        fields = ("id", "mail", "signInActivity.lastSignInDateTime")
+        narrow = "https://graph.microsoft.com/beta/$metadata#users(id,mail,signInActivity,otherMails)"
+        wide = "https://graph.microsoft.com/beta/$metadata#users(" + ",".join(f"f{i}" for i in range(12)) + ")"
+        self.assertEqual(selected_fields(narrow), ["id", "mail", "signInActivity", "otherMails"])
+        self.assertIsNone(selected_fields("https://graph.microsoft.com/beta/$metadata#users"))
+        self.assertTrue(IjsonParser("python").projects(fields, None))
+        self.assertFalse(IjsonParser("python").projects(None, wide))
+        if IjsonParser.supports("yajl2_c"):
+            self.assertFalse(IjsonParser("yajl2_c").projects(fields, narrow))
+            self.assertTrue(IjsonParser("yajl2_c").projects(fields, wide))
+
+    def test_compile_projection(self):
+        self.assertIsNone(compile_projection(None))
+        self.assertEqual(compile_projection(["a", "b.c", "b.d", "e", "e.f"]), {"a": None, "b": {"c": None, "d": None}, "e": None})
+
+    def test_unknown_parser_raises(self):
+        with self.assertRaises(ValueError):
+            get_parser("yaml")
+
+if __name__ == "__main__":
+    unittest.main()
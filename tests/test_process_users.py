@@ -0,0 +1,207 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from main import process_users, ProcessOptions, ODATA_TRANSFORMER_MAP
+from metrics import RunMetrics
+from transformer import BaseTransformer
+from external_ids import get_external_id_strategy
+from helpers import write_users_file, batch_files, read_output
+
+class GroupTransformer(BaseTransformer):
+    def transform(self, group):
+        return {"group": group["id"]}
+
+class PrefixedGroupTransformer(BaseTransformer):
+    # Takes no external id strategy; it is assigned after construction
+    def __init__(self):
+        self.prefix = "group-"
+
+    def transform(self, group):
+        return {"group": self.prefix + group["id"], "external_id": self.external_ids(group)}
+
+class TestProcessUsers(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_pipeline_input"
+        self.output_dir = "test_pipeline_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_batches_follow_input_file_order(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(25)])
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}"} for i in range(15)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, max_concurrent_files=2))
+
+        batches = read_output(self.output_dir)
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5, 10, 5])
+        ids = [user["Id"] for batch in batches for user in batch]
+        self.assertEqual(ids, [f"a{i}" for i in range(25)] + [f"b{i}" for i in range(15)])
+
+    def test_executor_backends_produce_same_output(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}", "external_id": f"x{i}"} for i in range(25)])
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}", "external_id": f"y{i}"} for i in range(15)])
+        outputs = {}
+        for executor in ("inline", "thread", "process"):
+            with self.subTest(executor=executor):
+                shutil.rmtree(self.output_dir, ignore_errors=True)
+                asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, executor=executor, max_workers=2))
+                outputs[executor] = read_output(self.output_dir)
+        self.assertEqual(outputs["thread"], outputs["inline"])
+        self.assertEqual(outputs["process"], outputs["inline"])
+
+    def test_columnar_engine_matches_record_engine(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [
+            {"id": f"a{i}", "external_id": f"x{i}", "givenName": "Jane", "signInActivity": {"lastSignInDateTime": "t"} if i % 3 else None}
+            for i in range(25)
+        ])
+        outputs = {}
+        for engine in ("record", "columnar"):
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+            asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, engine=engine))
+            outputs[engine] = read_output(self.output_dir)
+        self.assertEqual(outputs["columnar"], outputs["record"])
+
+    def test_options_object_and_keyword_overrides(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(6)])
+        options = ProcessOptions(chunk_size=2, executor="inline", sink="ndjson")
+        asyncio.run(process_users(self.input_dir, self.output_dir, options, chunk_size=3))
+        self.assertEqual(batch_files(self.output_dir), ["users_000.ndjson", "users_001.ndjson"])
+        with self.assertRaises(TypeError):
+            asyncio.run(process_users(self.input_dir, self.output_dir, chunk_sise=3))
+
+    def test_concurrent_writers_keep_batch_order(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(95)])
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}"} for i in range(42)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, max_concurrent_writes=8))
+
+        self.assertEqual(len(batch_files(self.output_dir)), 15)
+        ids = [user["Id"] for batch in read_output(self.output_dir) for user in batch]
+        self.assertEqual(ids, [f"a{i}" for i in range(95)] + [f"b{i}" for i in range(42)])
+
+    def test_failed_file_produces_no_output(self):
+        """A file that breaks part way through should not leave any of its batches behind"""
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(10)])
+        with open(os.path.join(self.input_dir, "b.json"), "w", encoding="utf-8") as f:
+            users = ",".join(json.dumps({"id": f"b{i}"}) for i in range(30))
+            f.write('{"value": [' + users + ', {"id": ')
+        write_users_file(os.path.join(self.input_dir, "c.json"), [{"id": f"c{i}"} for i in range(5)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10, max_concurrent_files=1))
+
+        self.assertEqual(batch_files(self.output_dir), ["users_000.json", "users_001.json"])
+        ids = [user["Id"] for batch in read_output(self.output_dir) for user in batch]
+        self.assertEqual(ids, [f"a{i}" for i in range(10)] + [f"c{i}" for i in range(5)])
+
+    def test_rerun_skips_unchanged_files(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(25)])
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}"} for i in range(15)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10))
+        first_run = {fname: os.stat(os.path.join(self.output_dir, fname)).st_mtime_ns for fname in batch_files(self.output_dir)}
+
+        # Only the changed file is processed again, its batches are numbered after the existing ones
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}"} for i in range(12)])
+        write_users_file(os.path.join(self.input_dir, "c.json"), [{"id": f"c{i}"} for i in range(3)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10))
+
+        self.assertEqual(batch_files(self.output_dir), [f"users_{i:03d}.json" for i in (0, 1, 2, 5, 6, 7)])
+        for fname in ("users_000.json", "users_001.json", "users_002.json"):
+            self.assertEqual(os.stat(os.path.join(self.output_dir, fname)).st_mtime_ns, first_run[fname])
+        ids = [user["Id"] for batch in read_output(self.output_dir) for user in batch]
+        self.assertEqual(ids, [f"a{i}" for i in range(25)] + [f"b{i}" for i in range(12)] + [f"c{i}" for i in range(3)])
+
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["next_index"], 8)
+        self.assertEqual(manifest["files"]["b.json"]["batches"], ["users_005.json", "users_006.json"])
+        self.assertEqual(manifest["files"]["b.json"]["users"], 12)
+        self.assertEqual(manifest["files"]["b.json"]["transformer"], "UserTransformer")
+
+    def test_rerun_with_output_changing_options_starts_over(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(5)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid4"))
+        random_ids = [user["external_id"] for user in read_output(self.output_dir)[0]]
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5"))
+        derived_ids = [user["external_id"] for user in read_output(self.output_dir)[0]]
+        self.assertEqual(batch_files(self.output_dir), ["users_000.json"])
+        self.assertNotEqual(derived_ids, random_ids)
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5"))
+        self.assertEqual([user["external_id"] for user in read_output(self.output_dir)[0]], derived_ids)
+
+        # Switching to delta mode processes the file again instead of skipping it
+        metrics = RunMetrics()
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5", delta=True, metrics=metrics))
+        self.assertEqual(metrics.counters["files_committed"], 1)
+        self.assertNotIn("files_skipped", metrics.counters)
+
+        # As does switching encoders, which write some floats differently
+        metrics = RunMetrics()
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5", delta=True, encoder="json",
+                                  metrics=metrics))
+        self.assertEqual(metrics.counters["files_committed"], 1)
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["settings"]["encoder"], "json")
+
+        # And switching engines, since the columnar engine writes floats the way json does
+        metrics = RunMetrics()
+        asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5", delta=True, encoder="json",
+                                  engine="columnar", metrics=metrics))
+        self.assertEqual(metrics.counters["files_committed"], 1)
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["settings"]["engine"], "columnar")
+
+    def test_rerun_reads_files_routed_to_another_transformer(self):
+        with open(os.path.join(self.input_dir, "g.json"), "w", encoding="utf-8") as f:
+            json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#groups", "value": [{"id": "g0"}]}, f)
+        asyncio.run(process_users(self.input_dir, self.output_dir))
+        self.assertEqual(read_output(self.output_dir)[0][0]["Id"], "g0")
+        ODATA_TRANSFORMER_MAP["groups"] = GroupTransformer
+        try:
+            asyncio.run(process_users(self.input_dir, self.output_dir))
+        finally:
+            del ODATA_TRANSFORMER_MAP["groups"]
+        self.assertEqual(read_output(self.output_dir), [[{"group": "g0"}]])
+        with open(os.path.join(self.output_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["files"]["g.json"]["transformer"], "GroupTransformer")
+
+    def test_transformers_with_their_own_init(self):
+        with open(os.path.join(self.input_dir, "g.json"), "w", encoding="utf-8") as f:
+            json.dump({"@odata.context": "https://graph.microsoft.com/beta/$metadata#groups", "value": [{"id": "g0"}]}, f)
+        ODATA_TRANSFORMER_MAP["groups"] = PrefixedGroupTransformer
+        try:
+            for executor in ("inline", "thread"):
+                with self.subTest(executor=executor):
+                    errors = asyncio.run(process_users(self.input_dir, self.output_dir, external_ids="uuid5",
+                                                       executor=executor, incremental=False))
+                    self.assertEqual(errors, [])
+                    self.assertEqual(read_output(self.output_dir),
+                                     [[{"group": "group-g0", "external_id": get_external_id_strategy("uuid5")({"id": "g0"})}]])
+        finally:
+            del ODATA_TRANSFORMER_MAP["groups"]
+
+    def test_rerun_after_failure_resumes_with_failed_file(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(10)])
+        with open(os.path.join(self.input_dir, "b.json"), "w", encoding="utf-8") as f:
+            f.write('{"value": [{"id": ')
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10))
+        self.assertEqual(batch_files(self.output_dir), ["users_000.json"])
+
+        write_users_file(os.path.join(self.input_dir, "b.json"), [{"id": f"b{i}"} for i in range(5)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10))
+        ids = [user["Id"] for batch in read_output(self.output_dir) for user in batch]
+        self.assertEqual(ids, [f"a{i}" for i in range(10)] + [f"b{i}" for i in range(5)])
+
+    def test_full_rerun_replaces_previous_batches(self):
+        write_users_file(os.path.join(self.input_dir, "a.json"), [{"id": f"a{i}"} for i in range(25)])
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=10))
+        asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=20, incremental=False))
+        self.assertEqual([len(batch) for batch in read_output(self.output_dir)], [20, 5])
+
+if __name__ == "__main__":
+    unittest.main()
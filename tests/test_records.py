@@ -0,0 +1,108 @@
+import os
+import shutil
+import unittest
+import asyncio
+from unittest import mock
+from main import process_users
+from encoders import get_encoder
+from executors import transform_and_encode
+from io_utils import ODataStream
+from sinks import JsonArraySink
+from transformer import UserTransformer
+from records import msgspec
+from sharding import decode_value_blocks
+from helpers import write_users_file
+
+USERS = [
+    {"id": "1", "external_id": "ext-1", "mail": "a@example.com", "givenName": "Ünïcode", "mobilePhone": "123",
+     "otherMails": ["b@example.com"], "signInActivity": {"lastSignInDateTime": "t", "lastSignInRequestId": "r"}},
+    {"id": "2", "external_id": None, "accountEnabled": False, "signInActivity": {}},
+    {"id": "3", "signInActivity": {"lastSuccessfulSignInDateTime": None}},
+    {"id": "4", "userType": "Guest", "signInActivity": None},
+    {"id": "5", "signInActivity": {"unknownSignInField": "x"}},
+]
+
+@unittest.skipIf(msgspec is None, "msgspec is not installed")
+class TestTypedEngine(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_records_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(os.path.join(self.test_dir, "input"))
+        self.path = os.path.join(self.test_dir, "input", "users.json")
+        write_users_file(self.path, USERS)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_typed_engine_matches_record_engine(self):
+        transformer = UserTransformer(external_ids="uuid5")
+        for indent in (None, 2):
+            with self.subTest(indent=indent):
+                sink = JsonArraySink(get_encoder("json", indent))
+                typed = transform_and_encode(transformer, USERS, sink, "typed")
+                self.assertEqual(typed, transform_and_encode(transformer, USERS, sink, "record"))
+
+    def test_sign_in_activity_with_unread_fields_is_kept(self):
+        transformer = UserTransformer()
+        encoded = transform_and_encode(transformer, USERS, JsonArraySink(get_encoder("json")), "typed")
+        self.assertEqual([b'"signInActivity":null' in user for user in encoded], [False, True, False, True, False])
+
+    def test_bulk_parser_decodes_only_used_fields(self):
+        async def run():
+            async with ODataStream(self.path, parser="bulk") as stream:
+                await stream.read_context()
+                return [user async for user in stream.users(UserTransformer.record_model)]
+        users = asyncio.run(run())
+        self.assertEqual(type(users[0]).__name__, "GraphUser")
+        self.assertFalse(hasattr(users[0], "mobilePhone"))
+        self.assertFalse(hasattr(users[0], "otherMails"))
+        # Records still answer get() like the dicts transformers are written for
+        self.assertEqual([user.get("id") for user in users], ["1", "2", "3", "4", "5"])
+        self.assertEqual(users[1].get("external_id", "missing"), None)
+        self.assertEqual(users[2].get("external_id", "missing"), "missing")
+
+    def test_streamed_files_are_decoded_into_records(self):
+        async def run():
+            async with ODataStream(self.path, parser="yajl2_c") as stream:
+                await stream.read_context()
+                self.assertTrue(stream.decodes_records())
+                return [user async for user in stream.users(UserTransformer.record_model)]
+        users = asyncio.run(run())
+        self.assertEqual({type(user).__name__ for user in users}, {"GraphUser"})
+        self.assertEqual([user.id for user in users], ["1", "2", "3", "4", "5"])
+
+    def test_value_blocks_split_users_across_blocks(self):
+        decode = UserTransformer.record_model.array_decoder()
+        with open(self.path, "rb") as f:
+            blocks = list(decode_value_blocks(f, decode, block_size=64))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual([user.id for block in blocks for user in block], ["1", "2", "3", "4", "5"])
+        self.assertEqual(blocks[0][0].signInActivity, {"lastSignInDateTime": "t", "lastSignInRequestId": "r"})
+
+    def test_streamed_files_fall_back_to_record_engine_without_numpy(self):
+        input_dir = os.path.dirname(self.path)
+        with mock.patch("sharding.numpy", None), \
+                mock.patch("executors.transform_and_encode", wraps=transform_and_encode) as transform:
+            asyncio.run(process_users(input_dir, os.path.join(self.test_dir, "output"), engine="typed",
+                                      parser="yajl2_c", executor="inline"))
+        self.assertEqual({call.args[3] for call in transform.call_args_list}, {"record"})
+
+    def test_typed_run_matches_record_run(self):
+        input_dir = os.path.dirname(self.path)
+        outputs = {}
+        for engine, parser, executor in (("record", None, "inline"), ("typed", "bulk", "inline"),
+                                         ("typed", "yajl2_c", "thread"), ("typed", "python", "inline"),
+                                         ("typed", "bulk", "process")):
+            output_dir = os.path.join(self.test_dir, f"output_{engine}_{parser}_{executor}")
+            asyncio.run(process_users(input_dir, output_dir, chunk_size=3, engine=engine, parser=parser,
+                                      executor=executor, max_workers=2, external_ids="uuid5"))
+            with open(os.path.join(output_dir, "users_000.json"), "rb") as f:
+                outputs[engine, parser, executor] = f.read()
+        for key, output in outputs.items():
+            with self.subTest(key=key):
+                self.assertEqual(output, outputs["record", None, "inline"])
+
+if __name__ == "__main__":
+    unittest.main()
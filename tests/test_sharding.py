@@ -0,0 +1,98 @@
+import os
+import json
+import shutil
+import unittest
+import asyncio
+from main import process_users
+from sharding import split_value_array, read_shard, value_array_slices
+
+def make_users(count):
+    # Strings with escaped quotes, backslashes and brackets must not be taken for user boundaries
+    return [
+        {"id": f"u{i}", "displayName": 'a\\"}{[' * (i % 3), "mail": "\\" * (i % 4), "otherMails": [{"x": "}"}]}
+        for i in range(count)
+    ]
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_sharding_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(os.path.join(self.test_dir, "input"))
+        self.input_path = os.path.join(self.test_dir, "input", "users.json")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write_input(self, users, indent=None):
+        document = {"@odata.context": "https://graph.microsoft.com/beta/$metadata#users", "value": users}
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=indent)
+
+    def read_ranges(self, ranges):
+        return [user for start, end in ranges for users in read_shard(self.input_path, start, end, 7) for user in users]
+
+    def test_ranges_hold_whole_users_in_order(self):
+        users = make_users(200)
+        self.write_input(users, indent=2)
+        for block_size in (1, 5, 64, 1024 * 1024):
+            with self.subTest(block_size=block_size):
+                ranges = split_value_array(self.input_path, 4, block_size)
+                self.assertEqual(len(ranges), 4)
+                self.assertEqual(self.read_ranges(ranges), users)
+
+    def test_more_shards_than_users(self):
+        users = make_users(3)
+        self.write_input(users)
+        self.assertEqual(self.read_ranges(split_value_array(self.input_path, 10)), users)
+
+    def test_empty_value_array(self):
+        self.write_input([])
+        self.assertEqual(self.read_ranges(split_value_array(self.input_path, 4)), [])
+
+    def test_raw_chunks_hold_chunk_size_users(self):
+        users = make_users(23)
+        self.write_input(users, indent=2)
+        for block_size in (1, 64, 1024 * 1024):
+            with self.subTest(block_size=block_size):
+                with open(self.input_path, "rb") as f:
+                    chunks = list(value_array_slices(f, 5, block_size))
+                self.assertEqual([chunk.users for chunk in chunks], [5, 5, 5, 5, 3])
+                self.assertEqual([user for chunk in chunks for user in json.loads(chunk.data)], users)
+
+    def test_truncated_file_reports_the_open_array(self):
+        self.write_input(make_users(40), indent=2)
+        with open(self.input_path, "rb+") as f:
+            f.truncate(os.path.getsize(self.input_path) // 2)
+        with self.assertRaisesRegex(ValueError, "The 'value' array is not closed"):
+            split_value_array(self.input_path, 4, 64)
+        with open(self.input_path, "rb") as f:
+            with self.assertRaisesRegex(ValueError, "The 'value' array is not closed"):
+                list(value_array_slices(f, 5, 64))
+        errors = asyncio.run(process_users(os.path.dirname(self.input_path), os.path.join(self.test_dir, "output"),
+                                           executor="process", shards=4, shard_min_size=0))
+        self.assertEqual([error for _, error in errors], ["Read error: The 'value' array is not closed"])
+
+    def test_sharded_run_matches_serial_run(self):
+        users = make_users(95)
+        self.write_input(users, indent=2)
+        input_dir = os.path.dirname(self.input_path)
+        outputs = {}
+        for shards, executor in ((1, "thread"), (1, "process"), (4, "inline"), (4, "thread"), (4, "process")):
+            output_dir = os.path.join(self.test_dir, f"output_{shards}_{executor}")
+            asyncio.run(process_users(input_dir, output_dir, chunk_size=10, executor=executor, max_workers=2,
+                                      shards=shards, shard_min_size=0))
+            batches = []
+            for name in sorted(os.listdir(output_dir)):
+                if name.startswith("users_"):
+                    with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+                        batches.append(json.load(f))
+            self.assertFalse(os.path.exists(os.path.join(output_dir, ".staging")))
+            outputs[shards, executor] = [user["Id"] for batch in batches for user in batch]
+        for key, ids in outputs.items():
+            with self.subTest(key=key):
+                self.assertEqual(ids, [user["id"] for user in users])
+
+if __name__ == "__main__":
+    unittest.main()
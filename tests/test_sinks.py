@@ -0,0 +1,114 @@
+import os
+import gzip
+import json
+import shutil
+import unittest
+import asyncio
+from encoders import JsonEncoder
+from io_utils import write_batches
+from main import process_users
+from sinks import CompressedNdjsonSink, NdjsonSink, get_sink, pyarrow, zstandard
+
+USERS = [{"id": str(i), "name": f"User {i}", "signInActivity": {"lastSignIn": {"dateTime": "t"}} if i % 2 else None} for i in range(25)]
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_sink_output"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write(self, sink, batch_size=10):
+        async def user_gen():
+            for user in USERS:
+                yield user
+        asyncio.run(write_batches(self.test_dir, user_gen(), batch_size=batch_size, sink=sink))
+        return sorted(os.listdir(self.test_dir))
+
+    def read_lines(self, data):
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def test_ndjson(self):
+        files = self.write("ndjson")
+        self.assertEqual(files, ["users_000.ndjson", "users_001.ndjson", "users_002.ndjson"])
+        users = []
+        for fname in files:
+            with open(os.path.join(self.test_dir, fname), "rb") as f:
+                users.extend(self.read_lines(f.read()))
+        self.assertEqual(users, USERS)
+
+    def test_ndjson_is_always_compact(self):
+        sink = get_sink("ndjson", JsonEncoder(indent=2))
+        self.assertEqual(sink.render(sink.encode(USERS[:2])).count(b"\n"), 2)
+
+    def test_gzip_ndjson(self):
+        files = self.write("ndjson-gzip", batch_size=100)
+        self.assertEqual(files, ["users_000.ndjson.gz"])
+        with gzip.open(os.path.join(self.test_dir, files[0]), "rb") as f:
+            self.assertEqual(self.read_lines(f.read()), USERS)
+
+    @unittest.skipUnless(zstandard, "zstandard is not installed")
+    def test_zstd_ndjson(self):
+        files = self.write("ndjson-zstd", batch_size=100)
+        self.assertEqual(files, ["users_000.ndjson.zst"])
+        with open(os.path.join(self.test_dir, files[0]), "rb") as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+        self.assertEqual(self.read_lines(data), USERS)
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_row_group_per_batch(self):
+        import pyarrow.parquet
+        files = self.write("parquet")
+        self.assertEqual(files, ["users_000.parquet", "users_001.parquet", "users_002.parquet"])
+        users = []
+        for fname in files:
+            parquet_file = pyarrow.parquet.ParquetFile(os.path.join(self.test_dir, fname))
+            self.assertEqual(parquet_file.metadata.num_row_groups, 1)
+            users.extend(parquet_file.read().to_pylist())
+        self.assertEqual(users, USERS)
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            get_sink("xml")
+        with self.assertRaises(ValueError):
+            CompressedNdjsonSink("lz4")
+
+    def test_empty_batch(self):
+        self.assertEqual(NdjsonSink().render([]), b"")
+
+class TestProcessUsersSinks(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = "test_sink_input"
+        self.output_dir = "test_sink_pipeline_output"
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.makedirs(self.input_dir)
+        with open(os.path.join(self.input_dir, "a.json"), "w", encoding="utf-8") as f:
+            json.dump({"value": [{"id": f"a{i}", "external_id": f"x{i}"} for i in range(25)]}, f)
+
+    def tearDown(self):
+        for path in (self.input_dir, self.output_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_ndjson_gzip_with_large_batches(self):
+        for engine in ("record", "columnar"):
+            with self.subTest(engine=engine):
+                shutil.rmtree(self.output_dir, ignore_errors=True)
+                asyncio.run(process_users(self.input_dir, self.output_dir, chunk_size=4, batch_size=20,
+                                          sink="ndjson-gzip", engine=engine))
+                files = sorted(fname for fname in os.listdir(self.output_dir) if fname.startswith("users_"))
+                self.assertEqual(files, ["users_000.ndjson.gz", "users_001.ndjson.gz"])
+                ids = []
+                for fname in files:
+                    with gzip.open(os.path.join(self.output_dir, fname), "rt", encoding="utf-8") as f:
+                        ids.extend(json.loads(line)["Id"] for line in f)
+                self.assertEqual(ids, [f"a{i}" for i in range(25)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -237,6 +237,18 @@ class TestUserTransformer(unittest.TestCase):
         self.assertNotIn("givenName", result)
         self.assertNotIn("surname", result)
 
+    def test_transform_batch_matches_transform(self):
+        """Given a list of users, transform_batch should return the transform of each user in order"""
+        input_users = [
+            {"id": "1", "external_id": "ext-1", "givenName": "Jane"},
+            {"id": "2", "external_id": "ext-2", "signInActivity": {"lastSignInDateTime": "2023-10-01T12:00:00Z"}},
+            {"id": "3", "external_id": "ext-3"}
+        ]
+
+        result = self.transformer.transform_batch(input_users)
+
+        self.assertEqual(result, [self.transformer.transform(user) for user in input_users])
+
     def test_transform_with_invalid_input(self):
         """Should raise exception for invalid input"""
         transformer = UserTransformer()
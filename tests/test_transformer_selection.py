@@ -1,5 +1,7 @@
 import unittest
 from main import get_transformer_class_from_odata, ODATA_TRANSFORMER_MAP
+from routing import ODataRouter, parse_entity_set, get_transformer
+from transformer import UserTransformer
 
 class DummyTransformer:
     pass
@@ -25,5 +27,64 @@ class TestTransformerSelection(unittest.TestCase):
         transformer_cls = get_transformer_class_from_odata("")
         self.assertIs(transformer_cls, UserTransformer)
 
+class OtherTransformer:
+    pass
+
+class TestODataRouter(unittest.TestCase):
+    def test_parse_entity_set(self):
+        for context, expected in [
+            ("https://graph.microsoft.com/beta/$metadata#users(id,mail,signInActivity)", ("users",)),
+            ("https://graph.microsoft.com/v1.0/$metadata#users/$entity", ("users",)),
+            ("https://graph.microsoft.com/v1.0/$metadata#users/$delta", ("users",)),
+            ("https://graph.microsoft.com/v1.0/$metadata#directory/deletedItems/microsoft.graph.user",
+             ("directory", "deleteditems", "microsoft.graph.user")),
+            ("https://graph.microsoft.com/v1.0/$metadata#groups('a/b')/members", ("groups", "members")),
+            ("https://graph.microsoft.com/v1.0/$metadata#Collection(microsoft.graph.device)", ("microsoft.graph.device",)),
+            ("", ()),
+        ]:
+            with self.subTest(context=context):
+                self.assertEqual(parse_entity_set(context), expected)
+
+    def test_entity_set_paths_are_matched_not_substrings(self):
+        router = ODataRouter({"users": UserTransformer, "directory/deletedItems": OtherTransformer}, default=None)
+        route = lambda fragment: router.route("https://graph.microsoft.com/v1.0/$metadata#" + fragment)
+        self.assertEqual(route("users(id)"), ("users", UserTransformer))
+        self.assertEqual(route("directory/deletedItems/microsoft.graph.user"), ("directory/deletedItems", OtherTransformer))
+        self.assertEqual(route("directory/deletedItems/users"), (None, None))
+        self.assertEqual(route("directory"), (None, None))
+        self.assertEqual(route("deletedItems/users"), (None, None))
+        self.assertEqual(route("groupsusers"), (None, None))
+
+    def test_navigation_properties_need_their_own_registration(self):
+        router = ODataRouter({"users": UserTransformer}, default=DummyTransformer)
+        route = lambda fragment: router.route("https://graph.microsoft.com/v1.0/$metadata#" + fragment)
+        self.assertEqual(route("users('1')/manager"), (None, DummyTransformer))
+        self.assertEqual(route("users('1')/memberOf"), (None, DummyTransformer))
+        router["users/memberOf"] = OtherTransformer
+        self.assertEqual(route("users('1')/memberOf"), ("users/memberOf", OtherTransformer))
+        self.assertEqual(route("users('1')/memberOf/$entity"), ("users/memberOf", OtherTransformer))
+        self.assertEqual(route("users('1')"), ("users", UserTransformer))
+
+    def test_registration_clears_cached_routes(self):
+        router = ODataRouter(default=UserTransformer)
+        context = "https://graph.microsoft.com/v1.0/$metadata#devices"
+        self.assertIs(router.route(context)[1], UserTransformer)
+
+        @router.register("devices")
+        class DeviceTransformer:
+            pass
+
+        self.assertEqual(router.route(context), ("devices", DeviceTransformer))
+        del router["devices"]
+        self.assertIs(router.route(context)[1], UserTransformer)
+        router.register("groups", OtherTransformer, default=True)
+        self.assertEqual(router.route(context), ("groups", OtherTransformer))
+
+    def test_transformers_are_shared(self):
+        transformer = get_transformer(UserTransformer, "uuid5")
+        self.assertIs(get_transformer(UserTransformer, "uuid5"), transformer)
+        self.assertIsNot(get_transformer(UserTransformer), transformer)
+        self.assertEqual(transformer.external_ids.name, "uuid5")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
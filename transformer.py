@@ -1,18 +1,119 @@
 from abc import ABC, abstractmethod
-import uuid
 from datetime import datetime
+from functools import lru_cache
+from field_mapping import Field, Nested, compile_mapping, _MISSING
+from external_ids import get_external_id_strategy
+from lazy_imports import lazy_attribute
+from routing import register_transformer
+
+def _sign_in_mapping(prefix):
+    return {"dateTime": f"{prefix}DateTime", "requestId": f"{prefix}RequestId"}
+
+@lru_cache(maxsize=None)
+def user_field_mapping(external_ids):
+    """
+    Returns UserTransformer expressed as a declarative mapping, generating missing external
+    ids with the given strategy. Cached per strategy so compiled encoders can be reused.
+    """
+    return {
+        "Id": "id",
+        "external_id": Field("external_id", default_from=external_ids),
+        "mail": "mail",
+        "type": "userType",
+        "location": "usageLocation",
+        "is_enabled": "accountEnabled",
+        "first_name": "givenName",
+        "last_name": "surname",
+        "signInActivity": Nested("signInActivity", {
+            "lastSignIn": _sign_in_mapping("lastSignIn"),
+            "lastNonInteractiveSignIn": _sign_in_mapping("lastNonInteractiveSignIn"),
+            "lastSuccessfulSignIn": _sign_in_mapping("lastSuccessfulSignIn"),
+        }),
+    }
+
+# Mapping of UserTransformer with the default random uuid4 external ids
+USER_FIELD_MAPPING = user_field_mapping(get_external_id_strategy())
+
+# Graph fields UserTransformer reads
+USER_INPUT_FIELDS = (
+    "id", "external_id", "mail", "userType", "usageLocation", "accountEnabled", "givenName", "surname",
+) + tuple(
+    f"signInActivity.{prefix}{suffix}"
+    for prefix in ("lastSignIn", "lastNonInteractiveSignIn", "lastSuccessfulSignIn")
+    for suffix in ("DateTime", "RequestId")
+)
 
 class BaseTransformer(ABC):
+    # Optional declarative mapping equivalent to transform(), see field_mapping.compile_mapping.
+    # Transformers that provide one can run on the columnar engine; subclasses that change
+    # transform() must update or reset it.
+    mapping = None
+    # Optional typed record model equivalent to transform(), see records.RecordModel.
+    # Transformers that provide one can run on the typed engine; the same rule applies.
+    record_model = None
+    # Optional input fields transform() reads, as dotted paths. Readers may leave every other
+    # field out of the users they pass in (see parsers.ProjectedItems). A nested object that
+    # only holds undeclared fields keeps one of them with a None value, so it stays truthy.
+    # None passes users in unchanged.
+    input_fields = None
+
+    _external_ids = None
+
+    def __init__(self, external_ids=None):
+        # Instances are shared by every file and worker (see routing.get_transformer), so
+        # transformers must not keep state beyond what __init__ sets up.
+        self.external_ids = external_ids
+
+    @property
+    def external_ids(self):
+        """
+        Strategy for generating external ids of users that have none, see external_ids.py.
+        routing.get_transformer sets it after building the transformer without arguments, so
+        subclasses with their own __init__ need not pass it on; until then it is the default.
+        """
+        if self._external_ids is None:
+            self._external_ids = get_external_id_strategy(None)
+        return self._external_ids
+
+    @external_ids.setter
+    def external_ids(self, external_ids):
+        self._external_ids = get_external_id_strategy(external_ids)
+        self.bind_external_ids(self._external_ids)
+
+    def bind_external_ids(self, external_ids):
+        """Called whenever the external id strategy is set. Override to rebuild state that depends on it."""
+        pass
+
     @abstractmethod
     def transform(self, user):
         """Transform a user record. Must be implemented by subclasses."""
         pass
 
+    def transform_batch(self, users):
+        """Transform a list of user records. Subclasses may override this with a faster batch path."""
+        transform = self.transform
+        return [transform(user) for user in users]
+
+@register_transformer("users", default=True)
 class UserTransformer(BaseTransformer):
+    mapping = USER_FIELD_MAPPING
+    # Imported with msgspec only when the typed engine asks for it
+    record_model = lazy_attribute("records", "USER_RECORD_MODEL")
+    input_fields = USER_INPUT_FIELDS
+
+    def bind_external_ids(self, external_ids):
+        # Subclasses that reset or replace the mapping keep theirs
+        if type(self).mapping is USER_FIELD_MAPPING:
+            self.mapping = user_field_mapping(external_ids)
+
     def transform(self, user):
+        # Only generate an external_id for users that lack one
+        external_id = user.get("external_id", _MISSING)
+        if external_id is _MISSING:
+            external_id = self.external_ids(user)
         return {
             "Id": user.get("id"),
-            "external_id": user.get("external_id", str(uuid.uuid4())),
+            "external_id": external_id,
             "mail": user.get("mail"),
             "type": user.get("userType"),  # Fixed mapping
             "location": user.get("usageLocation"),  # Fixed mapping
@@ -40,4 +141,39 @@ class UserTransformer(BaseTransformer):
                 "dateTime": activity.get("lastSuccessfulSignInDateTime"),
                 "requestId": activity.get("lastSuccessfulSignInRequestId")
             }
-        }
\ No newline at end of file
+        }
+
+class MappingTransformer(BaseTransformer):
+    """
+    Transformer driven by a declarative field mapping (see field_mapping.compile_mapping).
+    Subclasses set `mapping`, which is compiled once per class into a specialized function.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.mapping is not None:
+            cls._compiled = staticmethod(compile_mapping(cls.mapping, f"transform_{cls.__name__}"))
+
+    def transform(self, user):
+        return self._compiled(user)
+
+    def transform_batch(self, users):
+        compiled = self._compiled
+        return [compiled(user) for user in users]
+
+class MappedUserTransformer(MappingTransformer):
+    """
+    Compiled equivalent of UserTransformer, producing the same output from USER_FIELD_MAPPING.
+    Only generates an external_id for users that do not already have one.
+    """
+    mapping = USER_FIELD_MAPPING
+    record_model = lazy_attribute("records", "USER_RECORD_MODEL")
+    input_fields = USER_INPUT_FIELDS
+
+    def bind_external_ids(self, external_ids):
+        if type(self).mapping is USER_FIELD_MAPPING:
+            self.mapping = user_field_mapping(external_ids)
+            self._compiled = _compile_user_mapping(external_ids)
+
+@lru_cache(maxsize=None)
+def _compile_user_mapping(external_ids):
+    return compile_mapping(user_field_mapping(external_ids), "transform_MappedUserTransformer")